@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Teste de carga de ponta a ponta, com todos os serviços externos trocados por
+versões locais:
+
+- OpenAI: fake_openai.py, com latência até o primeiro token e por token;
+- Mercado Pago: fake_mercadopago.py (API) e rajadas de webhooks de pagamento;
+- SMTP: smtp_sink.py, que aceita e descarta as mensagens;
+- Postgres e Redis: os de DATABASE_URL e REDIS_URL (locais, nunca os de
+  produção). O banco precisa ser Postgres, por causa das partições e do
+  SKIP LOCKED da fila; --preparar-banco aplica as migrações antes.
+
+O app sobe no waitress num processo à parte, com WORKERS_EMBUTIDOS threads
+consumindo a fila (gerações, webhooks e e-mails). Usuários virtuais sorteiam
+cenários pelo peso de cada um (landing, conteúdo, login, geração com
+streaming, checkout) e, em paralelo, chegam rajadas de webhooks. No fim sai
+a vazão e os percentis de latência por rota, a geração de ponta a ponta, o
+que chegou a cada serviço falso e como ficou a fila de jobs.
+
+O rate limit é desligado (todos os usuários virtuais têm o mesmo IP); use
+--com-limites para medir com ele.
+
+    DATABASE_URL=postgresql://localhost/treinorun_carga REDIS_URL=redis://localhost:6379/1 \\
+        python benchmarks/bench_carga.py --usuarios 32 --segundos 60 --preparar-banco
+    python benchmarks/bench_carga.py --mix landing=5,geracao=1 --latencia-openai 2 --por-token 0.01
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fake_mercadopago import FakeMercadoPago, enviar_webhooks  # noqa: E402
+from fake_openai import FakeOpenAI  # noqa: E402
+from smtp_sink import SMTPSink  # noqa: E402
+
+MIX_PADRAO = "landing=40,conteudo=25,login=15,geracao=10,pagamento=5"
+ARTIGOS = ["alimentacao", "alongamento", "melhorar-pace", "tenis-corrida"]
+OBJETIVOS = ["Correr 5 km", "Correr 10 km", "Meia maratona", "Reduzir pace de 6:30 para 5:45 min/km"]
+PRAZOS = ["3 semanas", "1 mês", "2 meses", "3 meses", "6 meses"]
+
+
+# ================================================
+# COLETA
+# ================================================
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    # Nearest-rank: o menor valor com pelo menos p% das amostras até ele
+    return ordenados[max(math.ceil(p / 100 * len(ordenados)), 1) - 1]
+
+
+class Coletor:
+    """Latências e status por rota; cada usuário virtual tem o seu, somados no fim"""
+
+    def __init__(self):
+        self.latencias = defaultdict(list)
+        self.status = defaultdict(Counter)
+        self._lock = threading.Lock()
+
+    def registrar(self, rota, status, segundos):
+        with self._lock:
+            self.latencias[rota].append(segundos)
+            self.status[rota][status] += 1
+
+    def juntar(self, outro):
+        for rota, valores in outro.latencias.items():
+            self.latencias[rota].extend(valores)
+        for rota, contagem in outro.status.items():
+            self.status[rota].update(contagem)
+
+
+def requisitar(coletor, sessao, metodo, url, rota, **opcoes):
+    """Faz a requisição e registra a latência em `rota`; None em erro de conexão"""
+    opcoes.setdefault("allow_redirects", False)
+    opcoes.setdefault("timeout", 120)
+    inicio = time.perf_counter()
+    try:
+        resposta = sessao.request(metodo, url, **opcoes)
+        if not opcoes.get("stream"):
+            resposta.content
+    except requests.RequestException:
+        coletor.registrar(rota, "conexão", time.perf_counter() - inicio)
+        return None
+    coletor.registrar(rota, resposta.status_code, time.perf_counter() - inicio)
+    return resposta
+
+
+# ================================================
+# CENÁRIOS
+# ================================================
+
+def entrar(coletor, sessao, base):
+    email = f"carga-{uuid.uuid4().hex[:12]}@exemplo.com"
+    requisitar(coletor, sessao, "POST", f"{base}/login", "POST /login", data={"email": email})
+    return email
+
+
+def cenario_landing(coletor, sessao, base, rng):
+    requisitar(coletor, sessao, "GET", f"{base}/", "GET / (anônimo)")
+
+
+def cenario_conteudo(coletor, sessao, base, rng):
+    if rng.random() < 0.3:
+        requisitar(coletor, sessao, "GET", f"{base}/blog", "GET /blog")
+    else:
+        requisitar(coletor, sessao, "GET", f"{base}/artigos/{rng.choice(ARTIGOS)}", "GET /artigos/<slug>")
+
+
+def cenario_login(coletor, sessao, base, rng):
+    entrar(coletor, sessao, base)
+    requisitar(coletor, sessao, "GET", f"{base}/", "GET / (logado)")
+
+
+def acompanhar_stream(coletor, sessao, base, job_id):
+    """Lê o SSE até o fim; retorna o plano (dict do evento "fim") ou None"""
+    resposta = requisitar(coletor, sessao, "GET", f"{base}/stream/{job_id}", "GET /stream/<job>", stream=True)
+    if resposta is None or resposta.status_code != 200:
+        return None
+
+    evento = None
+    primeiro = None
+    inicio = time.perf_counter()
+    for linha in resposta.iter_lines(decode_unicode=True):
+        if linha.startswith("event: "):
+            evento = linha[7:]
+            if evento == "delta" and primeiro is None:
+                primeiro = time.perf_counter() - inicio
+                coletor.registrar("geração: primeiro trecho", 200, primeiro)
+        elif linha.startswith("data: ") and evento in ("fim", "erro", "aguardar"):
+            resposta.close()
+            return json.loads(linha[6:]) if evento == "fim" else acompanhar_status(coletor, sessao, base, job_id)
+    return None
+
+
+def acompanhar_status(coletor, sessao, base, job_id, limite=120):
+    """Job com o worker: consulta /status como a página de resultado faz"""
+    fim = time.perf_counter() + limite
+    while time.perf_counter() < fim:
+        resposta = requisitar(coletor, sessao, "GET", f"{base}/status/{job_id}", "GET /status/<job>")
+        if resposta is not None and resposta.status_code == 200:
+            dados = resposta.json()
+            if dados.get("status") == "concluido":
+                return dados
+            if dados.get("status") in ("falhou", "nao_encontrado"):
+                return None
+        time.sleep(0.5)
+    return None
+
+
+def cenario_geracao(coletor, sessao, base, rng):
+    inicio = time.perf_counter()
+    email = entrar(coletor, sessao, base)
+    rota = rng.choice(["/generate", "/generatePace"])
+    dados = {
+        "objetivo": rng.choice(OBJETIVOS),
+        "tempo_melhoria": rng.choice(PRAZOS),
+        "nivel": rng.choice(["Iniciante", "Intermediário", "Avançado"]),
+        "dias": str(rng.randint(3, 5)),
+        "tempo": str(rng.choice([30, 45, 60])),
+    }
+    resposta = requisitar(coletor, sessao, "POST", f"{base}{rota}", f"POST {rota}", data=dados)
+    job = re.search(r"job=([\w-]+)", resposta.headers.get("Location", "")) if resposta is not None else None
+    if not job:
+        coletor.registrar("geração completa", "falhou", time.perf_counter() - inicio)
+        return
+
+    requisitar(coletor, sessao, "GET", f"{base}/resultado?job={job.group(1)}", "GET /resultado")
+    plano = acompanhar_stream(coletor, sessao, base, job.group(1))
+    coletor.registrar("geração completa", 200 if plano else "falhou", time.perf_counter() - inicio)
+
+    if plano and rng.random() < 0.3:
+        requisitar(coletor, sessao, "POST", f"{base}/send_plan_email", "POST /send_plan_email",
+                   json={"email": email, "plano_id": plano.get("plano_id")})
+
+
+def cenario_pagamento(coletor, sessao, base, rng):
+    entrar(coletor, sessao, base)
+    requisitar(coletor, sessao, "GET", f"{base}/iniciar_pagamento", "GET /iniciar_pagamento")
+
+
+CENARIOS = {
+    "landing": cenario_landing,
+    "conteudo": cenario_conteudo,
+    "login": cenario_login,
+    "geracao": cenario_geracao,
+    "pagamento": cenario_pagamento,
+}
+
+
+def ler_mix(texto):
+    mix = {}
+    for parte in texto.split(","):
+        nome, _, peso = parte.partition("=")
+        if nome.strip() not in CENARIOS:
+            raise SystemExit(f"Cenário desconhecido: {nome} (use {', '.join(CENARIOS)})")
+        mix[nome.strip()] = float(peso or 1)
+    return mix
+
+
+def usuario_virtual(indice, base, mix, fim, pausa, coletor):
+    rng = random.Random(indice)
+    nomes, pesos = list(mix), list(mix.values())
+    while time.perf_counter() < fim:
+        # Sessão nova a cada cenário, como visitantes diferentes
+        with requests.Session() as sessao:
+            CENARIOS[rng.choices(nomes, pesos)[0]](coletor, sessao, base, rng)
+        if pausa:
+            time.sleep(rng.expovariate(1 / pausa))
+
+
+def rajadas_webhooks(base, fim, intervalo, tamanho, coletor):
+    while time.perf_counter() + intervalo < fim:
+        time.sleep(intervalo)
+        enviar_webhooks(
+            f"{base}/webhook/mercadopago", tamanho,
+            registrar=lambda status, segundos: coletor.registrar("POST /webhook/mercadopago", status, segundos)
+        )
+
+
+# ================================================
+# APP E RELATÓRIO
+# ================================================
+
+def servir(porta, threads, com_limites):
+    """App no waitress, num processo separado dos usuários virtuais"""
+    import logging
+    import run
+    from waitress import serve
+
+    logging.getLogger().setLevel(logging.WARNING)
+    run.app.config["SESSION_COOKIE_SECURE"] = False
+    if not com_limites:
+        run.limiter.enabled = False
+        run.limitador_local.ativo = False
+    serve(run.app, host="127.0.0.1", port=porta, threads=threads, connection_limit=1000)
+
+
+def aguardar_app(base, processo):
+    for _ in range(300):
+        if not processo.is_alive():
+            raise SystemExit("O app não subiu; veja treinorun.log")
+        try:
+            requests.get(f"{base}/erro", timeout=1)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    raise SystemExit("O app não respondeu a tempo")
+
+
+def situacao_fila(inicio_carga):
+    from sqlalchemy import create_engine, text
+
+    engine = create_engine(os.environ["DATABASE_URL"])
+    with engine.connect() as conn:
+        return conn.execute(
+            text("""
+                SELECT tipo, status, COUNT(*) FROM jobs
+                WHERE criado_em >= :inicio
+                GROUP BY tipo, status ORDER BY tipo, status
+            """),
+            {"inicio": inicio_carga}
+        ).all()
+
+
+def imprimir_relatorio(coletor, segundos):
+    print(f"\n{'rota':<32} {'req':>6} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'máx ms':>8} {'5xx':>5} {'429':>5} {'outros':>7}")
+    for rota in sorted(coletor.latencias, key=lambda r: (r.startswith("geração"), r)):
+        valores = coletor.latencias[rota]
+        status = coletor.status[rota]
+        erros = sum(n for s, n in status.items() if isinstance(s, int) and s >= 500)
+        outros = sum(n for s, n in status.items() if not isinstance(s, int))
+        print(
+            f"{rota:<32} {len(valores):>6} {len(valores) / segundos:>7.1f} "
+            f"{percentil(valores, 50) * 1000:>8.1f} {percentil(valores, 95) * 1000:>8.1f} "
+            f"{percentil(valores, 99) * 1000:>8.1f} {max(valores) * 1000:>8.1f} "
+            f"{erros:>5} {status.get(429, 0):>5} {outros:>7}"
+        )
+    total = sum(len(v) for r, v in coletor.latencias.items() if not r.startswith("geração"))
+    print(f"\nTotal: {total} requisições em {segundos:.0f}s ({total / segundos:.1f} req/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga de ponta a ponta com serviços falsos")
+    parser.add_argument("--usuarios", type=int, default=16, help="usuários virtuais simultâneos")
+    parser.add_argument("--segundos", type=float, default=30)
+    parser.add_argument("--mix", default=MIX_PADRAO, help="pesos dos cenários, ex.: landing=5,geracao=1")
+    parser.add_argument("--pausa", type=float, default=0.0, help="pausa média (s) entre cenários de cada usuário")
+    parser.add_argument("--rajada-webhooks", type=int, default=50, help="notificações por rajada (0 desliga)")
+    parser.add_argument("--intervalo-webhooks", type=float, default=10.0)
+    parser.add_argument("--latencia-openai", type=float, default=1.0, help="segundos até o primeiro token")
+    parser.add_argument("--por-token", type=float, default=0.005, help="segundos por token")
+    parser.add_argument("--tokens-por-semana", type=int, default=60, help="tokens da OpenAI por semana de plano")
+    parser.add_argument("--tokens", type=int, default=4096, help="máximo de tokens por resposta da OpenAI")
+    parser.add_argument("--latencia-mp", type=float, default=0.15)
+    parser.add_argument("--taxa-erro-mp", type=float, default=0.0)
+    parser.add_argument("--latencia-smtp", type=float, default=0.05)
+    parser.add_argument("--threads", type=int, default=int(os.getenv("WEB_THREADS", 32)), help="threads do waitress")
+    parser.add_argument("--workers", type=int, default=4, help="WORKERS_EMBUTIDOS do app")
+    parser.add_argument("--porta", type=int, default=8766)
+    parser.add_argument("--com-limites", action="store_true", help="mantém o rate limit ligado")
+    parser.add_argument("--preparar-banco", action="store_true", help="aplica as migrações antes")
+    parser.add_argument("--espera-fila", type=float, default=30, help="segundos esperando a fila esvaziar no fim")
+    args = parser.parse_args()
+
+    if not os.getenv("DATABASE_URL", "").startswith("postgresql"):
+        raise SystemExit("Defina DATABASE_URL com um Postgres local (o app usa partições e SKIP LOCKED)")
+    mix = ler_mix(args.mix)
+
+    with FakeOpenAI(latencia=args.latencia_openai, por_token=args.por_token, tokens=args.tokens,
+                    tokens_por_semana=args.tokens_por_semana) as openai_fake, \
+            FakeMercadoPago(latencia=args.latencia_mp, taxa_erro=args.taxa_erro_mp) as mp_fake, \
+            SMTPSink(latencia=args.latencia_smtp) as smtp_fake:
+        os.environ.update({
+            "OPENAI_BASE_URL": openai_fake.base_url,
+            "OPENAI_API_KEY": "sk-carga",
+            "MERCADO_PAGO_URL": mp_fake.base_url,
+            "MERCADO_PAGO_ACCESS_TOKEN": "TEST-carga",
+            "MAIL_SERVER": "127.0.0.1",
+            "MAIL_PORT": str(smtp_fake.porta),
+            "MAIL_USE_TLS": "0",
+            "ZOHO_EMAIL": "carga@exemplo.com",
+            "WORKERS_EMBUTIDOS": str(args.workers),
+            "WEB_THREADS": str(args.threads),
+        })
+        if args.preparar_banco:
+            subprocess.run([sys.executable, "init_db.py"], cwd=os.path.join(os.path.dirname(__file__), ".."), check=True)
+
+        servidor = multiprocessing.get_context("fork").Process(
+            target=servir, args=(args.porta, args.threads, args.com_limites), daemon=True
+        )
+        servidor.start()
+        base = f"http://127.0.0.1:{args.porta}"
+        aguardar_app(base, servidor)
+
+        print(f"Carga: {args.usuarios} usuário(s) por {args.segundos:.0f}s, mix {mix}, "
+              f"rajadas de {args.rajada_webhooks} webhooks a cada {args.intervalo_webhooks:.0f}s")
+        inicio_carga = time.strftime("%Y-%m-%d %H:%M:%S")
+        fim = time.perf_counter() + args.segundos
+        coletores = [Coletor() for _ in range(args.usuarios + 1)]
+        threads = [
+            threading.Thread(target=usuario_virtual, args=(i, base, mix, fim, args.pausa, coletores[i]))
+            for i in range(args.usuarios)
+        ]
+        if args.rajada_webhooks:
+            threads.append(threading.Thread(
+                target=rajadas_webhooks,
+                args=(base, fim, args.intervalo_webhooks, args.rajada_webhooks, coletores[-1])
+            ))
+        inicio = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        duracao = time.perf_counter() - inicio
+
+        coletor = Coletor()
+        for c in coletores:
+            coletor.juntar(c)
+        imprimir_relatorio(coletor, duracao)
+
+        # Dá tempo aos workers para processar webhooks e e-mails da carga
+        limite = time.perf_counter() + args.espera_fila
+        fila = situacao_fila(inicio_carga)
+        while time.perf_counter() < limite and any(status not in ("concluido", "falhou") for _, status, _ in fila):
+            time.sleep(1)
+            fila = situacao_fila(inicio_carga)
+
+        print("\nServiços falsos:")
+        print(f"  OpenAI: {openai_fake.stats.total} chamada(s), pico de {openai_fake.stats.pico} simultânea(s)")
+        print(f"  Mercado Pago: {mp_fake.stats.requisicoes} requisição(ões), {mp_fake.stats.conexoes} conexão(ões), "
+              f"{mp_fake.stats.erros_simulados} erro(s) simulado(s)")
+        print(f"  SMTP: {smtp_fake.stats.total} mensagem(ns), {smtp_fake.stats.conexoes} conexão(ões)")
+        print("\nJobs criados durante a carga:")
+        for tipo, status, quantidade in fila:
+            print(f"  {tipo:<22} {status:<12} {quantidade:>6}")
+
+        servidor.terminate()
+
+
+if __name__ == "__main__":
+    main()
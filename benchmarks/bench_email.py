@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: envio de e-mails inline (mail.send por requisição) x caixa de saída.
+
+"antes"  -> cada mensagem abre uma sessão SMTP nova dentro da requisição, como
+            send_plan_email e enviar_email_confirmacao_pagamento faziam.
+"depois" -> a requisição só enfileira; o remetente da caixa de saída envia
+            pela mesma conexão persistente, uma mensagem reservada por vez.
+
+Usa o SMTP local de benchmarks/smtp_sink.py, com custo de abertura de sessão
+configurável para imitar o handshake TLS + login do provedor. Precisa de um
+DATABASE_URL Postgres com as migrações aplicadas (python init_db.py).
+
+    python benchmarks/bench_email.py --mensagens 50 --latencia-conexao 0.4
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from smtp_sink import SMTPSink  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mensagens", type=int, default=50)
+    parser.add_argument("--latencia", type=float, default=0.01, help="segundos por mensagem no SMTP")
+    parser.add_argument("--latencia-conexao", type=float, default=0.4, help="segundos para abrir a sessão SMTP")
+    args = parser.parse_args()
+
+    with SMTPSink(latencia=args.latencia, latencia_conexao=args.latencia_conexao) as sink:
+        os.environ.update(MAIL_SERVER="127.0.0.1", MAIL_PORT=str(sink.porta), MAIL_USE_TLS="0")
+        os.environ.setdefault("ZOHO_EMAIL", "benchmark@treinorun.com.br")
+        os.environ["EMAIL_POR_MINUTO"] = "0"
+
+        import run
+        from flask_mail import Message
+
+        html = "<p>benchmark</p>"
+
+        with run.app.app_context():
+            inicio = time.perf_counter()
+            for i in range(args.mensagens):
+                run.mail.send(Message(subject="antes", recipients=[f"a{i}@x.com"], html=html))
+            duracao = time.perf_counter() - inicio
+        print(
+            f"antes   tempo por requisição={duracao / args.mensagens * 1000:7.1f}ms  "
+            f"total={duracao:6.2f}s  conexões SMTP={sink.stats.conexoes}"
+        )
+
+        conexoes_antes = sink.stats.conexoes
+        inicio = time.perf_counter()
+        for i in range(args.mensagens):
+            run.caixa_saida.enfileirar("depois", [f"d{i}@x.com"], html)
+        enfileirado = time.perf_counter() - inicio
+
+        parar = run.caixa_saida.iniciar()
+        while sink.stats.total < 2 * args.mensagens:
+            time.sleep(0.01)
+        duracao = time.perf_counter() - inicio
+        parar.set()
+        print(
+            f"depois  tempo por requisição={enfileirado / args.mensagens * 1000:7.1f}ms  "
+            f"total={duracao:6.2f}s  conexões SMTP={sink.stats.conexoes - conexoes_antes}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: plano longo numa única chamada x em blocos de periodização em paralelo.
+
+O servidor OpenAI falso responde com `--tokens-por-semana` tokens para cada
+semana pedida, a `--por-token` segundos por token, como um modelo real cujo
+tempo cresce com o tamanho da resposta. Para cada duração de plano mede o
+tempo total, o tempo até o primeiro trecho (streaming), os tokens gerados e
+quantas semanas chegaram ao plano final.
+
+    python benchmarks/bench_geracao_blocos.py --semanas 12 24 52 --por-token 0.002
+"""
+
+import argparse
+import asyncio
+import os
+import queue
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fake_openai import FakeOpenAI  # noqa: E402
+from geracao_blocos import separar_semanas  # noqa: E402
+
+DADOS = {
+    "objetivo": "Meia maratona",
+    "tempo_melhoria": "12 meses",
+    "nivel": "intermediário",
+    "dias": "4",
+    "tempo": "60",
+}
+
+
+def medir(run, semanas, streaming):
+    prompt = run.montar_prompt("corrida", DADOS, semanas)
+    preparo = run.preparar_geracao(prompt, semanas, DADOS, "corrida")
+
+    deltas = queue.Queue() if streaming else None
+    inicio = time.perf_counter()
+    futuro = asyncio.run_coroutine_threadsafe(run.gerar_plano(preparo, deltas), run.obter_loop())
+    primeiro = None
+    if streaming:
+        futuro.add_done_callback(lambda _: deltas.put(None))
+        while deltas.get() is not None:
+            if primeiro is None:
+                primeiro = time.perf_counter() - inicio
+    plano, uso = futuro.result()
+    total = time.perf_counter() - inicio
+
+    _, semanas_plano = separar_semanas(plano)
+    presentes = sum(1 for n in range(1, semanas + 1) if n in semanas_plano)
+    blocos = len(preparo[0]) if preparo[0] else 1
+    return total, primeiro, blocos, uso["tokens_completion"], presentes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--semanas", type=int, nargs="+", default=[12, 24, 52])
+    parser.add_argument("--latencia", type=float, default=0.5, help="segundos até o primeiro token")
+    parser.add_argument("--por-token", type=float, default=0.002, help="segundos por token gerado")
+    parser.add_argument("--tokens-por-semana", type=int, default=150)
+    parser.add_argument("--max-semanas-bloco", type=int, default=8)
+    parser.add_argument("--stream", action="store_true", help="mede também o tempo até o primeiro trecho")
+    args = parser.parse_args()
+
+    with FakeOpenAI(latencia=args.latencia, por_token=args.por_token, tokens=100000,
+                    tokens_por_semana=args.tokens_por_semana) as fake:
+        os.environ["OPENAI_BASE_URL"] = fake.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+        os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.gettempdir(), "bench_treinorun.db"))
+        os.environ["ORCAMENTO_TOKENS_DIA"] = "0"
+
+        import run
+        run.GERACAO_BLOCOS_MAX_SEMANAS = args.max_semanas_bloco
+
+        print(f"{'semanas':>7} {'modo':<7} {'blocos':>6} {'total':>8} {'1º trecho':>9} "
+              f"{'tokens':>7} {'semanas no plano':>16} {'pico upstream':>13}")
+        for semanas in args.semanas:
+            for modo, minimo in (("único", 0), ("blocos", 1)):
+                run.GERACAO_BLOCOS_MIN_SEMANAS = minimo
+                fake.stats.zerar()
+                total, primeiro, blocos, tokens, presentes = medir(run, semanas, args.stream)
+                print(
+                    f"{semanas:>7} {modo:<7} {blocos:>6} {total:>7.2f}s "
+                    f"{(f'{primeiro:.2f}s' if primeiro is not None else '-'):>9} "
+                    f"{tokens:>7} {f'{presentes}/{semanas}':>16} {fake.stats.pico:>13}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: custo por geração com o cliente e o loop compartilhados.
+
+"antes"  -> reproduz o caminho antigo: cada requisição cria um event loop novo e
+            chama o cliente síncrono da OpenAI.
+"depois" -> o caminho do worker no run.py: preparar_geracao na thread e
+            executar_no_loop(gerar_plano(...)) no loop compartilhado, com o
+            cliente assíncrono.
+
+Os dois lados rodam com o mesmo número de threads. Como executar_no_loop
+também segura a thread até a resposta chegar, o número de gerações
+simultâneas continua limitado pelas threads nos dois casos; a diferença
+fica no custo por chamada (loop e conexões reaproveitados). Um servidor
+OpenAI falso (benchmarks/fake_openai.py) mede quantas chamadas estiveram em
+andamento ao mesmo tempo.
+
+O que tira as gerações das threads web é a fila: /generate só enfileira e
+o worker.py gera. O efeito nas rotas leves sob gerações simultâneas é medido
+por benchmarks/bench_carga.py.
+
+    python benchmarks/bench_geracao_concorrente.py --requisicoes 64 --latencia 2 --threads 8
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fake_openai import FakeOpenAI  # noqa: E402
+
+DADOS = {
+    "objetivo": "10 km",
+    "tempo_melhoria": "1 mês",
+    "nivel": "iniciante",
+    "dias": "3",
+    "tempo": "45",
+}
+
+
+def rodar(nome, threads, requisicoes, func, fake):
+    fake.stats.zerar()
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        resultados = list(pool.map(lambda _: func(), range(requisicoes)))
+    duracao = time.perf_counter() - inicio
+    erros = sum(1 for r in resultados if r.startswith("Erro"))
+    print(
+        f"{nome:<8} threads={threads:<3} requisições={requisicoes:<4} "
+        f"tempo={duracao:6.2f}s  pico simultâneo no upstream={fake.stats.pico:<3} "
+        f"vazão={requisicoes / duracao:6.2f} ger/s  erros={erros}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requisicoes", type=int, default=64)
+    parser.add_argument("--latencia", type=float, default=2.0)
+    parser.add_argument("--threads", type=int, default=int(os.getenv("WEB_THREADS", 8)))
+    args = parser.parse_args()
+
+    with FakeOpenAI(latencia=args.latencia, tokens=200) as fake:
+        os.environ["OPENAI_BASE_URL"] = fake.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+        os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.gettempdir(), "bench_treinorun.db"))
+        os.environ["ORCAMENTO_TOKENS_DIA"] = "0"
+
+        import run
+        semanas = run.calcular_semanas(DADOS["tempo_melhoria"])
+        prompt = run.montar_prompt("corrida", DADOS, semanas)
+        from openai import OpenAI
+
+        def geracao_antiga():
+            # Caminho anterior: loop novo por requisição + cliente síncrono
+            cliente = OpenAI(api_key="sk-benchmark", base_url=fake.base_url, timeout=30.0)
+
+            async def chamar():
+                resposta = cliente.chat.completions.create(
+                    model="gpt-3.5-turbo",
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=0.7,
+                )
+                return resposta.choices[0].message.content.strip()
+
+            loop = asyncio.new_event_loop()
+            try:
+                return loop.run_until_complete(chamar())
+            finally:
+                loop.close()
+
+        def geracao_nova():
+            preparo = run.preparar_geracao(prompt, semanas, DADOS, "corrida")
+            texto, _ = run.executar_no_loop(run.gerar_plano(preparo))
+            return texto
+
+        rodar("antes", args.threads, args.requisicoes, geracao_antiga, fake)
+        rodar("depois", args.threads, args.requisicoes, geracao_nova, fake)
+
+
+if __name__ == "__main__":
+    main()
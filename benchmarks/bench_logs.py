@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: gravação de logs_webhook linha a linha x GravadorEmLotes.
+
+"antes"  -> um INSERT + COMMIT por linha na thread da requisição, como o
+            registrar_log antigo.
+"depois" -> GravadorEmLotes: a requisição só enfileira e a gravação sai em
+            INSERTs de várias linhas numa thread em segundo plano.
+
+Precisa de um DATABASE_URL Postgres com as migrações aplicadas; as linhas de
+teste são apagadas no final.
+
+    python benchmarks/bench_logs.py --linhas 5000 --threads 16
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from gravador_lotes import GravadorEmLotes  # noqa: E402
+
+PAYLOAD = json.dumps({"type": "payment", "data": {"id": "123456789"}, "live_mode": True, "action": "payment.updated"})
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--linhas", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=16)
+    args = parser.parse_args()
+
+    engine = create_engine(os.getenv("DATABASE_URL"), pool_size=args.threads, max_overflow=0)
+
+    def antes(_):
+        inicio = time.perf_counter()
+        with engine.begin() as conn:
+            conn.execute(
+                text("""
+                    INSERT INTO logs_webhook (data_recebimento, payload, status_processamento, mensagem_erro)
+                    VALUES (NOW(), :payload, 'bench_antes', NULL)
+                """),
+                {"payload": PAYLOAD}
+            )
+        return time.perf_counter() - inicio
+
+    gravador = GravadorEmLotes(
+        engine, "logs_webhook", ["data_recebimento", "payload", "status_processamento", "mensagem_erro"]
+    )
+
+    def depois(_):
+        inicio = time.perf_counter()
+        gravador.registrar(
+            data_recebimento=datetime.now(), payload=PAYLOAD,
+            status_processamento="bench_depois", mensagem_erro=None
+        )
+        return time.perf_counter() - inicio
+
+    try:
+        for nome, func in (("antes", antes), ("depois", depois)):
+            inicio = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.threads) as pool:
+                tempos = sorted(pool.map(func, range(args.linhas)))
+            if nome == "depois":
+                gravador.descarregar()
+                while gravador.gravadas < args.linhas and gravador.perdidas == 0:
+                    time.sleep(0.01)
+            duracao = time.perf_counter() - inicio
+            print(
+                f"{nome:<7} tempo na requisição p50={tempos[len(tempos) // 2] * 1000:6.2f}ms "
+                f"p99={tempos[int(len(tempos) * 0.99)] * 1000:6.2f}ms  "
+                f"total={duracao:5.2f}s  vazão={args.linhas / duracao:8.0f} linhas/s"
+                + (f"  lotes={gravador.lotes}" if nome == "depois" else "")
+            )
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM logs_webhook WHERE status_processamento IN ('bench_antes', 'bench_depois')"))
+
+
+if __name__ == "__main__":
+    main()
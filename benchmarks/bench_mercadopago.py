@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: criação de preferência de checkout com requests.post avulso x
+ClienteMercadoPago (pool keep-alive, novas tentativas, disjuntor).
+
+"antes"  -> requests.post por chamada, como iniciar_pagamento fazia: conexão
+            nova a cada vez e qualquer 5xx/429 vira erro para o usuário.
+"depois" -> cliente compartilhado de cliente_mercadopago.py.
+
+O gateway é o servidor falso de benchmarks/fake_mercadopago.py, com custo de
+conexão (imitando o handshake TLS) e uma taxa de respostas 500/429.
+
+    python benchmarks/bench_mercadopago.py --chamadas 200 --taxa-erro 0.1
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from cliente_mercadopago import ClienteMercadoPago  # noqa: E402
+from fake_mercadopago import FakeMercadoPago  # noqa: E402
+
+PREFERENCIA = {
+    "items": [{"title": "Plano Anual TreinoRun", "quantity": 1, "unit_price": 59.90, "currency_id": "BRL"}],
+    "payer": {"email": "benchmark@treinorun.com.br"},
+    "external_reference": "benchmark@treinorun.com.br",
+}
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(p / 100 * len(valores)))]
+
+
+def rodar(nome, chamadas, threads, func, fake):
+    fake.stats.zerar()
+    latencias, erros = [], 0
+
+    def uma(_):
+        inicio = time.perf_counter()
+        try:
+            func()
+            return time.perf_counter() - inicio, False
+        except requests.exceptions.RequestException:
+            return time.perf_counter() - inicio, True
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for duracao, erro in pool.map(uma, range(chamadas)):
+            latencias.append(duracao)
+            erros += erro
+
+    print(
+        f"{nome:<7} p50={statistics.median(latencias) * 1000:6.0f}ms "
+        f"p95={percentil(latencias, 95) * 1000:6.0f}ms "
+        f"erros para o usuário={erros:<4} conexões abertas={fake.stats.conexoes:<4} "
+        f"requisições no gateway={fake.stats.requisicoes}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chamadas", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--latencia", type=float, default=0.08)
+    parser.add_argument("--latencia-conexao", type=float, default=0.15)
+    parser.add_argument("--taxa-erro", type=float, default=0.1)
+    args = parser.parse_args()
+
+    with FakeMercadoPago(latencia=args.latencia, latencia_conexao=args.latencia_conexao,
+                         taxa_erro=args.taxa_erro) as fake:
+
+        def antes():
+            resposta = requests.post(
+                f"{fake.base_url}/checkout/preferences",
+                headers={"Authorization": "Bearer teste", "Content-Type": "application/json"},
+                json=PREFERENCIA,
+                timeout=10
+            )
+            resposta.raise_for_status()
+            return resposta.json()["init_point"]
+
+        cliente = ClienteMercadoPago("teste", base_url=fake.base_url, pool=args.threads, backoff_base=0.05)
+
+        rodar("antes", args.chamadas, args.threads, antes, fake)
+        rodar("depois", args.chamadas, args.threads, lambda: cliente.criar_preferencia(PREFERENCIA), fake)
+        print(f"histograma do cliente: {cliente.estatisticas()['latencias']['criar_preferencia']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: requisições/s em /artigos/alimentacao antes e depois do cache de respostas.
+
+"antes"  -> rota com o código antigo: lê a sessão e renderiza o template a
+            cada requisição, sem compressão nem cabeçalhos de cache.
+"depois" -> /artigos/alimentacao atual, servida do CacheRespostas (gzip).
+"304"    -> a mesma rota com If-None-Match, como faz um navegador ou CDN
+            revalidando o que já tem.
+
+Por padrão o app roda no waitress num processo à parte, numa porta local.
+Com --wsgi as requisições vão direto ao app pelo cliente de teste do Flask,
+medindo só o custo do servidor (útil em máquinas com poucos núcleos, onde
+os clientes HTTP disputam a CPU com o servidor). O rate limit é desligado.
+
+    python benchmarks/bench_paginas.py --segundos 5 --clientes 16
+    python benchmarks/bench_paginas.py --wsgi
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+
+def preparar_app():
+    import logging
+    import run
+    from flask import render_template, session
+
+    logging.getLogger().setLevel(logging.WARNING)
+    run.limiter.enabled = False
+    run.limitador_local.ativo = False
+
+    @run.app.route("/bench/artigo-antigo")
+    def artigo_antigo():
+        return render_template(
+            "artigos/artigo-alimentacao.html",
+            email=session.get("email"),
+            plano=session.get("plano", "gratuito"),
+            assinatura_ativa=session.get("assinatura_ativa", False)
+        )
+
+    return run.app
+
+
+def servir(porta, threads):
+    """App no waitress, num processo separado dos clientes"""
+    from waitress import serve
+    serve(preparar_app(), host="127.0.0.1", port=porta, threads=threads)
+
+
+def medir_wsgi(cliente, url, segundos, cabecalhos):
+    total = bytes_recebidos = 0
+    fim = time.perf_counter() + segundos
+    while time.perf_counter() < fim:
+        bytes_recebidos += len(cliente.get(url, headers=cabecalhos).data)
+        total += 1
+    return total / segundos, bytes_recebidos / max(total, 1)
+
+
+def medir(url, clientes, segundos, cabecalhos):
+    contagem = [0] * clientes
+    bytes_recebidos = [0] * clientes
+    fim = time.perf_counter() + segundos
+
+    def cliente(i):
+        with requests.Session() as sessao:
+            while time.perf_counter() < fim:
+                # stream=True para contar os bytes como vieram pela rede
+                resposta = sessao.get(url, headers=cabecalhos, stream=True)
+                bytes_recebidos[i] += len(resposta.raw.read())
+                contagem[i] += 1
+
+    threads = [threading.Thread(target=cliente, args=(i,)) for i in range(clientes)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    total = sum(contagem)
+    return total / segundos, sum(bytes_recebidos) / max(total, 1)
+
+
+def cenarios(etag, base):
+    return [
+        ("antes", f"{base}/bench/artigo-antigo", {"Accept-Encoding": "gzip"}),
+        ("depois", f"{base}/artigos/alimentacao", {"Accept-Encoding": "gzip"}),
+        ("304", f"{base}/artigos/alimentacao", {"Accept-Encoding": "gzip", "If-None-Match": etag}),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--segundos", type=float, default=5)
+    parser.add_argument("--clientes", type=int, default=16)
+    parser.add_argument("--porta", type=int, default=8765)
+    parser.add_argument("--wsgi", action="store_true")
+    args = parser.parse_args()
+
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.gettempdir(), "bench_treinorun.db"))
+
+    if args.wsgi:
+        cliente = preparar_app().test_client()
+        etag = cliente.get("/artigos/alimentacao", headers={"Accept-Encoding": "gzip"}).headers["ETag"]
+        for nome, url, cabecalhos in cenarios(etag, ""):
+            vazao, tamanho = medir_wsgi(cliente, url, args.segundos, cabecalhos)
+            print(f"{nome:<7} {vazao:8.0f} req/s  {tamanho / 1024:6.1f} KB/resposta")
+        return
+
+    servidor = multiprocessing.get_context("fork").Process(
+        target=servir, args=(args.porta, args.clientes), daemon=True
+    )
+    servidor.start()
+    base = f"http://127.0.0.1:{args.porta}"
+    for _ in range(100):
+        try:
+            requests.get(f"{base}/erro", timeout=1)
+            break
+        except requests.ConnectionError:
+            time.sleep(0.1)
+
+    etag = requests.get(f"{base}/artigos/alimentacao", headers={"Accept-Encoding": "gzip"}).headers["ETag"]
+    for nome, url, cabecalhos in cenarios(etag, base):
+        vazao, tamanho = medir(url, args.clientes, args.segundos, cabecalhos)
+        print(f"{nome:<7} {vazao:8.0f} req/s  {tamanho / 1024:6.1f} KB/resposta")
+
+    servidor.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: custo do rate limit por requisição, moving-window no Redis x limite local.
+
+"antes"  -> rota com @limiter.limit (Flask-Limiter, moving-window no Redis),
+            como todas as páginas tinham.
+"depois" -> rota com @limite_local (token bucket na memória, consumo enviado
+            ao Redis em lote pela thread de sincronização).
+
+Mede a latência da requisição (cliente de teste do Flask, sem rede) e quantos
+comandos o Redis processou por requisição, incluindo as sincronizações.
+
+    REDIS_URL=redis://localhost:6379/0 python benchmarks/bench_rate_limit.py --requisicoes 5000
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requisicoes", type=int, default=5000)
+    args = parser.parse_args()
+
+    if not os.getenv("REDIS_URL"):
+        sys.exit("Defina REDIS_URL: o objetivo é medir as idas ao Redis")
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.gettempdir(), "bench_treinorun.db"))
+
+    import run
+
+    logging.getLogger().setLevel(logging.WARNING)
+    limite = f"{args.requisicoes * 10} per hour"
+
+    @run.app.route("/bench/limite-redis")
+    @run.limiter.limit(limite)
+    def limite_redis():
+        return "ok"
+
+    @run.app.route("/bench/limite-local")
+    @run.limite_local(limite)
+    def limite_local():
+        return "ok"
+
+    cliente = run.app.test_client()
+
+    def comandos():
+        return run.redis_client.info("stats")["total_commands_processed"]
+
+    for nome, url in (("antes", "/bench/limite-redis"), ("depois", "/bench/limite-local")):
+        antes = comandos()
+        tempos = []
+        inicio = time.perf_counter()
+        for _ in range(args.requisicoes):
+            t = time.perf_counter()
+            cliente.get(url)
+            tempos.append(time.perf_counter() - t)
+        run.limitador_local.sincronizar()
+        duracao = time.perf_counter() - inicio
+        tempos.sort()
+        # -1: o próprio INFO
+        por_requisicao = (comandos() - antes - 1) / args.requisicoes
+        print(
+            f"{nome:<7} p50={tempos[len(tempos) // 2] * 1000:5.2f}ms p99={tempos[int(len(tempos) * 0.99)] * 1000:5.2f}ms "
+            f"vazão={args.requisicoes / duracao:6.0f} req/s  comandos Redis/req={por_requisicao:5.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
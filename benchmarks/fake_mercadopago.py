@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Servidor local que imita os endpoints do Mercado Pago usados pela aplicação:
+POST /checkout/preferences, GET /v1/payments/<id> e GET /preapproval/<id>.
+
+Usado pelos benchmarks sem falar com a API real. Simula o custo de abrir uma
+conexão (o handshake TLS do gateway de verdade), latência por requisição e
+instabilidade: uma fração das respostas volta 500/429.
+
+enviar_webhooks faz o outro lado: manda rajadas de notificações de
+pagamento para /webhook/mercadopago, como o Mercado Pago depois de um pico
+de vendas; os ids enviados são os que o GET /v1/payments/<id> aprova.
+
+Uso isolado:
+    python benchmarks/fake_mercadopago.py --porta 8901 --latencia 0.1 --taxa-erro 0.2
+    MERCADO_PAGO_URL=http://127.0.0.1:8901 python run.py
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+
+class EstatisticasFake:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.conexoes = 0
+        self.requisicoes = 0
+        self.erros_simulados = 0
+        self.chaves_idempotencia = set()
+
+    def contar(self, campo):
+        with self._lock:
+            setattr(self, campo, getattr(self, campo) + 1)
+
+    def zerar(self):
+        with self._lock:
+            self.conexoes = self.requisicoes = self.erros_simulados = 0
+            self.chaves_idempotencia = set()
+
+
+def criar_handler(config, stats):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def setup(self):
+            super().setup()
+            stats.contar("conexoes")
+            time.sleep(config.latencia_conexao)
+
+        def _json(self, status, dados, headers=None):
+            corpo = json.dumps(dados).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(corpo)))
+            for nome, valor in (headers or {}).items():
+                self.send_header(nome, valor)
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def _instavel(self):
+            """Devolve True (e responde) quando a requisição deve falhar"""
+            stats.contar("requisicoes")
+            time.sleep(config.latencia)
+            if random.random() < config.taxa_erro:
+                stats.contar("erros_simulados")
+                if random.random() < 0.2:
+                    self._json(429, {"message": "too_many_requests"}, {"Retry-After": "0"})
+                else:
+                    self._json(500, {"message": "internal_error"})
+                return True
+            return False
+
+        def do_POST(self):
+            tamanho = int(self.headers.get("Content-Length", 0))
+            corpo = json.loads(self.rfile.read(tamanho) or b"{}")
+            if self.path.rstrip("/") != "/checkout/preferences":
+                self._json(404, {"message": "not_found"})
+                return
+            if self._instavel():
+                return
+
+            chave = self.headers.get("X-Idempotency-Key")
+            if chave:
+                with stats._lock:
+                    stats.chaves_idempotencia.add(chave)
+            id_preferencia = f"pref-{uuid.uuid4().hex[:12]}"
+            self._json(201, {
+                "id": id_preferencia,
+                "init_point": f"https://www.mercadopago.com.br/checkout/v1/redirect?pref_id={id_preferencia}",
+                "external_reference": corpo.get("external_reference"),
+            })
+
+        def do_GET(self):
+            pagamento = re.match(r"^/v1/payments/([\w-]+)$", self.path)
+            assinatura = re.match(r"^/preapproval/([\w-]+)$", self.path)
+            if not (pagamento or assinatura):
+                self._json(404, {"message": "not_found"})
+                return
+            if self._instavel():
+                return
+
+            if pagamento:
+                self._json(200, {
+                    "id": pagamento.group(1),
+                    "status": "approved",
+                    "payer": {"email": f"pagador-{pagamento.group(1)}@exemplo.com"},
+                })
+            else:
+                self._json(200, {
+                    "id": assinatura.group(1),
+                    "status": "authorized",
+                    "payer_email": f"assinante-{assinatura.group(1)}@exemplo.com",
+                })
+
+    return Handler
+
+
+class FakeMercadoPago:
+    """Sobe o servidor falso numa thread; use como context manager nos benchmarks"""
+
+    def __init__(self, porta=0, latencia=0.1, latencia_conexao=0.0, taxa_erro=0.0):
+        self.config = argparse.Namespace(
+            latencia=latencia, latencia_conexao=latencia_conexao, taxa_erro=taxa_erro
+        )
+        self.stats = EstatisticasFake()
+        self.servidor = ThreadingHTTPServer(("127.0.0.1", porta), criar_handler(self.config, self.stats))
+        self.servidor.daemon_threads = True
+        self.servidor.request_queue_size = 1024
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.servidor.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+
+def notificacao_pagamento(id_pagamento=None):
+    """Corpo de uma notificação de pagamento no formato do Mercado Pago"""
+    id_pagamento = id_pagamento or str(random.randint(10**9, 10**10))
+    return {
+        "id": random.randint(10**9, 10**10),
+        # live_mode False faria o app tratar como teste, sem consultar a API
+        "live_mode": True,
+        "type": "payment",
+        "action": "payment.updated",
+        "date_created": time.strftime("%Y-%m-%dT%H:%M:%S.000-03:00"),
+        "data": {"id": id_pagamento},
+    }
+
+
+def enviar_webhooks(url, quantidade, concorrencia=16, registrar=None):
+    """Envia `quantidade` notificações ao mesmo tempo; registrar(status, segundos) para cada uma"""
+    def enviar(_):
+        inicio = time.perf_counter()
+        try:
+            status = requests.post(url, json=notificacao_pagamento(), timeout=30).status_code
+        except requests.RequestException:
+            status = None
+        if registrar:
+            registrar(status, time.perf_counter() - inicio)
+        return status
+
+    with ThreadPoolExecutor(max_workers=concorrencia) as pool:
+        return list(pool.map(enviar, range(quantidade)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor Mercado Pago falso para benchmarks")
+    parser.add_argument("--porta", type=int, default=8901)
+    parser.add_argument("--latencia", type=float, default=0.1, help="segundos por requisição")
+    parser.add_argument("--latencia-conexao", type=float, default=0.0, help="segundos para abrir uma conexão")
+    parser.add_argument("--taxa-erro", type=float, default=0.0, help="fração de respostas 500/429")
+    args = parser.parse_args()
+
+    fake = FakeMercadoPago(args.porta, args.latencia, args.latencia_conexao, args.taxa_erro)
+    print(f"Fake Mercado Pago em {fake.base_url}")
+    try:
+        fake.servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Servidor local que imita o endpoint /v1/chat/completions da OpenAI.
+
+Usado pelos benchmarks para medir a aplicação sem depender da API real.
+A latência é configurável (tempo até o primeiro token + tempo por token) e
+o servidor contabiliza quantas requisições estiveram em andamento ao mesmo
+tempo, o que permite medir a concorrência real que chega ao "upstream".
+
+Com `tokens_por_semana` o tamanho da resposta acompanha o plano pedido, como
+no modelo real: as semanas saem de "Duração do plano: N semanas" ou, nos
+pedidos por bloco, de "SOMENTE as Semanas X a Y", numeradas de acordo.
+
+Uso isolado:
+    python benchmarks/fake_openai.py --porta 8900 --latencia 1.5 --por-token 0.002
+"""
+
+import argparse
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class EstatisticasFake:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.em_andamento = 0
+        self.pico = 0
+        self.total = 0
+
+    def entrar(self):
+        with self._lock:
+            self.em_andamento += 1
+            self.total += 1
+            self.pico = max(self.pico, self.em_andamento)
+
+    def sair(self):
+        with self._lock:
+            self.em_andamento -= 1
+
+    def zerar(self):
+        with self._lock:
+            self.pico = self.em_andamento
+            self.total = 0
+
+
+DURACAO_PLANO = re.compile(r"Duração do plano: (\d+) semanas")
+SEMANAS_DO_BLOCO = re.compile(r"SOMENTE as? Semanas? (\d+)(?: a (\d+))?")
+
+
+def _semanas_pedidas(corpo):
+    """(primeira, última) semana pedida no prompt, ou None"""
+    prompt = corpo.get("messages", [{}])[-1].get("content", "")
+    bloco = SEMANAS_DO_BLOCO.search(prompt)
+    if bloco:
+        return int(bloco.group(1)), int(bloco.group(2) or bloco.group(1))
+    duracao = DURACAO_PLANO.search(prompt)
+    if duracao:
+        return 1, int(duracao.group(1))
+    return None
+
+
+def _texto_resposta(tokens, por_semana=40, primeira=1):
+    linhas = []
+    for i in range(tokens):
+        if i % por_semana == 0:
+            linhas.append(f"\nSemana {primeira + i // por_semana}\n")
+        linhas.append("treino ")
+    return "".join(linhas).strip()
+
+
+def criar_handler(config, stats):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            tamanho = int(self.headers.get("Content-Length", 0))
+            corpo = json.loads(self.rfile.read(tamanho) or b"{}")
+
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self.send_error(404)
+                return
+
+            stats.entrar()
+            try:
+                if config.falhar:
+                    time.sleep(config.latencia)
+                    self._json(500, {"error": {"message": "falha simulada"}})
+                    return
+
+                por_semana, primeira = 40, 1
+                desejados = config.tokens
+                semanas = _semanas_pedidas(corpo) if config.tokens_por_semana else None
+                if semanas:
+                    por_semana, primeira = config.tokens_por_semana, semanas[0]
+                    desejados = (semanas[1] - semanas[0] + 1) * por_semana
+                tokens = min(int(corpo.get("max_tokens") or desejados), desejados)
+                texto = _texto_resposta(tokens, por_semana, primeira)
+                finish_reason = "length" if tokens < desejados else "stop"
+                prompt_tokens = sum(len(m.get("content", "")) // 4 for m in corpo.get("messages", []))
+
+                if corpo.get("stream"):
+                    self._stream(corpo, texto, tokens, prompt_tokens, finish_reason)
+                else:
+                    time.sleep(config.latencia + tokens * config.por_token)
+                    self._json(200, {
+                        "id": f"chatcmpl-{uuid.uuid4().hex}",
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": corpo.get("model", "gpt-3.5-turbo"),
+                        "choices": [{
+                            "index": 0,
+                            "message": {"role": "assistant", "content": texto},
+                            "finish_reason": finish_reason,
+                        }],
+                        "usage": {
+                            "prompt_tokens": prompt_tokens,
+                            "completion_tokens": tokens,
+                            "total_tokens": prompt_tokens + tokens,
+                        },
+                    })
+            finally:
+                stats.sair()
+
+        def _json(self, status, dados):
+            corpo = json.dumps(dados).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def _chunk(self, dados):
+            self.wfile.write(f"{len(dados):x}\r\n".encode() + dados + b"\r\n")
+            self.wfile.flush()
+
+        def _stream(self, corpo, texto, tokens, prompt_tokens, finish_reason):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            time.sleep(config.latencia)
+            id_resposta = f"chatcmpl-{uuid.uuid4().hex}"
+            palavras = texto.split(" ")
+            for i, palavra in enumerate(palavras):
+                evento = {
+                    "id": id_resposta,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": corpo.get("model", "gpt-3.5-turbo"),
+                    "choices": [{
+                        "index": 0,
+                        "delta": {"content": palavra if i == 0 else " " + palavra},
+                        "finish_reason": None,
+                    }],
+                }
+                self._chunk(f"data: {json.dumps(evento)}\n\n".encode("utf-8"))
+                time.sleep(config.por_token)
+
+            final = {
+                "id": id_resposta,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": corpo.get("model", "gpt-3.5-turbo"),
+                "choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": tokens,
+                    "total_tokens": prompt_tokens + tokens,
+                },
+            }
+            self._chunk(f"data: {json.dumps(final)}\n\n".encode("utf-8"))
+            self._chunk(b"data: [DONE]\n\n")
+            self._chunk(b"")
+
+    return Handler
+
+
+class FakeOpenAI:
+    """Sobe o servidor falso numa thread; use como context manager nos benchmarks"""
+
+    def __init__(self, porta=0, latencia=1.0, por_token=0.0, tokens=400, falhar=False, tokens_por_semana=None):
+        self.config = argparse.Namespace(
+            latencia=latencia, por_token=por_token, tokens=tokens, falhar=falhar,
+            tokens_por_semana=tokens_por_semana
+        )
+        self.stats = EstatisticasFake()
+        self.servidor = ThreadingHTTPServer(("127.0.0.1", porta), criar_handler(self.config, self.stats))
+        self.servidor.daemon_threads = True
+        self.servidor.request_queue_size = 1024
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.servidor.server_address[1]}/v1"
+
+    def __enter__(self):
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor OpenAI falso para benchmarks")
+    parser.add_argument("--porta", type=int, default=8900)
+    parser.add_argument("--latencia", type=float, default=1.0, help="segundos até o primeiro token")
+    parser.add_argument("--por-token", type=float, default=0.0, help="segundos por token gerado")
+    parser.add_argument("--tokens", type=int, default=400, help="tokens por resposta")
+    parser.add_argument("--tokens-por-semana", type=int, default=None,
+                        help="tamanho da resposta pelas semanas pedidas no prompt")
+    args = parser.parse_args()
+
+    fake = FakeOpenAI(args.porta, args.latencia, args.por_token, args.tokens,
+                      tokens_por_semana=args.tokens_por_semana)
+    print(f"Fake OpenAI em {fake.base_url}")
+    try:
+        fake.servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
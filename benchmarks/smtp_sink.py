@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Servidor SMTP local que aceita e descarta mensagens (sem TLS nem autenticação).
+
+Usado para testar a caixa de saída de e-mails sem falar com o provedor real.
+Conta conexões e mensagens, e pode simular latência por mensagem, o custo de
+abrir uma sessão (handshake/login do provedor) e quedas de conexão.
+
+Uso isolado:
+    python benchmarks/smtp_sink.py --porta 2525 --latencia 0.05
+    MAIL_SERVER=127.0.0.1 MAIL_PORT=2525 MAIL_USE_TLS=0 python worker.py
+"""
+
+import argparse
+import email
+import socketserver
+import threading
+import time
+
+
+class EstatisticasSink:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.conexoes = 0
+        self.mensagens = []
+
+    def nova_conexao(self):
+        with self._lock:
+            self.conexoes += 1
+
+    def nova_mensagem(self, remetente, destinatarios, dados):
+        with self._lock:
+            self.mensagens.append({
+                "remetente": remetente,
+                "destinatarios": destinatarios,
+                "mensagem": email.message_from_bytes(dados),
+            })
+
+    @property
+    def total(self):
+        return len(self.mensagens)
+
+
+def criar_handler(config, stats):
+    class Handler(socketserver.StreamRequestHandler):
+        def _responder(self, linha):
+            self.wfile.write(f"{linha}\r\n".encode())
+            self.wfile.flush()
+
+        def handle(self):
+            stats.nova_conexao()
+            time.sleep(config.latencia_conexao)
+            self._responder("220 smtp-sink pronto")
+
+            remetente, destinatarios, enviadas = None, [], 0
+            while True:
+                linha = self.rfile.readline()
+                if not linha:
+                    return
+                comando = linha.decode("utf-8", "replace").strip()
+                verbo = comando.split(" ", 1)[0].upper()
+
+                if verbo in ("EHLO", "HELO"):
+                    self._responder("250 smtp-sink")
+                elif verbo == "MAIL":
+                    remetente, destinatarios = comando.split(":", 1)[1].strip(), []
+                    self._responder("250 OK")
+                elif verbo == "RCPT":
+                    destinatarios.append(comando.split(":", 1)[1].strip())
+                    self._responder("250 OK")
+                elif verbo == "DATA":
+                    self._responder("354 fim com <CRLF>.<CRLF>")
+                    linhas = []
+                    while True:
+                        dado = self.rfile.readline()
+                        if dado in (b".\r\n", b".\n", b""):
+                            break
+                        linhas.append(dado[1:] if dado.startswith(b"..") else dado)
+                    time.sleep(config.latencia)
+                    stats.nova_mensagem(remetente, destinatarios, b"".join(linhas))
+                    enviadas += 1
+                    self._responder("250 OK mensagem aceita")
+                    if config.derrubar_a_cada and enviadas % config.derrubar_a_cada == 0:
+                        # Simula o provedor encerrando a sessão
+                        return
+                elif verbo in ("RSET", "NOOP"):
+                    self._responder("250 OK")
+                elif verbo == "QUIT":
+                    self._responder("221 tchau")
+                    return
+                else:
+                    self._responder("502 comando não suportado")
+
+    return Handler
+
+
+class SMTPSink:
+    """Sobe o servidor numa thread; use como context manager nos testes"""
+
+    def __init__(self, porta=0, latencia=0.0, latencia_conexao=0.0, derrubar_a_cada=0):
+        self.config = argparse.Namespace(
+            latencia=latencia, latencia_conexao=latencia_conexao, derrubar_a_cada=derrubar_a_cada
+        )
+        self.stats = EstatisticasSink()
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self.servidor = socketserver.ThreadingTCPServer(("127.0.0.1", porta), criar_handler(self.config, self.stats))
+        self.servidor.daemon_threads = True
+
+    @property
+    def porta(self):
+        return self.servidor.server_address[1]
+
+    def __enter__(self):
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor SMTP local que descarta as mensagens")
+    parser.add_argument("--porta", type=int, default=2525)
+    parser.add_argument("--latencia", type=float, default=0.0, help="segundos por mensagem")
+    parser.add_argument("--latencia-conexao", type=float, default=0.0, help="segundos para abrir a sessão")
+    parser.add_argument("--derrubar-a-cada", type=int, default=0, help="encerra a sessão a cada N mensagens")
+    args = parser.parse_args()
+
+    sink = SMTPSink(args.porta, args.latencia, args.latencia_conexao, args.derrubar_a_cada)
+    print(f"SMTP sink em 127.0.0.1:{sink.porta}")
+    try:
+        sink.servidor.serve_forever()
+    except KeyboardInterrupt:
+        print(f"{sink.stats.total} mensagem(ns) em {sink.stats.conexoes} conexão(ões)")
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Caches usados pela aplicação.
+
+CacheLRU         -> LRU em memória do processo, com TTL e limite de itens.
+CacheEmCamadas   -> LRU local na frente do Redis (compartilhado entre workers),
+                    com métricas de acerto/falta, TTL local próprio e limite
+                    opcional de reusos por entrada. Sem Redis (ou com o Redis
+                    fora do ar) funciona só com a camada local.
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import metricas
+
+
+class CacheLRU:
+    def __init__(self, max_itens=1024, ttl=3600):
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obter(self, chave):
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                return None
+            valor, expira_em = item
+            if expira_em < time.monotonic():
+                del self._itens[chave]
+                return None
+            self._itens.move_to_end(chave)
+            return valor
+
+    def guardar(self, chave, valor, ttl=None):
+        with self._lock:
+            self._itens[chave] = (valor, time.monotonic() + (ttl or self.ttl))
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+
+    def substituir(self, chave, valor):
+        """Troca o valor de uma entrada existente mantendo a expiração original"""
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is not None:
+                self._itens[chave] = (valor, item[1])
+
+    def invalidar(self, chave):
+        with self._lock:
+            self._itens.pop(chave, None)
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+    def __len__(self):
+        return len(self._itens)
+
+
+class CacheEmCamadas:
+    def __init__(self, prefixo, redis_client=None, max_itens=1024, ttl=3600, ttl_local=None,
+                 max_reusos=None, serializar=json.dumps, desserializar=json.loads):
+        self.prefixo = prefixo
+        self.redis = redis_client
+        self.ttl = ttl
+        self.max_reusos = max_reusos
+        self.serializar = serializar
+        self.desserializar = desserializar
+        # Com Redis, um ttl_local curto limita por quanto tempo outro processo
+        # pode continuar vendo um valor já invalidado
+        self.local = CacheLRU(max_itens, ttl_local or ttl)
+
+    def _chave(self, chave):
+        return f"{self.prefixo}:{chave}"
+
+    def _registrar_uso(self, chave, usos_locais):
+        """Conta mais um uso da entrada; retorna False se o limite de reusos estourou"""
+        if not self.max_reusos:
+            return True
+        if self.redis is not None:
+            try:
+                usos = self.redis.incr(self._chave(chave) + ":usos")
+                return usos <= self.max_reusos
+            except Exception as e:
+                logging.warning(f"Redis indisponível no cache {self.prefixo}: {e}")
+        return usos_locais <= self.max_reusos
+
+    def obter(self, chave):
+        item = self.local.obter(chave)
+        if item is not None:
+            valor, usos = item
+            if self._registrar_uso(chave, usos + 1):
+                # guardar renovaria o TTL local e um valor muito lido nunca expiraria
+                self.local.substituir(chave, (valor, usos + 1))
+                metricas.cache_consultas.labels(self.prefixo, "acerto_local").inc()
+                return valor
+            metricas.cache_descartes_reuso.labels(self.prefixo).inc()
+            self.invalidar(chave)
+            metricas.cache_consultas.labels(self.prefixo, "falta").inc()
+            return None
+
+        if self.redis is not None:
+            try:
+                bruto = self.redis.get(self._chave(chave))
+                if bruto is not None:
+                    if self._registrar_uso(chave, 1):
+                        valor = self.desserializar(bruto)
+                        self.local.guardar(chave, (valor, 1))
+                        metricas.cache_consultas.labels(self.prefixo, "acerto_redis").inc()
+                        return valor
+                    metricas.cache_descartes_reuso.labels(self.prefixo).inc()
+                    self.invalidar(chave)
+            except Exception as e:
+                logging.warning(f"Redis indisponível no cache {self.prefixo}: {e}")
+
+        metricas.cache_consultas.labels(self.prefixo, "falta").inc()
+        return None
+
+    def guardar(self, chave, valor):
+        self.local.guardar(chave, (valor, 0))
+        if self.redis is not None:
+            try:
+                pipe = self.redis.pipeline()
+                pipe.set(self._chave(chave), self.serializar(valor), ex=self.ttl)
+                pipe.set(self._chave(chave) + ":usos", 0, ex=self.ttl)
+                pipe.execute()
+            except Exception as e:
+                logging.warning(f"Redis indisponível no cache {self.prefixo}: {e}")
+
+    def invalidar(self, chave):
+        self.local.invalidar(chave)
+        if self.redis is not None:
+            try:
+                self.redis.delete(self._chave(chave), self._chave(chave) + ":usos")
+            except Exception as e:
+                logging.warning(f"Redis indisponível no cache {self.prefixo}: {e}")
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cache de páginas renderizadas, com compressão prévia e respostas condicionais.
+
+Cada página (template + variante de sessão) é renderizada uma vez; na mesma
+hora são calculadas as versões gzip e brotli e um ETag forte pelo conteúdo.
+As requisições seguintes só escolhem a versão pelo Accept-Encoding, ou
+respondem 304 quando o If-None-Match bate. O Cache-Control é decidido por
+quem chama: público para páginas iguais para todos (a CDN segura o tráfego),
+`no-cache` para as que dependem da sessão (o navegador revalida pelo ETag).
+"""
+
+import gzip
+import hashlib
+import logging
+
+from flask import Response, request
+
+import metricas
+from cache import CacheLRU
+
+try:
+    import brotli
+except ImportError:  # brotli é opcional: sem ele só sai gzip
+    brotli = None
+
+# Abaixo disso a compressão não compensa o custo de descompactar
+TAMANHO_MINIMO_COMPRESSAO = 1024
+
+SUFIXOS_CODIFICACAO = {"br": "-br", "gzip": "-gz"}
+
+
+def _codificacoes_aceitas(cabecalho):
+    """Codificações do Accept-Encoding com q > 0"""
+    aceitas = set()
+    for parte in (cabecalho or "").split(","):
+        nome, _, parametros = parte.strip().partition(";")
+        parametros = parametros.replace(" ", "")
+        if nome and parametros not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            aceitas.add(nome.lower())
+    return aceitas
+
+
+class PaginaPreComprimida:
+    def __init__(self, html, mimetype="text/html"):
+        self.mimetype = mimetype
+        self.corpos = {None: html.encode("utf-8")}
+        self.etag = hashlib.sha256(self.corpos[None]).hexdigest()[:32]
+
+        if len(self.corpos[None]) >= TAMANHO_MINIMO_COMPRESSAO:
+            self.corpos["gzip"] = gzip.compress(self.corpos[None], compresslevel=9, mtime=0)
+            if brotli is not None:
+                self.corpos["br"] = brotli.compress(self.corpos[None], quality=11)
+
+    def escolher(self, accept_encoding):
+        aceitas = _codificacoes_aceitas(accept_encoding)
+        for codificacao in ("br", "gzip"):
+            if codificacao in self.corpos and codificacao in aceitas:
+                return codificacao
+        return None
+
+    def etag_de(self, codificacao):
+        # Cada codificação é uma representação diferente: ETags fortes distintos
+        return f'"{self.etag}{SUFIXOS_CODIFICACAO.get(codificacao, "")}"'
+
+    def corresponde(self, if_none_match):
+        """If-None-Match bate com qualquer representação desta página"""
+        if not if_none_match:
+            return False
+        for candidato in if_none_match.split(","):
+            candidato = candidato.strip()
+            if candidato == "*":
+                return True
+            candidato = candidato.removeprefix("W/").strip('"')
+            for sufixo in SUFIXOS_CODIFICACAO.values():
+                candidato = candidato.removesuffix(sufixo)
+            if candidato == self.etag:
+                return True
+        return False
+
+
+class CacheRespostas:
+    def __init__(self, max_itens=256, ttl=3600, ativo=True):
+        self.paginas = CacheLRU(max_itens, ttl)
+        self.ativo = ativo
+
+    def obter_pagina(self, chave, renderizar):
+        pagina = self.paginas.obter(chave) if self.ativo else None
+        if pagina is None:
+            metricas.cache_consultas.labels("respostas", "falta").inc()
+            pagina = PaginaPreComprimida(renderizar())
+            if self.ativo:
+                self.paginas.guardar(chave, pagina)
+        else:
+            metricas.cache_consultas.labels("respostas", "acerto_local").inc()
+        return pagina
+
+    def responder(self, chave, renderizar, cache_control, status=200):
+        """Resposta da página `chave`, renderizando com `renderizar()` na primeira vez"""
+        pagina = self.obter_pagina(chave, renderizar)
+        codificacao = pagina.escolher(request.headers.get("Accept-Encoding"))
+        cabecalhos = {
+            "ETag": pagina.etag_de(codificacao),
+            "Cache-Control": cache_control,
+            "Vary": "Accept-Encoding",
+        }
+
+        if status == 200 and pagina.corresponde(request.headers.get("If-None-Match")):
+            return Response(status=304, headers=cabecalhos)
+
+        if codificacao:
+            cabecalhos["Content-Encoding"] = codificacao
+        return Response(pagina.corpos[codificacao], status=status, mimetype=pagina.mimetype, headers=cabecalhos)
+
+    def limpar(self):
+        self.paginas.limpar()
+        logging.info("Cache de respostas limpo")
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Caixa de saída de e-mails sobre a fila de jobs (tipo "email").
+
+As rotas só gravam a mensagem na fila e respondem. Um único remetente em
+segundo plano reserva as mensagens uma a uma, na vez de envio de cada uma, e
+as envia por uma conexão SMTP que fica aberta entre os envios (o handshake
+TLS + login no provedor custa mais que o envio em si), respeitando um limite
+de mensagens por minuto. Com Redis o limite é de todos os processos juntos
+(cada envio reserva a próxima vez livre numa chave compartilhada); sem ele,
+cada processo respeita o limite sozinho. Falhas voltam para a fila com o
+backoff da FilaJobs; se a conexão caiu, ela é reaberta no próximo envio.
+
+Anexos que o servidor consegue gerar de novo (o PDF de um plano salvo) vão
+por referência: o job guarda só {"tipo", "ref"} e o remetente obtém os bytes
+na hora do envio pelo resolvedor registrado em `registrar_anexo`, em vez de
+guardar o arquivo em base64 no payload.
+"""
+
+import base64
+import logging
+import smtplib
+import threading
+import time
+
+from flask_mail import Message
+
+import metricas
+
+TIPO_JOB = "email"
+
+# Reserva a próxima vez de envio livre entre todos os processos; retorna
+# quantos ms esperar até ela. O relógio é o do Redis, igual para todos
+_SCRIPT_VEZ = """
+local agora = redis.call('time')
+local agora_ms = tonumber(agora[1]) * 1000 + math.floor(tonumber(agora[2]) / 1000)
+local proximo = tonumber(redis.call('get', KEYS[1]) or '0')
+if proximo < agora_ms then proximo = agora_ms end
+local intervalo = tonumber(ARGV[1])
+redis.call('set', KEYS[1], proximo + intervalo, 'PX', math.floor(proximo + intervalo - agora_ms + 60000))
+return proximo - agora_ms
+"""
+
+
+def _conexao_perdida(erro):
+    """Recusas do servidor (destinatário inválido etc.) não derrubam a sessão SMTP"""
+    if isinstance(erro, smtplib.SMTPServerDisconnected):
+        return True
+    return isinstance(erro, OSError) and not isinstance(erro, smtplib.SMTPException)
+
+
+class CaixaSaidaEmail:
+    def __init__(self, fila, mail, app, lote=20, por_minuto=60, ocioso=60, max_tentativas=6,
+                 redis_client=None, chave_vez="email:proxima_vez"):
+        self.fila = fila
+        self.mail = mail
+        self.app = app
+        self.redis = redis_client
+        self.chave_vez = chave_vez
+        self._reservar_vez = redis_client.register_script(_SCRIPT_VEZ) if redis_client is not None else None
+        self.lote = lote
+        self.intervalo_envio = 60.0 / por_minuto if por_minuto else 0.0
+        self.ocioso = ocioso
+        self.max_tentativas = max_tentativas
+        self._resolvedores = {}
+        self._conexao = None
+        self._ultimo_uso = 0.0
+        self._ultimo_envio = 0.0
+
+    def registrar_anexo(self, tipo, resolver):
+        """`resolver(ref)` retorna (nome_arquivo, content_type, bytes) no momento do envio"""
+        self._resolvedores[tipo] = resolver
+
+    def enfileirar(self, assunto, destinatarios, html, anexos=None, referencias=None, chave=None):
+        """Grava a mensagem na fila e retorna o id do job.
+
+        `anexos` é uma lista de (nome_arquivo, content_type, bytes);
+        `referencias` uma lista de (tipo, ref) resolvidas na hora do envio.
+        Com `chave`, a mesma mensagem enfileirada de novo não é enviada duas vezes.
+        """
+        payload = {
+            "assunto": assunto,
+            "destinatarios": list(destinatarios),
+            "html": html,
+            "anexos": [
+                {
+                    "nome": nome,
+                    "content_type": content_type,
+                    "dados": base64.b64encode(dados).decode("ascii")
+                }
+                for nome, content_type, dados in (anexos or [])
+            ],
+            "referencias": [{"tipo": tipo, "ref": ref} for tipo, ref in (referencias or [])]
+        }
+        return self.fila.enfileirar(TIPO_JOB, payload, max_tentativas=self.max_tentativas, chave=chave)
+
+    def _montar_mensagem(self, payload):
+        msg = Message(
+            subject=payload["assunto"],
+            recipients=payload["destinatarios"],
+            html=payload["html"]
+        )
+        for anexo in payload.get("anexos", []):
+            msg.attach(
+                filename=anexo["nome"],
+                content_type=anexo["content_type"],
+                data=base64.b64decode(anexo["dados"])
+            )
+        for referencia in payload.get("referencias", []):
+            nome, content_type, dados = self._resolvedores[referencia["tipo"]](referencia["ref"])
+            msg.attach(filename=nome, content_type=content_type, data=dados)
+        return msg
+
+    # ================================================
+    # CONEXÃO SMTP
+    # ================================================
+
+    def _conectar(self):
+        if self._conexao is None:
+            conexao = self.mail.connect()
+            conexao.__enter__()
+            self._conexao = conexao
+            metricas.smtp_conexoes.inc()
+        return self._conexao
+
+    def _desconectar(self):
+        conexao, self._conexao = self._conexao, None
+        if conexao is not None:
+            try:
+                conexao.__exit__(None, None, None)
+            except Exception:
+                # A conexão já caiu; não há o que encerrar
+                pass
+
+    def _aguardar_vez(self, parar):
+        if self._reservar_vez is not None and self.intervalo_envio:
+            try:
+                espera_ms = self._reservar_vez(keys=[self.chave_vez], args=[int(self.intervalo_envio * 1000)])
+                if espera_ms > 0:
+                    parar.wait(espera_ms / 1000)
+                self._ultimo_envio = time.monotonic()
+                return
+            except Exception as e:
+                logging.warning(f"Redis indisponível no limite de envio de e-mails: {e}")
+
+        espera = self._ultimo_envio + self.intervalo_envio - time.monotonic()
+        if espera > 0:
+            parar.wait(espera)
+        self._ultimo_envio = time.monotonic()
+
+    def _enviar(self, msg):
+        """Envia pela conexão aberta; se o servidor a derrubou, reconecta uma vez"""
+        try:
+            self._conectar().send(msg)
+        except Exception as e:
+            if not _conexao_perdida(e):
+                raise
+            self._desconectar()
+            self._conectar().send(msg)
+        self._ultimo_uso = time.monotonic()
+
+    # ================================================
+    # REMETENTE
+    # ================================================
+
+    def processar_lote(self, parar=None):
+        """Envia até `lote` mensagens; retorna quantas foram reservadas.
+
+        As mensagens são reservadas uma a uma, logo antes da vez de envio de
+        cada uma: com o limite dividido entre processos, um lote inteiro
+        reservado de uma vez podia ficar na fila de espera por mais que o
+        timeout_execucao, e a fila o devolvia para ser enviado de novo.
+        """
+        parar = parar or threading.Event()
+        reservados = 0
+
+        while reservados < self.lote and not parar.is_set():
+            jobs = self.fila.reservar([TIPO_JOB], limite=1)
+            if not jobs:
+                break
+            job = jobs[0]
+            reservados += 1
+
+            self._aguardar_vez(parar)
+            inicio = time.perf_counter()
+            try:
+                self._enviar(self._montar_mensagem(job.payload))
+                metricas.smtp_envio.labels("ok").observe(time.perf_counter() - inicio)
+                self.fila.concluir(job.id)
+            except Exception as e:
+                metricas.smtp_envio.labels("erro").observe(time.perf_counter() - inicio)
+                if _conexao_perdida(e):
+                    self._desconectar()
+                definitivo = self.fila.falhar(job, e)
+                logging.error(
+                    f"Falha ao enviar e-mail {job.id} para {job.payload.get('destinatarios')}"
+                    f" na tentativa {job.tentativas}{' - desistindo' if definitivo else ''}: {e}"
+                )
+
+        return reservados
+
+    def _loop(self, parar):
+        while not parar.is_set():
+            try:
+                # Um app context por lote: no teardown a sessão do banco usada
+                # pelos resolvedores de anexo volta ao pool, em vez de ficar
+                # "idle in transaction" até o próximo lote
+                with self.app.app_context():
+                    reservados = self.processar_lote(parar)
+            except Exception as e:
+                logging.error(f"Erro no remetente de e-mails: {e}")
+                self._desconectar()
+                parar.wait(self.fila.intervalo_polling * 4)
+                continue
+
+            if not reservados:
+                if self._conexao is not None and time.monotonic() - self._ultimo_uso > self.ocioso:
+                    self._desconectar()
+                parar.wait(self.fila.intervalo_polling)
+
+        self._desconectar()
+
+    def iniciar(self, parar=None):
+        """Sobe o remetente em segundo plano e retorna o evento de parada.
+
+        Um remetente por processo basta: o limite é o provedor, não a CPU.
+        Vários processos dividem EMAIL_POR_MINUTO pelo Redis.
+        """
+        parar = parar or threading.Event()
+        threading.Thread(target=self._loop, args=(parar,), name="remetente-email", daemon=True).start()
+        return parar
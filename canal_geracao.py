@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Canal dos trechos de uma geração em andamento, do worker para o navegador.
+
+O worker gera o plano e publica cada trecho num Redis Stream por job; a rota
+/stream só acompanha esse stream (XREAD) e repassa os trechos como eventos
+SSE, sem gerar nada na thread da requisição. Quem se conecta depois do
+início recebe desde o primeiro trecho.
+
+Marcadores no stream:
+    {"t": texto}        trecho do plano
+    {"reinicio": "1"}   nova tentativa do job; o que foi mostrado deve ser apagado
+    {"fim": json}       plano salvo ({"plano_id", "titulo", "plano"})
+    {"erro": mensagem}  a tentativa falhou; o job volta para a fila
+
+Sem Redis o canal fica inativo: nada é publicado e o navegador consulta /status.
+"""
+
+import json
+import logging
+import time
+
+
+class CanalGeracao:
+    def __init__(self, redis_client=None, prefixo="geracao", ttl=900, bloqueio_ms=400):
+        self.redis = redis_client
+        self.prefixo = prefixo
+        self.ttl = ttl
+        # Menor que o socket_timeout do cliente Redis
+        self.bloqueio_ms = bloqueio_ms
+
+    @property
+    def ativo(self):
+        return self.redis is not None
+
+    def _chave(self, canal):
+        return f"{self.prefixo}:{canal}"
+
+    def _publicar(self, canal, campos):
+        if not self.ativo or not canal:
+            return
+        try:
+            pipe = self.redis.pipeline()
+            pipe.xadd(self._chave(canal), campos)
+            pipe.expire(self._chave(canal), self.ttl)
+            pipe.execute()
+        except Exception as e:
+            # O plano é salvo do mesmo jeito; o navegador cai para /status
+            logging.warning(f"Redis indisponível no canal de geração {canal}: {e}")
+
+    def publicar(self, canal, texto):
+        if texto:
+            self._publicar(canal, {"t": texto})
+
+    def reiniciar(self, canal):
+        self._publicar(canal, {"reinicio": "1"})
+
+    def concluir(self, canal, resultado):
+        self._publicar(canal, {"fim": json.dumps(resultado)})
+
+    def falhar(self, canal, mensagem):
+        self._publicar(canal, {"erro": mensagem})
+
+    def acompanhar(self, canal, timeout):
+        """Gera (evento, dados) do canal até "fim"/"erro" ou `timeout` segundos sem novidade.
+
+        Eventos: ("delta", texto), ("reinicio", None), ("fim", resultado),
+        ("erro", mensagem) e ("aguardar", None) quando o prazo acaba.
+        """
+        ultimo = "0-0"
+        limite = time.monotonic() + timeout
+        while time.monotonic() < limite:
+            resposta = self.redis.xread({self._chave(canal): ultimo}, count=500, block=self.bloqueio_ms)
+            for _, entradas in resposta or []:
+                for id_entrada, campos in entradas:
+                    ultimo = id_entrada
+                    limite = time.monotonic() + timeout
+                    if b"t" in campos:
+                        yield "delta", campos[b"t"].decode("utf-8")
+                    elif b"reinicio" in campos:
+                        yield "reinicio", None
+                    elif b"fim" in campos:
+                        yield "fim", json.loads(campos[b"fim"])
+                        return
+                    elif b"erro" in campos:
+                        yield "erro", campos[b"erro"].decode("utf-8")
+                        return
+        yield "aguardar", None
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cliente HTTP compartilhado para a API do Mercado Pago.
+
+- Uma requests.Session com pool de conexões keep-alive, em vez de um handshake
+  TCP + TLS novo a cada chamada.
+- Novas tentativas limitadas, com backoff exponencial e jitter, em erros de
+  conexão, timeouts, 429 e 5xx (respeitando o Retry-After). POSTs levam um
+  X-Idempotency-Key fixo entre as tentativas para não criar recursos em dobro.
+- Timeout por endpoint.
+- Disjuntor (circuit breaker): depois de várias falhas seguidas as chamadas
+  falham na hora, sem esperar timeouts, até passar o tempo de recuperação.
+- Histogramas de latência e contadores de erro por endpoint.
+
+Todas as falhas chegam ao chamador como requests.exceptions.RequestException.
+"""
+
+import logging
+import random
+import threading
+import time
+import uuid
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metricas
+from histograma import Histograma
+
+# Limites (segundos) dos buckets do histograma de latência
+BUCKETS_LATENCIA = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# (conexão, leitura) por endpoint
+TIMEOUTS_PADRAO = {
+    "criar_preferencia": (3.05, 10),
+    "obter_pagamento": (3.05, 15),
+    "obter_assinatura": (3.05, 15),
+}
+
+
+class GatewayIndisponivel(requests.exceptions.RequestException):
+    """O disjuntor está aberto: o Mercado Pago falhou demais há pouco"""
+
+
+class Disjuntor:
+    """fechado -> aberto após `limite_falhas` falhas seguidas -> meio-aberto após
+    `tempo_aberto` segundos (uma chamada de teste) -> fechado se ela passar"""
+
+    def __init__(self, limite_falhas=5, tempo_aberto=30.0):
+        self.limite_falhas = limite_falhas
+        self.tempo_aberto = tempo_aberto
+        self.falhas_seguidas = 0
+        self.aberto_ate = 0.0
+        self._testando = False
+        self._lock = threading.Lock()
+
+    @property
+    def estado(self):
+        if self.falhas_seguidas < self.limite_falhas:
+            return "fechado"
+        return "aberto" if time.monotonic() < self.aberto_ate else "meio-aberto"
+
+    def permitir(self):
+        with self._lock:
+            estado = self.estado
+            if estado == "fechado":
+                return True
+            if estado == "meio-aberto" and not self._testando:
+                self._testando = True
+                return True
+            return False
+
+    def sucesso(self):
+        with self._lock:
+            self.falhas_seguidas = 0
+            self._testando = False
+
+    def falha(self):
+        with self._lock:
+            self.falhas_seguidas += 1
+            self._testando = False
+            if self.falhas_seguidas >= self.limite_falhas:
+                self.aberto_ate = time.monotonic() + self.tempo_aberto
+
+
+class ClienteMercadoPago:
+    def __init__(self, access_token, base_url="https://api.mercadopago.com", pool=20,
+                 max_tentativas=3, backoff_base=0.25, backoff_max=2.0, timeouts=None,
+                 limite_falhas=5, tempo_aberto=30.0):
+        self.access_token = access_token
+        self.base_url = base_url.rstrip("/")
+        self.max_tentativas = max_tentativas
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeouts = {**TIMEOUTS_PADRAO, **(timeouts or {})}
+        self.disjuntor = Disjuntor(limite_falhas, tempo_aberto)
+
+        self.sessao = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=pool)
+        self.sessao.mount("https://", adaptador)
+        self.sessao.mount("http://", adaptador)
+
+        self._lock = threading.Lock()
+        self.latencias = {}
+        self.erros = {}
+
+    # ================================================
+    # MÉTRICAS
+    # ================================================
+
+    def _registrar(self, endpoint, duracao, resultado):
+        metricas.mercadopago_latencia.labels(endpoint, resultado).observe(duracao)
+        with self._lock:
+            self.latencias.setdefault(endpoint, Histograma(BUCKETS_LATENCIA)).observar(duracao)
+            if resultado != "ok":
+                chave = (endpoint, resultado)
+                self.erros[chave] = self.erros.get(chave, 0) + 1
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                "disjuntor": self.disjuntor.estado,
+                "latencias": {
+                    endpoint: {
+                        **hist.exportar(),
+                        "p50": hist.percentil(50),
+                        "p95": hist.percentil(95),
+                        "p99": hist.percentil(99),
+                    }
+                    for endpoint, hist in self.latencias.items()
+                },
+                "erros": {f"{endpoint}:{resultado}": n for (endpoint, resultado), n in self.erros.items()},
+            }
+
+    # ================================================
+    # REQUISIÇÕES
+    # ================================================
+
+    def _espera(self, tentativa, resposta=None):
+        if resposta is not None and resposta.headers.get("Retry-After", "").isdigit():
+            return min(float(resposta.headers["Retry-After"]), self.backoff_max)
+        atraso = min(self.backoff_base * (2 ** (tentativa - 1)), self.backoff_max)
+        return random.uniform(0, atraso)
+
+    def _requisitar(self, endpoint, metodo, caminho, **kwargs):
+        if not self.disjuntor.permitir():
+            self._registrar(endpoint, 0.0, "disjuntor_aberto")
+            raise GatewayIndisponivel(f"Mercado Pago indisponível ({endpoint}): disjuntor aberto")
+
+        headers = {
+            "Authorization": f"Bearer {self.access_token}",
+            "Content-Type": "application/json",
+        }
+        if metodo == "POST":
+            headers["X-Idempotency-Key"] = str(uuid.uuid4())
+
+        # Qualquer saída que não seja uma resposta do gateway (inclusive uma
+        # exceção inesperada) conta como falha: senão a chamada de teste do
+        # meio-aberto ficava presa e o disjuntor nunca mais deixava passar
+        respondeu = False
+        try:
+            for tentativa in range(1, self.max_tentativas + 1):
+                inicio = time.monotonic()
+                resposta, erro = None, None
+                try:
+                    resposta = self.sessao.request(
+                        metodo,
+                        f"{self.base_url}{caminho}",
+                        headers=headers,
+                        timeout=self.timeouts[endpoint],
+                        **kwargs
+                    )
+                    # Um 2xx com o corpo cortado ou inválido também é falha do gateway
+                    dados = resposta.json() if resposta.status_code < 400 else None
+                    resultado = "ok" if resposta.status_code < 400 else str(resposta.status_code)
+                except requests.exceptions.RequestException as e:
+                    erro = e
+                    resultado = type(e).__name__
+                self._registrar(endpoint, time.monotonic() - inicio, resultado)
+
+                transitorio = erro is not None or resposta.status_code == 429 or resposta.status_code >= 500
+                if not transitorio:
+                    # 2xx ou erro do cliente (4xx): o gateway respondeu, não conta como falha dele
+                    respondeu = True
+                    self.disjuntor.sucesso()
+                    resposta.raise_for_status()
+                    return dados
+
+                if tentativa == self.max_tentativas:
+                    if erro is not None:
+                        raise erro
+                    resposta.raise_for_status()
+
+                espera = self._espera(tentativa, resposta)
+                logging.warning(
+                    f"Mercado Pago {endpoint} falhou ({resultado}) na tentativa {tentativa}; "
+                    f"nova tentativa em {espera:.2f}s"
+                )
+                time.sleep(espera)
+        finally:
+            if not respondeu:
+                self.disjuntor.falha()
+
+    def criar_preferencia(self, preferencia):
+        return self._requisitar("criar_preferencia", "POST", "/checkout/preferences", json=preferencia)
+
+    def obter_pagamento(self, id_pagamento):
+        return self._requisitar("obter_pagamento", "GET", f"/v1/payments/{id_pagamento}")
+
+    def obter_assinatura(self, subscription_id):
+        return self._requisitar("obter_assinatura", "GET", f"/preapproval/{subscription_id}")
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cota de gerações por usuário, reservada de forma atômica.
+
+Cada plano tem um limite de gerações por janela (gratuito: 1 a cada 30 dias;
+anual: sem limite prático, só um teto diário contra abuso). A reserva é um
+único INSERT ... ON CONFLICT DO UPDATE condicional em `usuarios`: cria o
+usuário se preciso, abre uma janela nova se a anterior venceu ou soma 1 ao
+contador, e só altera a linha se ainda houver cota. Como o UPDATE trava a
+linha e reavalia a condição depois da trava, dois envios simultâneos do
+mesmo usuário não passam os dois.
+
+A reserva é feita antes de enfileirar a geração e devolvida com `liberar`
+se a geração falhar de vez. A devolução só vale para a mesma janela: se ela
+já venceu, não há o que devolver.
+"""
+
+import math
+import os
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import text
+
+# Plano -> (gerações por janela, duração da janela em dias)
+COTAS_PADRAO = {
+    "gratuito": (1, 30),
+    "anual": (20, 1),
+}
+
+Reserva = namedtuple("Reserva", ["email", "plano", "inicio", "usadas"])
+
+RESERVAR_SQL = text("""
+    INSERT INTO usuarios (email, plano, data_inscricao, ultima_geracao, cota_inicio, cota_usada)
+    VALUES (:email, 'gratuito', NOW(), NOW(), NOW(), 1)
+    ON CONFLICT (email) DO UPDATE
+    SET cota_inicio = CASE
+            WHEN usuarios.cota_inicio IS NULL
+              OR usuarios.cota_inicio <= NOW() - make_interval(days => :dias)
+            THEN NOW() ELSE usuarios.cota_inicio END,
+        cota_usada = CASE
+            WHEN usuarios.cota_inicio IS NULL
+              OR usuarios.cota_inicio <= NOW() - make_interval(days => :dias)
+            THEN 1 ELSE usuarios.cota_usada + 1 END
+    WHERE usuarios.cota_inicio IS NULL
+       OR usuarios.cota_inicio <= NOW() - make_interval(days => :dias)
+       OR usuarios.cota_usada < :limite
+    RETURNING cota_inicio, cota_usada
+""")
+
+LIBERAR_SQL = text("""
+    UPDATE usuarios
+    SET cota_usada = cota_usada - 1
+    WHERE email = :email
+      AND cota_inicio = :inicio
+      AND cota_usada > 0
+""")
+
+
+class CotasGeracao:
+    def __init__(self, engine, cotas=None):
+        self.engine = engine
+        self.cotas = cotas or COTAS_PADRAO
+
+    @classmethod
+    def do_ambiente(cls, engine):
+        return cls(engine, {
+            "gratuito": (
+                int(os.getenv("COTA_GRATUITO", 1)),
+                int(os.getenv("COTA_GRATUITO_DIAS", 30))
+            ),
+            "anual": (
+                int(os.getenv("COTA_ANUAL", 20)),
+                int(os.getenv("COTA_ANUAL_DIAS", 1))
+            ),
+        })
+
+    def reservar(self, email, plano):
+        """Reserva uma geração; retorna a Reserva ou None se a cota do plano acabou"""
+        if plano not in self.cotas:
+            return None
+        limite, dias = self.cotas[plano]
+
+        with self.engine.begin() as conn:
+            linha = conn.execute(RESERVAR_SQL, {"email": email, "limite": limite, "dias": dias}).fetchone()
+        if linha is None:
+            return None
+        return Reserva(email, plano, linha.cota_inicio, linha.cota_usada)
+
+    def liberar(self, email, inicio):
+        """Devolve uma geração reservada na janela que começou em `inicio`"""
+        if isinstance(inicio, str):
+            inicio = datetime.fromisoformat(inicio)
+        with self.engine.begin() as conn:
+            return conn.execute(LIBERAR_SQL, {"email": email, "inicio": inicio}).rowcount > 0
+
+    def janela_dias(self, plano):
+        """Duração, em dias, da janela de cota do plano"""
+        return self.cotas.get(plano, (0, 0))[1]
+
+    def dias_para_liberar(self, plano, cota_inicio, cota_usada):
+        """Dias até a próxima geração do plano ficar disponível (0 = já pode)"""
+        limite, dias = self.cotas.get(plano, (0, 0))
+        if cota_inicio is None or cota_usada < limite:
+            return 0
+        if isinstance(cota_inicio, str):
+            cota_inicio = datetime.fromisoformat(cota_inicio)
+        restante = dias - (datetime.now() - cota_inicio).total_seconds() / 86400
+        return max(math.ceil(restante), 0)
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Mostra o plano de execução (EXPLAIN) de cada consulta frequente da aplicação.
+
+Serve para confirmar que os índices das migrações estão sendo usados conforme
+as tabelas crescem. Com --analyze as consultas são executadas de verdade
+(EXPLAIN ANALYZE), sempre dentro de uma transação desfeita no final.
+
+    python explicar_consultas.py
+    python explicar_consultas.py --analyze
+"""
+
+import os
+import sys
+
+from sqlalchemy import create_engine, text
+
+from cotas import RESERVAR_SQL
+
+CONSULTAS = {
+    "direitos do usuário (obter_direitos)": (
+        """
+        SELECT u.id, u.email, u.nome, u.plano, u.ultima_geracao,
+        u.cota_inicio, u.cota_usada,
+        (SELECT status FROM assinaturas
+         WHERE usuario_id = u.id
+         ORDER BY id DESC LIMIT 1) as status_assinatura
+        FROM usuarios u
+        WHERE u.email = :email
+        """,
+        {}
+    ),
+    "usuário por email (registrar_geracao)": (
+        "SELECT id, plano FROM usuarios WHERE email = :email",
+        {}
+    ),
+    "última assinatura do usuário": (
+        """
+        SELECT status FROM assinaturas
+        WHERE usuario_id = :usuario_id
+        ORDER BY id DESC LIMIT 1
+        """,
+        {}
+    ),
+    "gerações recentes do usuário": (
+        """
+        SELECT COUNT(*) FROM geracoes
+        WHERE usuario_id = :usuario_id
+          AND data_geracao >= NOW() - INTERVAL '30 days'
+        """,
+        {}
+    ),
+    "tokens da OpenAI consumidos hoje": (
+        """
+        SELECT COALESCE(SUM(tokens_prompt + tokens_completion), 0)
+        FROM geracoes
+        WHERE data_geracao >= CURRENT_DATE
+        """,
+        {}
+    ),
+    "reserva de cota de geração (cotas.py)": (
+        str(RESERVAR_SQL),
+        {"limite": 1, "dias": 30}
+    ),
+    "atualiza última geração": (
+        "UPDATE usuarios SET ultima_geracao = NOW() WHERE id = :usuario_id",
+        {}
+    ),
+    "upsert de pagamento": (
+        """
+        INSERT INTO pagamentos (payment_id, status, data_pagamento)
+        VALUES ('explain-teste', 'approved', NOW())
+        ON CONFLICT (payment_id) DO UPDATE
+        SET status = EXCLUDED.status,
+            data_pagamento = NOW()
+        """,
+        {}
+    ),
+    "upsert de assinatura": (
+        """
+        INSERT INTO assinaturas (subscription_id, status, data_atualizacao)
+        VALUES ('explain-teste', 'authorized', NOW())
+        ON CONFLICT (subscription_id) DO UPDATE
+        SET status = EXCLUDED.status,
+            data_atualizacao = NOW()
+        """,
+        {}
+    ),
+    "reserva de job (fila.py)": (
+        """
+        SELECT id FROM jobs
+        WHERE status = 'pendente'
+          AND disponivel_em <= NOW()
+        ORDER BY disponivel_em
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+        """,
+        {}
+    ),
+    "plano salvo (carregar_plano)": (
+        """
+        SELECT id, email, tipo_plano, titulo, conteudo, criado_em
+        FROM planos
+        WHERE id = :plano_id AND email = :email
+        """,
+        {}
+    ),
+    "registro de tentativa de pagamento": (
+        """
+        INSERT INTO tentativas_pagamento (email, data_tentativa, tipo)
+        VALUES (:email, NOW(), 'checkout')
+        """,
+        {}
+    ),
+    "log de webhook": (
+        """
+        INSERT INTO logs_webhook (data_recebimento, payload, status_processamento)
+        VALUES (NOW(), '{}', 'recebido')
+        """,
+        {}
+    ),
+}
+
+
+def parametros_exemplo(conn):
+    """Usa um usuário real, se houver, para os planos refletirem dados reais"""
+    usuario = conn.execute(text("SELECT id, email FROM usuarios ORDER BY id DESC LIMIT 1")).fetchone()
+    plano = conn.execute(text("SELECT id FROM planos ORDER BY criado_em DESC LIMIT 1")).fetchone()
+    return {
+        "email": usuario.email if usuario else "explain@treinorun.com.br",
+        "usuario_id": usuario.id if usuario else 0,
+        "plano_id": str(plano.id) if plano else "00000000-0000-0000-0000-000000000000",
+    }
+
+
+def main():
+    analyze = "--analyze" in sys.argv
+    opcoes = "ANALYZE, BUFFERS" if analyze else "COSTS"
+    engine = create_engine(os.getenv("DATABASE_URL"))
+
+    with engine.connect() as conn:
+        transacao = conn.begin()
+        try:
+            parametros = parametros_exemplo(conn)
+            for nome, (sql, extras) in CONSULTAS.items():
+                plano = conn.execute(text(f"EXPLAIN ({opcoes}) {sql}"), {**parametros, **extras}).fetchall()
+                linhas = [row[0] for row in plano]
+                alerta = " [Seq Scan]" if any("Seq Scan" in linha for linha in linhas) else ""
+
+                print(f"=== {nome}{alerta}")
+                for linha in linhas:
+                    print(f"    {linha}")
+                print()
+        finally:
+            # Nada do que foi executado com ANALYZE fica gravado
+            transacao.rollback()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Fila persistente de jobs sobre a tabela `jobs` do Postgres.
+
+Os jobs são reservados com `FOR UPDATE SKIP LOCKED`, então qualquer número de
+threads e processos pode consumir a mesma fila sem processar um job duas vezes.
+Falhas são reagendadas com backoff exponencial e jitter até `max_tentativas`.
+"""
+
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+
+from sqlalchemy import text
+
+
+class FilaJobs:
+    def __init__(self, engine, intervalo_polling=0.5, timeout_execucao=300):
+        self.engine = engine
+        self.intervalo_polling = intervalo_polling
+        self.timeout_execucao = timeout_execucao
+
+    def enfileirar(self, tipo, payload, atraso=0, max_tentativas=5, chave=None):
+        """Grava o job e retorna o id imediatamente.
+
+        Com `chave` (idempotência) o job só é criado se nenhum outro tiver a
+        mesma chave; se já existir, retorna o id do existente.
+        """
+        job_id = str(uuid.uuid4())
+        with self.engine.begin() as conn:
+            criado = conn.execute(
+                text("""
+                    INSERT INTO jobs (id, tipo, payload, max_tentativas, disponivel_em, chave)
+                    VALUES (:id, :tipo, :payload, :max_tentativas,
+                            NOW() + make_interval(secs => :atraso), :chave)
+                    ON CONFLICT (chave) WHERE chave IS NOT NULL DO NOTHING
+                    RETURNING id
+                """),
+                {
+                    "id": job_id,
+                    "tipo": tipo,
+                    "payload": json.dumps(payload),
+                    "max_tentativas": max_tentativas,
+                    "atraso": atraso,
+                    "chave": chave
+                }
+            ).fetchone()
+            if criado is None:
+                job_id = str(conn.execute(
+                    text("SELECT id FROM jobs WHERE chave = :chave"),
+                    {"chave": chave}
+                ).scalar())
+        return job_id
+
+    def obter(self, job_id):
+        try:
+            uuid.UUID(str(job_id))
+        except ValueError:
+            return None
+        with self.engine.connect() as conn:
+            return conn.execute(
+                text("SELECT * FROM jobs WHERE id = :id"),
+                {"id": job_id}
+            ).fetchone()
+
+    def reservar(self, tipos=None, limite=1):
+        """Marca até `limite` jobs disponíveis como em execução e os retorna"""
+        filtro_tipo = "AND tipo = ANY(:tipos)" if tipos else ""
+        with self.engine.begin() as conn:
+            return conn.execute(
+                text(f"""
+                    UPDATE jobs
+                    SET status = 'executando',
+                        tentativas = tentativas + 1,
+                        reservado_em = NOW(),
+                        atualizado_em = NOW()
+                    WHERE id IN (
+                        SELECT id FROM jobs
+                        WHERE status = 'pendente'
+                          AND disponivel_em <= NOW()
+                          {filtro_tipo}
+                        ORDER BY disponivel_em
+                        LIMIT :limite
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING *
+                """),
+                {"tipos": list(tipos or []), "limite": limite}
+            ).fetchall()
+
+    def concluir(self, job_id, resultado=None):
+        with self.engine.begin() as conn:
+            conn.execute(
+                text("""
+                    UPDATE jobs
+                    SET status = 'concluido', resultado = :resultado,
+                        erro = NULL, atualizado_em = NOW()
+                    WHERE id = :id
+                """),
+                {"id": job_id, "resultado": json.dumps(resultado)}
+            )
+
+    def falhar(self, job, erro, backoff_base=2.0, backoff_max=300.0):
+        """Reagenda o job com backoff exponencial ou o marca como falho de vez"""
+        with self.engine.begin() as conn:
+            return self._falhar(conn, job, erro, backoff_base, backoff_max)
+
+    def _falhar(self, conn, job, erro, backoff_base=2.0, backoff_max=300.0):
+        definitivo = job.tentativas >= job.max_tentativas
+        atraso = min(backoff_base * (2 ** (job.tentativas - 1)), backoff_max)
+        atraso = random.uniform(atraso / 2, atraso)
+
+        conn.execute(
+            text("""
+                UPDATE jobs
+                SET status = :status, erro = :erro,
+                    disponivel_em = NOW() + make_interval(secs => :atraso),
+                    atualizado_em = NOW()
+                WHERE id = :id
+            """),
+            {
+                "id": job.id,
+                "status": "falhou" if definitivo else "pendente",
+                "erro": str(erro)[:2000],
+                "atraso": atraso
+            }
+        )
+        return definitivo
+
+    def recuperar_travados(self, ao_desistir=None):
+        """Conta como tentativa falha os jobs cujo worker morreu no meio da execução.
+
+        Passam pelo mesmo caminho de `falhar`: voltam para a fila com backoff
+        ou, sem tentativas restantes, são dados como falhos e `ao_desistir(job)`
+        é chamado. Retorna (devolvidos, desistidos).
+        """
+        with self.engine.begin() as conn:
+            travados = conn.execute(
+                text("""
+                    SELECT * FROM jobs
+                    WHERE status = 'executando'
+                      AND reservado_em < NOW() - make_interval(secs => :timeout)
+                    FOR UPDATE SKIP LOCKED
+                """),
+                {"timeout": self.timeout_execucao}
+            ).fetchall()
+            desistidos = [
+                job for job in travados
+                if self._falhar(conn, job, "Execução interrompida: o worker parou ou passou do tempo limite")
+            ]
+
+        for job in desistidos:
+            self._desistir(job, ao_desistir)
+        return len(travados) - len(desistidos), len(desistidos)
+
+    def _desistir(self, job, ao_desistir):
+        if ao_desistir is None:
+            return
+        try:
+            ao_desistir(job)
+        except Exception as e:
+            logging.error(f"Erro ao desistir do job {job.id} ({job.tipo}): {e}")
+
+    # ================================================
+    # WORKERS
+    # ================================================
+
+    def _loop_worker(self, executar, tipos, parar, ao_desistir):
+        while not parar.is_set():
+            try:
+                jobs = self.reservar(tipos)
+            except Exception as e:
+                logging.error(f"Erro ao reservar job: {e}")
+                parar.wait(self.intervalo_polling * 4)
+                continue
+
+            if not jobs:
+                parar.wait(self.intervalo_polling)
+                continue
+
+            for job in jobs:
+                try:
+                    resultado = executar(job)
+                    self.concluir(job.id, resultado)
+                except Exception as e:
+                    definitivo = self.falhar(job, e)
+                    logging.error(
+                        f"Job {job.id} ({job.tipo}) falhou na tentativa {job.tentativas}"
+                        f"{' - desistindo' if definitivo else ''}: {e}",
+                        exc_info=definitivo
+                    )
+                    if definitivo:
+                        self._desistir(job, ao_desistir)
+
+    def _loop_manutencao(self, parar, ao_desistir):
+        while not parar.wait(self.timeout_execucao / 5):
+            try:
+                devolvidos, desistidos = self.recuperar_travados(ao_desistir)
+                if devolvidos:
+                    logging.warning(f"{devolvidos} job(s) travado(s) devolvido(s) para a fila")
+                if desistidos:
+                    logging.error(f"{desistidos} job(s) travado(s) sem tentativas restantes - desistindo")
+            except Exception as e:
+                logging.error(f"Erro na manutenção da fila: {e}")
+
+    def iniciar_workers(self, executar, threads=4, tipos=None, parar=None, ao_desistir=None):
+        """Sobe `threads` consumidores em segundo plano e retorna o evento de parada.
+
+        `ao_desistir(job)` é chamado quando um job esgota as tentativas, seja
+        por exceção no handler ou por ter travado.
+        """
+        parar = parar or threading.Event()
+        for i in range(threads):
+            threading.Thread(
+                target=self._loop_worker,
+                args=(executar, tipos, parar, ao_desistir),
+                name=f"worker-fila-{i}",
+                daemon=True
+            ).start()
+        threading.Thread(target=self._loop_manutencao, args=(parar, ao_desistir), name="manutencao-fila", daemon=True).start()
+        return parar
+
+    def executar_workers(self, executar, threads=4, tipos=None, parar=None, ao_desistir=None):
+        """Versão bloqueante de iniciar_workers, para o processo worker dedicado"""
+        parar = self.iniciar_workers(executar, threads, tipos, parar, ao_desistir)
+        try:
+            while not parar.is_set():
+                time.sleep(1)
+        except KeyboardInterrupt:
+            parar.set()
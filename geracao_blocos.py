@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Geração de planos longos em blocos de periodização.
+
+Um plano de 52 semanas numa única resposta leva o tempo de gerar todos os
+tokens em sequência. Aqui o plano é dividido nas fases de base, construção,
+pico e polimento (fases longas viram mais de um bloco, até
+`max_semanas_bloco` semanas cada); cada bloco é pedido à OpenAI em paralelo
+com o mesmo cabeçalho do atleta e a visão geral das fases, e as respostas são
+costuradas na ordem das semanas. O tempo total passa a ser o do maior bloco.
+
+Na costura cada resposta é cortada nos títulos "Semana N": semanas fora do
+intervalo do bloco (o modelo às vezes repete as vizinhas) são descartadas e
+as que faltarem são informadas para quem chamou decidir pedir de novo.
+"""
+
+import re
+from collections import namedtuple
+from functools import partial
+from types import SimpleNamespace
+
+# (fase, fração do plano, foco do treino)
+FASES = [
+    ("base", 0.4, "volume aeróbico em ritmo confortável, aumentando a distância aos poucos"),
+    ("construção", 0.3, "treinos de limiar e intervalados, mantendo o volume"),
+    ("pico", 0.2, "treinos no ritmo da prova e os estímulos mais intensos do plano"),
+    ("polimento", 0.1, "redução do volume mantendo a intensidade, até o teste do objetivo"),
+]
+
+Bloco = namedtuple("Bloco", ["fase", "foco", "inicio", "fim"])
+
+TITULO_SEMANA = re.compile(r"^[\s#*_>-]*semana\s+(\d+)\b", re.IGNORECASE | re.MULTILINE)
+
+
+def _semanas_por_fase(semanas):
+    """Semanas de cada fase pelas frações de FASES; a base absorve o arredondamento"""
+    if semanas < len(FASES):
+        return None
+    quantidades = [max(1, round(fracao * semanas)) for _, fracao, _ in FASES[1:]]
+    base = semanas - sum(quantidades)
+    if base < 1:
+        return None
+    return [base] + quantidades
+
+
+def dividir_em_blocos(semanas, max_semanas_bloco=8):
+    """Blocos consecutivos cobrindo as semanas 1..semanas, na ordem das fases"""
+    quantidades = _semanas_por_fase(semanas)
+    if quantidades is None:
+        return [Bloco("completo", "progressão gradual até o teste do objetivo", 1, semanas)]
+
+    blocos = []
+    inicio = 1
+    for (fase, _, foco), quantidade in zip(FASES, quantidades):
+        # Fase longa vira partes de tamanho parecido, para nenhuma dominar o tempo total
+        partes = -(-quantidade // max_semanas_bloco)
+        tamanho, sobra = divmod(quantidade, partes)
+        for i in range(partes):
+            fim = inicio + tamanho + (1 if i < sobra else 0) - 1
+            blocos.append(Bloco(fase, foco, inicio, fim))
+            inicio = fim + 1
+    return blocos
+
+
+def _intervalo(bloco):
+    if bloco.inicio == bloco.fim:
+        return f"a Semana {bloco.inicio}"
+    return f"as Semanas {bloco.inicio} a {bloco.fim}"
+
+
+def prompt_bloco(prompt_base, bloco, blocos, semanas):
+    """Prompt do atleta (comum a todos os blocos) mais o recorte deste bloco"""
+    visao_geral = []
+    for b in blocos:
+        if not visao_geral or visao_geral[-1][0] != b.fase:
+            visao_geral.append([b.fase, b.foco, b.inicio, b.fim])
+        else:
+            visao_geral[-1][3] = b.fim
+    fases = "\n".join(
+        f"        - {fase.capitalize()} (semanas {inicio} a {fim}): {foco}"
+        for fase, foco, inicio, fim in visao_geral
+    )
+
+    return f"""{prompt_base}
+        O plano completo de {semanas} semanas está dividido nestas fases:
+{fases}
+
+        Escreva SOMENTE {_intervalo(bloco)} (fase de {bloco.fase}: {bloco.foco}).
+        As demais semanas estão sendo escritas à parte; não as repita nem as resuma.
+        Comece cada semana com um título "Semana N", usando a numeração do plano completo.
+        """
+
+
+def separar_semanas(texto):
+    """(texto antes da primeira semana, {número: trecho da semana})"""
+    titulos = list(TITULO_SEMANA.finditer(texto))
+    if not titulos:
+        return texto.strip(), {}
+
+    semanas = {}
+    for atual, proximo in zip(titulos, titulos[1:] + [None]):
+        numero = int(atual.group(1))
+        trecho = texto[atual.start():proximo.start() if proximo else len(texto)].strip()
+        # Se o título se repetir, fica a primeira ocorrência
+        semanas.setdefault(numero, trecho)
+    return texto[:titulos[0].start()].strip(), semanas
+
+
+def validar_bloco(bloco, texto):
+    """(trechos das semanas do bloco em ordem, semanas que faltaram)"""
+    _, semanas = separar_semanas(texto)
+    numeros = range(bloco.inicio, bloco.fim + 1)
+    faltando = [n for n in numeros if n not in semanas]
+    return [semanas[n] for n in numeros if n in semanas], faltando
+
+
+def juntar_blocos(blocos, textos):
+    """Plano único a partir das respostas de cada bloco; retorna (plano, semanas faltando)"""
+    partes = []
+    faltando = []
+    fase_anterior = None
+    for i, (bloco, texto) in enumerate(zip(blocos, textos)):
+        if i == 0:
+            # A introdução geral, se houver, só é aproveitada do primeiro bloco
+            introducao, _ = separar_semanas(texto)
+            if introducao:
+                partes.append(introducao)
+        if bloco.fase != fase_anterior and len(blocos) > 1:
+            partes.append(f"Fase de {bloco.fase}: {bloco.foco}")
+            fase_anterior = bloco.fase
+
+        trechos, faltando_bloco = validar_bloco(bloco, texto)
+        partes.extend(trechos)
+        faltando.extend(faltando_bloco)
+    return "\n\n".join(partes), faltando
+
+
+class DeltasOrdenados:
+    """Repassa os trechos de blocos gerados em paralelo na ordem das semanas.
+
+    O bloco atual vai direto para `destino` (uma queue.Queue); os seguintes
+    ficam guardados até os anteriores terminarem. Todos os métodos são
+    chamados de dentro do event loop, então não há concorrência entre eles.
+    """
+
+    def __init__(self, destino, quantidade):
+        self.destino = destino
+        self.pendentes = [[] for _ in range(quantidade)]
+        self.concluidos = [False] * quantidade
+        self.atual = 0
+
+    def bloco(self, indice):
+        """Objeto com put(), no formato que chamar_openai_stream espera"""
+        return SimpleNamespace(put=partial(self._receber, indice))
+
+    def _receber(self, indice, texto):
+        if indice == self.atual:
+            self.destino.put(texto)
+        else:
+            self.pendentes[indice].append(texto)
+
+    def concluir(self, indice):
+        self.concluidos[indice] = True
+        while self.atual < len(self.concluidos) and self.concluidos[self.atual]:
+            self.atual += 1
+            if self.atual < len(self.pendentes):
+                self.destino.put("\n\n")
+                for texto in self.pendentes[self.atual]:
+                    self.destino.put(texto)
+                self.pendentes[self.atual] = []
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Gravação em lotes para tabelas de log (append-only).
+
+`registrar` só coloca a linha numa fila em memória e retorna; uma thread em
+segundo plano junta até `max_lote` linhas (ou o que chegou em `intervalo`
+segundos) e grava tudo num único INSERT de várias linhas, numa transação.
+Se a fila encher, a linha é gravada na hora para não se perder; no
+encerramento do processo o que sobrou é descarregado.
+"""
+
+import atexit
+import logging
+import queue
+import time
+
+from sqlalchemy import column, insert, table
+
+import metricas
+from thread_processo import ThreadPorProcesso
+
+
+class GravadorEmLotes:
+    def __init__(self, engine, tabela, colunas, max_lote=500, intervalo=1.0, max_pendentes=10000):
+        self.engine = engine
+        self.tabela = table(tabela, *[column(c) for c in colunas])
+        self.max_lote = max_lote
+        self.intervalo = intervalo
+        self._fila = queue.Queue(max_pendentes)
+        self._thread = ThreadPorProcesso(self._loop, f"gravador-{tabela}")
+        atexit.register(self.descarregar)
+
+    def registrar(self, **linha):
+        self._thread.garantir()
+        try:
+            self._fila.put_nowait(linha)
+        except queue.Full:
+            logging.warning(f"Fila do gravador de {self.tabela.name} cheia; gravando direto")
+            self._gravar([linha])
+
+    def _gravar(self, linhas):
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(insert(self.tabela).values(linhas))
+            metricas.gravador_linhas.labels(self.tabela.name, "gravada").inc(len(linhas))
+        except Exception as e:
+            metricas.gravador_linhas.labels(self.tabela.name, "perdida").inc(len(linhas))
+            logging.error(f"Falha ao gravar {len(linhas)} linha(s) em {self.tabela.name}: {e}")
+
+    def _coletar(self, espera):
+        """Junta até max_lote linhas, esperando no máximo `espera` segundos pelas seguintes"""
+        linhas = []
+        limite = time.monotonic() + espera
+        try:
+            while len(linhas) < self.max_lote:
+                restante = limite - time.monotonic()
+                linhas.append(self._fila.get(timeout=restante) if restante > 0 else self._fila.get_nowait())
+        except queue.Empty:
+            pass
+        return linhas
+
+    def _loop(self):
+        while True:
+            # Espera a primeira linha sem prazo e dá `intervalo` para o lote encher
+            linha = self._fila.get()
+            self._gravar([linha] + self._coletar(self.intervalo))
+
+    def descarregar(self):
+        """Grava na hora tudo o que está pendente"""
+        while True:
+            linhas = self._coletar(0)
+            if not linhas:
+                return
+            self._gravar(linhas)
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""
+Configuração lida automaticamente pelo gunicorn (web do PROCFILE).
+
+Prepara as métricas multiprocesso: o diretório precisa estar no ambiente
+antes de os workers importarem o prometheus_client, é limpo a cada subida
+do master e cada worker que sai é marcado como morto.
+
+Os workers escrevem no mesmo arquivo de log, então a rotação fica com o
+logrotate (LOG_ROTACAO=externa) em vez de cada worker rotacionar o seu.
+"""
+
+import os
+import shutil
+
+diretorio_metricas = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/treinorun-metricas")
+os.environ.setdefault("LOG_ROTACAO", "externa")
+
+
+def on_starting(server):
+    shutil.rmtree(diretorio_metricas, ignore_errors=True)
+    os.makedirs(diretorio_metricas, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Histograma simples em memória, por processo.
+
+Usado nas estatísticas do cliente do Mercado Pago (lidas pelo
+benchmarks/bench_mercadopago.py) para percentis aproximados sem depender do
+Prometheus.
+"""
+
+
+class Histograma:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.contagens = [0] * (len(buckets) + 1)
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        for i, limite in enumerate(self.buckets):
+            if valor <= limite:
+                self.contagens[i] += 1
+                break
+        else:
+            self.contagens[-1] += 1
+        self.soma += valor
+        self.total += 1
+
+    def percentil(self, p):
+        """Estimativa pelo limite superior do bucket que contém o percentil"""
+        if not self.total:
+            return 0.0
+        alvo = p / 100 * self.total
+        acumulado = 0
+        for i, contagem in enumerate(self.contagens):
+            acumulado += contagem
+            if acumulado >= alvo:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def exportar(self):
+        acumulado, buckets = 0, {}
+        for limite, contagem in zip(self.buckets + ("+Inf",), self.contagens):
+            acumulado += contagem
+            buckets[str(limite)] = acumulado
+        return {"buckets": buckets, "soma": round(self.soma, 4), "total": self.total}
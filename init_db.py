@@ -1,12 +1,138 @@
-from run import app, get_db
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Migrações versionadas do banco de dados.
+
+Cada arquivo migrations/NNNN_descricao.sql é aplicado uma única vez, em ordem
+de versão, dentro da própria transação, e fica registrado na tabela
+schema_migrations. Um advisory lock impede que dois processos (por exemplo
+dois deploys subindo juntos) apliquem migrações ao mesmo tempo.
+
+    python init_db.py            # aplica as migrações pendentes
+    python init_db.py --status   # lista aplicadas e pendentes
+"""
+
+import os
+import re
+import sys
+import hashlib
+import logging
+
+from sqlalchemy import create_engine, text
+
+from particoes import manter_particoes
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+PASTA_MIGRACOES = os.path.join(basedir, "migrations")
+
+# Identificador arbitrário do advisory lock das migrações
+LOCK_MIGRACOES = 727001
+
+
+def listar_migracoes():
+    """Retorna [(versao, nome, caminho)] ordenado pela versão"""
+    migracoes = []
+    for arquivo in os.listdir(PASTA_MIGRACOES):
+        match = re.match(r"^(\d+)_(.+)\.sql$", arquivo)
+        if match:
+            migracoes.append((int(match.group(1)), match.group(2), os.path.join(PASTA_MIGRACOES, arquivo)))
+
+    versoes = [m[0] for m in migracoes]
+    if len(versoes) != len(set(versoes)):
+        raise ValueError("Há mais de uma migração com a mesma versão")
+
+    return sorted(migracoes)
+
+
+def _checksum(sql):
+    return hashlib.sha256(sql.encode("utf-8")).hexdigest()
+
+
+def _garantir_tabela_controle(conn):
+    with conn.begin():
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                versao INTEGER PRIMARY KEY,
+                nome VARCHAR(255) NOT NULL,
+                checksum VARCHAR(64) NOT NULL,
+                aplicada_em TIMESTAMP NOT NULL DEFAULT NOW()
+            )
+        """))
+
+
+def _migracoes_aplicadas(conn):
+    with conn.begin():
+        return {
+            row.versao: row.checksum
+            for row in conn.execute(text("SELECT versao, checksum FROM schema_migrations"))
+        }
+
+
+def aplicar_migracoes(engine):
+    """Aplica as migrações pendentes e retorna a lista das versões aplicadas"""
+    aplicadas_agora = []
+
+    with engine.connect() as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": LOCK_MIGRACOES})
+        conn.commit()
+        try:
+            _garantir_tabela_controle(conn)
+            aplicadas = _migracoes_aplicadas(conn)
+
+            for versao, nome, caminho in listar_migracoes():
+                with open(caminho, encoding="utf-8") as f:
+                    sql = f.read()
+
+                if versao in aplicadas:
+                    if aplicadas[versao] != _checksum(sql):
+                        logging.warning(f"Migração {versao:04d}_{nome} foi alterada depois de aplicada")
+                    continue
+
+                logging.info(f"Aplicando migração {versao:04d}_{nome}...")
+                with conn.begin():
+                    # Direto no cursor e sem parâmetros, para o driver não
+                    # interpretar os % do SQL (format('%I') etc.)
+                    conn.connection.cursor().execute(sql)
+                    conn.execute(
+                        text("""
+                            INSERT INTO schema_migrations (versao, nome, checksum)
+                            VALUES (:versao, :nome, :checksum)
+                        """),
+                        {"versao": versao, "nome": nome, "checksum": _checksum(sql)}
+                    )
+                aplicadas_agora.append(versao)
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": LOCK_MIGRACOES})
+            conn.commit()
+
+    return aplicadas_agora
+
+
+def status_migracoes(engine):
+    with engine.connect() as conn:
+        _garantir_tabela_controle(conn)
+        aplicadas = _migracoes_aplicadas(conn)
+
+    for versao, nome, _ in listar_migracoes():
+        print(f"{'aplicada ' if versao in aplicadas else 'PENDENTE '} {versao:04d}_{nome}")
+
 
 def init_db():
-    with app.app_context():
-        db = get_db()
-        with app.open_resource("schema.sql", mode="r") as f:
-            db.execute(f.read())
-        db.commit()
-        print("Banco de dados inicializado com sucesso!")
+    engine = create_engine(os.getenv("DATABASE_URL"))
+    if "--status" in sys.argv:
+        status_migracoes(engine)
+        return
+
+    aplicadas = aplicar_migracoes(engine)
+    if aplicadas:
+        print(f"Banco de dados atualizado: {len(aplicadas)} migração(ões) aplicada(s).")
+    else:
+        print("Banco de dados já está atualizado.")
+
+    # A cada deploy garante as partições dos próximos meses
+    manter_particoes(engine)
+
 
 if __name__ == "__main__":
-    init_db()
\ No newline at end of file
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    init_db()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Rate limit em camadas: caminho rápido dentro do processo.
+
+Cada (rota, cliente) tem um token bucket local: capacidade igual ao limite
+e reposição contínua (100 per hour -> 1 token a cada 36 s). A decisão sai da
+memória, sem ida ao Redis.
+
+Para o limite continuar valendo entre processos, uma thread junta o consumo
+local e, a cada `intervalo`, manda tudo num único pipeline de INCRBY para
+contadores por janela fixa no Redis. O total devolvido é o consumo de todos
+os processos na janela, e o bucket local nunca fica com mais tokens do que o
+que resta no total. A folga é de no máximo um `intervalo` de requisições por
+processo, o que basta para páginas baratas. Rotas caras continuam no
+Flask-Limiter com moving-window exato no Redis.
+
+Sem Redis cada processo aplica o limite sozinho, como o storage memory://.
+"""
+
+import logging
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, request
+from limits import parse
+from werkzeug.exceptions import TooManyRequests
+
+from thread_processo import ThreadPorProcesso
+
+
+class _Balde:
+    __slots__ = ("capacidade", "taxa", "periodo", "tokens", "atualizado", "pendente")
+
+    def __init__(self, capacidade, periodo):
+        self.capacidade = capacidade
+        self.periodo = periodo
+        self.taxa = capacidade / periodo
+        self.tokens = float(capacidade)
+        self.atualizado = time.monotonic()
+        self.pendente = 0
+
+    def repor(self, agora):
+        self.tokens = min(self.capacidade, self.tokens + (agora - self.atualizado) * self.taxa)
+        self.atualizado = agora
+
+
+class LimitadorLocal:
+    def __init__(self, redis_client=None, chave=None, intervalo=1.0, prefixo="limite"):
+        self.redis = redis_client
+        self.chave = chave
+        self.intervalo = intervalo
+        self.prefixo = prefixo
+        self.ativo = True
+        self._baldes = {}
+        self._lock = threading.Lock()
+        self._thread = ThreadPorProcesso(self._loop, "limite-local")
+
+    def consumir(self, identificador, limite):
+        """Tenta consumir um token; retorna (permitido, segundos até o próximo token)"""
+        self._thread.garantir()
+        agora = time.monotonic()
+        with self._lock:
+            balde = self._baldes.get(identificador)
+            if balde is None:
+                balde = self._baldes[identificador] = _Balde(limite.amount, limite.get_expiry())
+            balde.repor(agora)
+            if balde.tokens >= 1:
+                balde.tokens -= 1
+                balde.pendente += 1
+                return True, 0
+            return False, (1 - balde.tokens) / balde.taxa
+
+    def sincronizar(self):
+        """Envia o consumo pendente ao Redis e ajusta os baldes ao total global.
+
+        Também descarta os baldes que já se encheram de novo.
+        """
+        agora = time.monotonic()
+        janela_atual = time.time()
+        with self._lock:
+            lote = []
+            for identificador, balde in list(self._baldes.items()):
+                balde.repor(agora)
+                # Balde cheio e sem consumo pendente: quem voltar começa com um novo
+                if balde.pendente == 0 and balde.tokens >= balde.capacidade:
+                    del self._baldes[identificador]
+                    continue
+                janela = int(janela_atual // balde.periodo)
+                lote.append((identificador, balde, janela, balde.pendente))
+                balde.pendente = 0
+
+        if not lote or self.redis is None:
+            return
+
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for identificador, balde, janela, pendente in lote:
+                chave = f"{self.prefixo}:{identificador}:{janela}"
+                pipe.incrby(chave, pendente)
+                pipe.expire(chave, int(balde.periodo) + 60)
+            totais = pipe.execute()[::2]
+        except Exception as e:
+            logging.warning(f"Falha ao sincronizar limites com o Redis: {e}")
+            with self._lock:
+                for _, balde, _, pendente in lote:
+                    balde.pendente += pendente
+            return
+
+        with self._lock:
+            for (_, balde, _, _), total in zip(lote, totais):
+                balde.tokens = min(balde.tokens, balde.capacidade - int(total))
+
+    def _loop(self):
+        while True:
+            time.sleep(self.intervalo)
+            try:
+                self.sincronizar()
+            except Exception as e:
+                logging.error(f"Erro no limite local: {e}")
+
+    def limitar(self, limite):
+        """Decorator de rota: limite no formato do Flask-Limiter ("100 per hour")"""
+        item = parse(limite)
+
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if self.ativo and current_app.config.get("RATELIMIT_ENABLED", True):
+                    identificador = f"{request.endpoint}:{item.amount}/{item.get_expiry()}:{self.chave()}"
+                    permitido, espera = self.consumir(identificador, item)
+                    if not permitido:
+                        raise TooManyRequests(retry_after=int(espera) + 1)
+                return func(*args, **kwargs)
+
+            # O Flask-Limiter consulta esta marca para não aplicar os limites padrão
+            wrapper.limite_local = limite
+            return wrapper
+
+        return decorator
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Configuração de logging sem I/O na thread da requisição.
+
+O logger raiz recebe só um QueueHandler: a chamada a logging.info/error
+apenas monta o registro (com request id, rota e método da requisição atual)
+e o coloca numa fila em memória. Um QueueListener em segundo plano formata
+em JSON (uma linha por registro) e escreve no console e num arquivo com
+rotação por tamanho ou diária.
+
+A rotação feita pelo próprio processo só é segura com um processo por
+arquivo: vários workers do gunicorn rotacionando o mesmo arquivo perdem ou
+sobrescrevem linhas. Com LOG_ROTACAO=externa (o padrão no gunicorn.conf.py)
+cada processo só acrescenta ao arquivo e o reabre quando o logrotate o move.
+
+Logs INFO/DEBUG podem ser amostrados (LOG_AMOSTRAGEM_INFO=0.1 mantém 10%);
+WARNING ou acima, e registros com extra={"sempre": True}, nunca são descartados.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+from datetime import datetime, timezone
+
+from flask import g, has_request_context, request
+
+# Atributos padrão de um LogRecord; o que vier além disso (extra=...) vai para o JSON
+_ATRIBUTOS_PADRAO = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class FormatadorJSON(logging.Formatter):
+    def format(self, record):
+        dados = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "nivel": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for chave, valor in vars(record).items():
+            if chave not in _ATRIBUTOS_PADRAO and chave != "sempre" and valor is not None:
+                dados[chave] = valor
+        if record.exc_text:
+            dados["exc"] = record.exc_text
+        return json.dumps(dados, ensure_ascii=False, default=str)
+
+
+class FiltroContexto(logging.Filter):
+    """Anexa request id, rota e método quando o log nasce dentro de uma requisição"""
+
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = g.get("request_id")
+            record.rota = request.url_rule.rule if request.url_rule else request.path
+            record.metodo = request.method
+        return True
+
+
+class FiltroAmostragem(logging.Filter):
+    def __init__(self, taxa=1.0):
+        super().__init__()
+        self.taxa = taxa
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self.taxa >= 1.0 or getattr(record, "sempre", False):
+            return True
+        return random.random() < self.taxa
+
+
+class QueueHandlerContexto(logging.handlers.QueueHandler):
+    """Resolve mensagem e traceback na origem, mas deixa a formatação para o listener"""
+
+    def prepare(self, record):
+        # O QueueHandler é o único handler do logger raiz, então dá para
+        # alterar o registro sem a cópia que o padrão faz
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_listener = None
+_lock = threading.Lock()
+
+
+def _criar_arquivo(caminho):
+    rotacao = os.getenv("LOG_ROTACAO", "tamanho")
+    if rotacao == "externa":
+        return logging.handlers.WatchedFileHandler(caminho, encoding="utf-8")
+    if rotacao == "diaria":
+        return logging.handlers.TimedRotatingFileHandler(
+            caminho, when="midnight", backupCount=int(os.getenv("LOG_BACKUPS", 7)), encoding="utf-8"
+        )
+    return logging.handlers.RotatingFileHandler(
+        caminho,
+        maxBytes=int(os.getenv("LOG_MAX_BYTES", 10 * 1024 * 1024)),
+        backupCount=int(os.getenv("LOG_BACKUPS", 5)),
+        encoding="utf-8"
+    )
+
+
+def _iniciar_listener(fila, handlers):
+    global _listener
+    with _lock:
+        _listener = logging.handlers.QueueListener(fila, *handlers, respect_handler_level=True)
+        _listener.start()
+
+
+def configurar_logs(arquivo="treinorun.log", nivel=logging.INFO):
+    """Troca os handlers do logger raiz pelo QueueHandler + listener em segundo plano"""
+    fila = queue.SimpleQueue()
+    formatador = FormatadorJSON()
+
+    handlers = [logging.StreamHandler()]
+    if arquivo:
+        handlers.append(_criar_arquivo(arquivo))
+    for handler in handlers:
+        handler.setFormatter(formatador)
+
+    handler_fila = QueueHandlerContexto(fila)
+    # Amostragem primeiro: registro descartado não paga pelo contexto
+    handler_fila.addFilter(FiltroAmostragem(float(os.getenv("LOG_AMOSTRAGEM_INFO", 1.0))))
+    handler_fila.addFilter(FiltroContexto())
+
+    raiz = logging.getLogger()
+    for antigo in list(raiz.handlers):
+        raiz.removeHandler(antigo)
+    raiz.addHandler(handler_fila)
+    raiz.setLevel(nivel)
+
+    _iniciar_listener(fila, handlers)
+    # A thread do listener não sobrevive ao fork do gunicorn: cada worker sobe a sua
+    os.register_at_fork(after_in_child=lambda: _iniciar_listener(fila, handlers))
+    atexit.register(parar_logs)
+
+
+def parar_logs():
+    """Descarrega o que está na fila; útil em scripts e no encerramento"""
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Métricas no formato do Prometheus, expostas em /metrics (e, no worker.py,
+numa porta própria com METRICAS_PORTA).
+
+Com vários processos os valores ficam em arquivos mmap no diretório
+PROMETHEUS_MULTIPROC_DIR, que o gunicorn.conf.py define e limpa ao subir; a
+coleta soma todos os processos vivos. Sem a variável (waitress, scripts)
+cada processo expõe só os próprios números.
+
+Para ver localmente:
+    gunicorn run:app --workers 2 --worker-class gthread
+    curl localhost:8000/metrics
+
+Razões de acerto dos caches saem das contagens, por exemplo:
+    sum by (cache) (rate(treinorun_cache_consultas_total{resultado!="falta"}[5m]))
+      / sum by (cache) (rate(treinorun_cache_consultas_total[5m]))
+
+e quantis dos histogramas, somados entre processos, no PromQL:
+    histogram_quantile(0.99, sum by (le) (rate(treinorun_db_espera_conexao_segundos_bucket[5m])))
+"""
+
+import os
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+    generate_latest, multiprocess, start_http_server
+)
+
+BUCKETS_HTTP = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BUCKETS_EXTERNOS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+BUCKETS_DB = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1, 5)
+BUCKETS_RETENCAO = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300)
+
+# ================================================
+# HTTP
+# ================================================
+
+http_latencia = Histogram(
+    "treinorun_http_requisicao_segundos", "Latência das requisições por rota",
+    ["rota", "metodo", "status"], buckets=BUCKETS_HTTP
+)
+limite_rejeicoes = Counter(
+    "treinorun_limite_rejeicoes", "Requisições barradas pelo rate limit",
+    ["camada", "rota"]
+)
+
+# ================================================
+# SERVIÇOS EXTERNOS
+# ================================================
+
+openai_latencia = Histogram(
+    "treinorun_openai_segundos", "Duração das chamadas à OpenAI",
+    ["modelo", "resultado"], buckets=BUCKETS_EXTERNOS
+)
+openai_tokens = Counter(
+    "treinorun_openai_tokens", "Tokens consumidos na OpenAI",
+    ["modelo", "tipo"]
+)
+geracoes_locais = Counter(
+    "treinorun_geracoes_locais", "Planos feitos pelo motor local, por motivo",
+    ["motivo"]
+)
+cotas_geracao = Counter(
+    "treinorun_cotas_geracao", "Reservas de cota de geração, por plano e resultado",
+    ["plano", "resultado"]
+)
+mercadopago_latencia = Histogram(
+    "treinorun_mercadopago_segundos", "Duração de cada tentativa de chamada ao Mercado Pago",
+    ["operacao", "resultado"], buckets=BUCKETS_EXTERNOS
+)
+smtp_envio = Histogram(
+    "treinorun_smtp_envio_segundos", "Tempo de envio de cada e-mail pela conexão SMTP",
+    ["resultado"], buckets=BUCKETS_EXTERNOS
+)
+smtp_conexoes = Counter("treinorun_smtp_conexoes", "Conexões SMTP abertas pelo remetente (inclui reconexões)")
+
+# ================================================
+# BANCO E CACHES
+# ================================================
+
+db_consulta = Histogram(
+    "treinorun_db_consulta_segundos", "Duração das consultas ao banco",
+    ["operacao"], buckets=BUCKETS_DB
+)
+db_espera_conexao = Histogram(
+    "treinorun_db_espera_conexao_segundos", "Espera por uma conexão livre no pool",
+    buckets=BUCKETS_DB
+)
+db_retencao_conexao = Histogram(
+    "treinorun_db_retencao_conexao_segundos", "Por quanto tempo cada conexão ficou retirada do pool",
+    buckets=BUCKETS_RETENCAO
+)
+db_conexoes_em_uso = Gauge(
+    "treinorun_db_conexoes_em_uso", "Conexões do pool retiradas no momento",
+    multiprocess_mode="livesum"
+)
+db_pool_tamanho = Gauge(
+    "treinorun_db_pool_tamanho", "Conexões fixas (pool_size) dos pools", multiprocess_mode="livesum"
+)
+db_pool_disponiveis = Gauge(
+    "treinorun_db_pool_disponiveis", "Conexões abertas e livres nos pools", multiprocess_mode="livesum"
+)
+db_pool_overflow = Gauge(
+    "treinorun_db_pool_overflow", "Conexões abertas além do pool_size (max_overflow)", multiprocess_mode="livesum"
+)
+db_timeouts_pool = Counter("treinorun_db_timeouts_pool", "Pedidos de conexão que estouraram o pool_timeout")
+db_retencoes_longas = Counter("treinorun_db_retencoes_longas", "Conexões retiradas além do limite de retenção")
+
+gravador_linhas = Counter(
+    "treinorun_gravador_linhas", "Linhas dos gravadores em lote, gravadas ou perdidas",
+    ["tabela", "resultado"]
+)
+
+cache_consultas = Counter(
+    "treinorun_cache_consultas", "Consultas aos caches por resultado",
+    ["cache", "resultado"]
+)
+cache_descartes_reuso = Counter(
+    "treinorun_cache_descartes_reuso", "Entradas descartadas por passar do limite de reusos",
+    ["cache"]
+)
+
+
+def registro():
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        coletor = CollectorRegistry()
+        multiprocess.MultiProcessCollector(coletor)
+        return coletor
+    return REGISTRY
+
+
+def gerar():
+    """(corpo, content type) da coleta atual"""
+    return generate_latest(registro()), CONTENT_TYPE_LATEST
+
+
+def iniciar_servidor(porta):
+    """Servidor HTTP só de métricas, para processos sem Flask (worker.py)"""
+    start_http_server(porta, registry=registro())
@@ -24,4 +24,4 @@ CREATE TABLE IF NOT EXISTS assinaturas (
     subscription_id VARCHAR(255) NOT NULL,
     status VARCHAR(50) NOT NULL,
     data_atualizacao TIMESTAMP NOT NULL
-);
\ No newline at end of file
+);
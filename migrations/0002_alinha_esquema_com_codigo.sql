@@ -0,0 +1,26 @@
+-- Colunas e tabelas usadas pelo run.py que não existiam no schema.sql original
+
+ALTER TABLE usuarios ADD COLUMN IF NOT EXISTS nome VARCHAR(255);
+
+ALTER TABLE geracoes ADD COLUMN IF NOT EXISTS tipo_plano VARCHAR(50);
+
+ALTER TABLE assinaturas ADD COLUMN IF NOT EXISTS usuario_id INTEGER REFERENCES usuarios(id);
+
+-- processar_pagamento grava data_pagamento, não data_atualizacao
+ALTER TABLE pagamentos ADD COLUMN IF NOT EXISTS data_pagamento TIMESTAMP;
+ALTER TABLE pagamentos ALTER COLUMN data_atualizacao SET DEFAULT NOW();
+
+CREATE TABLE IF NOT EXISTS tentativas_pagamento (
+    id SERIAL PRIMARY KEY,
+    email VARCHAR(255) NOT NULL,
+    data_tentativa TIMESTAMP NOT NULL DEFAULT NOW(),
+    tipo VARCHAR(20) NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS logs_webhook (
+    id SERIAL PRIMARY KEY,
+    data_recebimento TIMESTAMP NOT NULL DEFAULT NOW(),
+    payload TEXT,
+    status_processamento VARCHAR(50) NOT NULL,
+    mensagem_erro TEXT
+);
@@ -0,0 +1,32 @@
+-- Fila de jobs (fila.py) e planos gerados guardados no servidor
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id UUID PRIMARY KEY,
+    tipo VARCHAR(50) NOT NULL,
+    payload JSONB NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pendente',
+    tentativas INTEGER NOT NULL DEFAULT 0,
+    max_tentativas INTEGER NOT NULL DEFAULT 5,
+    disponivel_em TIMESTAMP NOT NULL DEFAULT NOW(),
+    reservado_em TIMESTAMP,
+    resultado JSONB,
+    erro TEXT,
+    criado_em TIMESTAMP NOT NULL DEFAULT NOW(),
+    atualizado_em TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_jobs_pendentes
+    ON jobs (disponivel_em)
+    WHERE status = 'pendente';
+
+CREATE TABLE IF NOT EXISTS planos (
+    id UUID PRIMARY KEY,
+    email VARCHAR(255) NOT NULL,
+    tipo_plano VARCHAR(20) NOT NULL,
+    titulo VARCHAR(255) NOT NULL,
+    conteudo TEXT NOT NULL,
+    criado_em TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_planos_email
+    ON planos (email, criado_em DESC);
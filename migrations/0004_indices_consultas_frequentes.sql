@@ -0,0 +1,33 @@
+-- Índices das consultas frequentes e restrições exigidas pelos upserts
+
+-- Última geração / gerações recentes de um usuário
+CREATE INDEX IF NOT EXISTS idx_geracoes_usuario_data
+    ON geracoes (usuario_id, data_geracao DESC);
+
+-- Última assinatura do usuário (ORDER BY id DESC LIMIT 1)
+CREATE INDEX IF NOT EXISTS idx_assinaturas_usuario_id
+    ON assinaturas (usuario_id, id DESC);
+
+-- ON CONFLICT (payment_id) / (subscription_id) precisam de índice único;
+-- remove duplicatas antigas mantendo o registro mais recente
+DELETE FROM pagamentos p
+USING pagamentos mais_novo
+WHERE p.payment_id = mais_novo.payment_id
+  AND p.id < mais_novo.id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_pagamentos_payment_id
+    ON pagamentos (payment_id);
+
+DELETE FROM assinaturas a
+USING assinaturas mais_nova
+WHERE a.subscription_id = mais_nova.subscription_id
+  AND a.id < mais_nova.id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_assinaturas_subscription_id
+    ON assinaturas (subscription_id);
+
+CREATE INDEX IF NOT EXISTS idx_tentativas_pagamento_email
+    ON tentativas_pagamento (email, data_tentativa DESC);
+
+CREATE INDEX IF NOT EXISTS idx_logs_webhook_data
+    ON logs_webhook (data_recebimento);
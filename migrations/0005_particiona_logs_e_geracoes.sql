@@ -0,0 +1,90 @@
+-- logs_webhook e geracoes passam a ser particionadas por mês (RANGE na data).
+-- Inserções ficam sempre na partição do mês corrente, e dados antigos saem
+-- com DETACH/DROP de uma partição inteira em vez de DELETEs longos.
+-- As partições futuras e a retenção são mantidas por particoes.py.
+
+CREATE OR REPLACE FUNCTION criar_particao_mensal(tabela TEXT, mes DATE) RETURNS TEXT AS $$
+DECLARE
+    inicio DATE := date_trunc('month', mes);
+    nome TEXT := tabela || '_' || to_char(inicio, 'YYYY_MM');
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+        nome, tabela, inicio, (inicio + INTERVAL '1 month')::DATE
+    );
+    RETURN nome;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE SCHEMA IF NOT EXISTS arquivo;
+
+-- ================================================
+-- logs_webhook
+-- ================================================
+
+ALTER TABLE logs_webhook RENAME TO logs_webhook_antigo;
+ALTER TABLE logs_webhook_antigo RENAME CONSTRAINT logs_webhook_pkey TO logs_webhook_antigo_pkey;
+DROP INDEX IF EXISTS idx_logs_webhook_data;
+
+CREATE TABLE logs_webhook (
+    id INTEGER NOT NULL DEFAULT nextval('logs_webhook_id_seq'),
+    data_recebimento TIMESTAMP NOT NULL DEFAULT NOW(),
+    payload TEXT,
+    status_processamento VARCHAR(50) NOT NULL,
+    mensagem_erro TEXT,
+    PRIMARY KEY (id, data_recebimento)
+) PARTITION BY RANGE (data_recebimento);
+
+-- Rede de segurança: linhas fora das partições mensais não falham
+CREATE TABLE logs_webhook_padrao PARTITION OF logs_webhook DEFAULT;
+
+SELECT criar_particao_mensal('logs_webhook', mes::DATE)
+FROM generate_series(
+    date_trunc('month', COALESCE((SELECT MIN(data_recebimento) FROM logs_webhook_antigo), NOW())),
+    date_trunc('month', NOW()) + INTERVAL '3 months',
+    INTERVAL '1 month'
+) AS mes;
+
+INSERT INTO logs_webhook (id, data_recebimento, payload, status_processamento, mensagem_erro)
+SELECT id, data_recebimento, payload, status_processamento, mensagem_erro
+FROM logs_webhook_antigo;
+
+ALTER SEQUENCE logs_webhook_id_seq OWNED BY logs_webhook.id;
+DROP TABLE logs_webhook_antigo;
+
+CREATE INDEX idx_logs_webhook_data ON logs_webhook (data_recebimento);
+
+-- ================================================
+-- geracoes
+-- ================================================
+
+ALTER TABLE geracoes RENAME TO geracoes_antigo;
+ALTER TABLE geracoes_antigo RENAME CONSTRAINT geracoes_pkey TO geracoes_antigo_pkey;
+ALTER TABLE geracoes_antigo RENAME CONSTRAINT geracoes_usuario_id_fkey TO geracoes_antigo_usuario_id_fkey;
+DROP INDEX IF EXISTS idx_geracoes_usuario_data;
+
+CREATE TABLE geracoes (
+    id INTEGER NOT NULL DEFAULT nextval('geracoes_id_seq'),
+    usuario_id INTEGER NOT NULL REFERENCES usuarios(id),
+    data_geracao TIMESTAMP NOT NULL,
+    tipo_plano VARCHAR(50),
+    PRIMARY KEY (id, data_geracao)
+) PARTITION BY RANGE (data_geracao);
+
+CREATE TABLE geracoes_padrao PARTITION OF geracoes DEFAULT;
+
+SELECT criar_particao_mensal('geracoes', mes::DATE)
+FROM generate_series(
+    date_trunc('month', COALESCE((SELECT MIN(data_geracao) FROM geracoes_antigo), NOW())),
+    date_trunc('month', NOW()) + INTERVAL '3 months',
+    INTERVAL '1 month'
+) AS mes;
+
+INSERT INTO geracoes (id, usuario_id, data_geracao, tipo_plano)
+SELECT id, usuario_id, data_geracao, tipo_plano
+FROM geracoes_antigo;
+
+ALTER SEQUENCE geracoes_id_seq OWNED BY geracoes.id;
+DROP TABLE geracoes_antigo;
+
+CREATE INDEX idx_geracoes_usuario_data ON geracoes (usuario_id, data_geracao DESC);
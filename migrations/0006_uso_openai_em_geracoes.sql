@@ -0,0 +1,11 @@
+-- Uso da OpenAI por geração: tipo de treino (corrida/pace), modelo, tokens e
+-- latência, para acompanhar custo e tempo por tipo de plano. Ficam nulos
+-- quando o plano veio do cache, sem chamada à OpenAI.
+-- Na tabela particionada o ALTER vale para todas as partições.
+
+ALTER TABLE geracoes
+    ADD COLUMN IF NOT EXISTS tipo_treino VARCHAR(20),
+    ADD COLUMN IF NOT EXISTS modelo VARCHAR(50),
+    ADD COLUMN IF NOT EXISTS tokens_prompt INTEGER,
+    ADD COLUMN IF NOT EXISTS tokens_completion INTEGER,
+    ADD COLUMN IF NOT EXISTS latencia_ms INTEGER;
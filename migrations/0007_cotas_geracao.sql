@@ -0,0 +1,13 @@
+-- Cota de gerações por usuário (cotas.py): início da janela atual e quantas
+-- gerações já foram reservadas nela. A reserva é um UPDATE condicional nessas
+-- colunas, sem a leitura de ultima_geracao seguida de escrita.
+
+ALTER TABLE usuarios
+    ADD COLUMN IF NOT EXISTS cota_inicio TIMESTAMP,
+    ADD COLUMN IF NOT EXISTS cota_usada INTEGER NOT NULL DEFAULT 0;
+
+-- Mantém a regra antiga para quem já existe: a janela começa na última
+-- geração, então o gratuito continua bloqueado até completar 30 dias
+UPDATE usuarios
+SET cota_inicio = ultima_geracao, cota_usada = 1
+WHERE cota_inicio IS NULL AND ultima_geracao IS NOT NULL;
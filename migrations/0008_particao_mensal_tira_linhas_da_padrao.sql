@@ -0,0 +1,51 @@
+-- criar_particao_mensal passa a aceitar linhas do mês já gravadas na partição
+-- padrão (quando a manutenção não rodou a tempo). Antes o CREATE ... PARTITION
+-- OF falhava porque a padrão tinha linhas no intervalo, e isso abortava o
+-- init_db do deploy. Agora a partição é criada solta, recebe as linhas do mês
+-- tiradas da padrão e só então é anexada, tudo na mesma transação.
+
+CREATE OR REPLACE FUNCTION criar_particao_mensal(tabela TEXT, mes DATE) RETURNS TEXT AS $$
+DECLARE
+    inicio DATE := date_trunc('month', mes);
+    fim DATE := (date_trunc('month', mes) + INTERVAL '1 month')::DATE;
+    nome TEXT := tabela || '_' || to_char(inicio, 'YYYY_MM');
+    padrao TEXT;
+    coluna TEXT;
+    colunas TEXT;
+BEGIN
+    IF to_regclass(quote_ident(nome)) IS NOT NULL THEN
+        RETURN nome;
+    END IF;
+
+    SELECT c.relname, a.attname
+    INTO padrao, coluna
+    FROM pg_partitioned_table p
+    JOIN pg_attribute a ON a.attrelid = p.partrelid AND a.attnum = p.partattrs[0]
+    LEFT JOIN pg_class c ON c.oid = p.partdefid
+    WHERE p.partrelid = tabela::regclass;
+
+    EXECUTE format(
+        'CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+        nome, tabela
+    );
+
+    IF padrao IS NOT NULL THEN
+        SELECT string_agg(quote_ident(attname), ', ' ORDER BY attnum)
+        INTO colunas
+        FROM pg_attribute
+        WHERE attrelid = tabela::regclass AND attnum > 0 AND NOT attisdropped;
+
+        EXECUTE format(
+            'WITH movidas AS (DELETE FROM %I WHERE %I >= %L AND %I < %L RETURNING %s) '
+            'INSERT INTO %I (%s) SELECT %s FROM movidas',
+            padrao, coluna, inicio, coluna, fim, colunas, nome, colunas, colunas
+        );
+    END IF;
+
+    EXECUTE format(
+        'ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+        tabela, nome, inicio, fim
+    );
+    RETURN nome;
+END
+$$ LANGUAGE plpgsql;
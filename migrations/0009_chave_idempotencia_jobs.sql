@@ -0,0 +1,10 @@
+-- Chave de idempotência opcional por job (fila.py). Um job enfileirado com a
+-- mesma chave de outro já existente não é criado de novo: o webhook do
+-- Mercado Pago pode ser reprocessado (nova tentativa da fila ou reenvio da
+-- mesma notificação) e o e-mail de confirmação do pagamento sai uma vez só.
+
+ALTER TABLE jobs ADD COLUMN IF NOT EXISTS chave VARCHAR(255);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_chave
+    ON jobs (chave)
+    WHERE chave IS NOT NULL;
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Motor local de planos: periodização por regras, sem chamar a OpenAI.
+
+Recebe os mesmos campos do formulário (objetivo, nível, dias, tempo) e as
+semanas de calcular_semanas e monta o plano semana a semana em poucos
+milissegundos, sempre igual para as mesmas entradas:
+
+- as fases (base, construção, pico, polimento) vêm de geracao_blocos, as
+  mesmas da geração em blocos;
+- a carga sobe dentro de cada fase, com uma semana mais leve a cada quatro,
+  e cai no polimento;
+- cada semana distribui os dias entre treinos de qualidade, rodagens,
+  regenerativos e o longão, conforme o nível e o tipo de plano;
+- o plano de pace usa o pace atual e o alvo citados no objetivo ("de 6:30
+  para 5:30 min/km"), quando houver, e marca testes de pace periódicos.
+
+O texto segue o formato pedido à OpenAI ("Semana N" em cada semana), então
+o resto da aplicação (PDF, e-mail, costura dos blocos) trata os dois igual.
+"""
+
+import re
+import unicodedata
+
+from geracao_blocos import dividir_em_blocos
+from roteamento_modelos import dias_por_semana
+
+TEMPO_PADRAO = 45
+TEMPO_MINIMO = 20
+TEMPO_MAXIMO = 240
+
+# Carga (fração do tempo disponível) no início e no fim de cada fase
+CARGA_FASES = {
+    "base": (0.7, 0.85),
+    "construção": (0.85, 1.0),
+    "pico": (1.0, 1.0),
+    "polimento": (0.75, 0.6),
+    "completo": (0.8, 1.0),
+}
+CARGA_SEMANA_LEVE = 0.8
+
+# Treinos de cada semana pelo número de dias, do primeiro ao último dia
+SEMANAS_TIPO = {
+    1: ["longao"],
+    2: ["qualidade", "longao"],
+    3: ["qualidade", "leve", "longao"],
+    4: ["qualidade", "leve", "ritmo", "longao"],
+    5: ["qualidade", "leve", "ritmo", "regenerativo", "longao"],
+    6: ["qualidade", "leve", "ritmo", "regenerativo", "leve", "longao"],
+    7: ["qualidade", "leve", "ritmo", "regenerativo", "leve", "regenerativo", "longao"],
+}
+
+# Duração de cada treino em relação ao tempo disponível
+PROPORCAO_TREINO = {"qualidade": 1.0, "ritmo": 1.0, "leve": 0.8, "regenerativo": 0.5, "longao": 1.4}
+
+ESFORCO = {
+    "leve": "ritmo confortável, dá para conversar",
+    "moderado": "ritmo moderado, dá para falar frases curtas",
+    "forte": "ritmo forte, só algumas palavras",
+}
+
+# Tiro e recuperação (minutos) dos intervalados da fase de construção, por nível
+INTERVALOS = {"iniciante": (2, 2), "intermediario": (3, 1.5), "avancado": (4, 2)}
+
+
+def _sem_acentos(texto):
+    return unicodedata.normalize("NFKD", str(texto)).encode("ascii", "ignore").decode().lower().strip()
+
+
+def nivel_normalizado(nivel):
+    nivel = _sem_acentos(nivel)
+    for conhecido in INTERVALOS:
+        if nivel.startswith(conhecido[:5]):
+            return conhecido
+    return "intermediario"
+
+
+def tempo_disponivel(tempo):
+    numeros = re.findall(r"\d+", str(tempo))
+    if not numeros:
+        return TEMPO_PADRAO
+    return min(max(int(numeros[0]), TEMPO_MINIMO), TEMPO_MAXIMO)
+
+
+def distancia_objetivo(objetivo):
+    """Distância da prova em km citada no objetivo, ou None"""
+    objetivo = _sem_acentos(objetivo)
+    if "meia" in objetivo:
+        return 21.1
+    if "maratona" in objetivo:
+        return 42.2
+    encontrado = re.search(r"(\d+(?:[.,]\d+)?)\s*(?:k\b|km)", objetivo)
+    return float(encontrado.group(1).replace(",", ".")) if encontrado else None
+
+
+def _pace_em_segundos(valor):
+    minutos, _, segundos = re.sub(r"[,.'h]", ":", valor).partition(":")
+    segundos = (segundos + "0")[:2] if segundos else "0"
+    return int(minutos) * 60 + int(segundos)
+
+
+def paces_objetivo(objetivo):
+    """(pace atual, pace alvo) em segundos por km citados no objetivo; cada um pode ser None"""
+    objetivo = _sem_acentos(objetivo)
+    pace = r"(\d{1,2}(?:[:,.'h]\d{1,2})?)"
+    atual = re.search(r"\bde\s+" + pace, objetivo)
+    alvo = re.search(r"\bpara\s+" + pace, objetivo)
+    if not alvo:
+        alvo = re.search(pace + r"\s*(?:min)?\s*/\s*km", objetivo)
+    return (
+        _pace_em_segundos(atual.group(1)) if atual else None,
+        _pace_em_segundos(alvo.group(1)) if alvo else None,
+    )
+
+
+def formatar_pace(segundos):
+    return f"{segundos // 60}:{segundos % 60:02d} min/km"
+
+
+def _arredondar(minutos, minimo=15):
+    return max(minimo, int(round(minutos / 5.0)) * 5)
+
+
+class _Contexto:
+    """Entradas já interpretadas, usadas por todos os treinos do plano"""
+
+    def __init__(self, tipo_plano, dados, semanas):
+        self.tipo_plano = tipo_plano
+        self.objetivo = str(dados.get("objetivo", "")).strip()
+        self.nivel = nivel_normalizado(dados.get("nivel", ""))
+        self.dias = dias_por_semana(dados.get("dias", ""))
+        self.tempo = tempo_disponivel(dados.get("tempo", ""))
+        self.semanas = semanas
+        self.distancia = distancia_objetivo(self.objetivo)
+        self.pace_atual, self.pace_alvo = paces_objetivo(self.objetivo) if tipo_plano == "pace" else (None, None)
+
+    def pace_da_semana(self, semana):
+        """Pace de referência dos treinos fortes, indo do atual ao alvo ao longo do plano"""
+        if self.pace_alvo is None:
+            return None
+        if self.pace_atual is None or self.pace_atual <= self.pace_alvo or self.semanas <= 1:
+            return self.pace_alvo
+        progresso = (semana - 1) / (self.semanas - 1)
+        return int(round(self.pace_atual - (self.pace_atual - self.pace_alvo) * progresso))
+
+    def ritmo_forte(self, semana):
+        pace = self.pace_da_semana(semana)
+        return f"pace de {formatar_pace(pace)}" if pace else ESFORCO["forte"]
+
+    def ritmo_prova(self, semana):
+        pace = self.pace_da_semana(semana)
+        if pace:
+            return f"pace alvo de {formatar_pace(pace)}"
+        return "ritmo de prova" + (f" dos {self._distancia_texto()}" if self.distancia else "")
+
+    def _distancia_texto(self):
+        return f"{self.distancia:g} km".replace(".", ",")
+
+
+def _carga(fase, posicao, tamanho_fase, semana, ultima_semana):
+    inicio, fim = CARGA_FASES.get(fase, CARGA_FASES["completo"])
+    carga = inicio if tamanho_fase <= 1 else inicio + (fim - inicio) * posicao / (tamanho_fase - 1)
+    # Semana de recuperação a cada quatro, fora do polimento e da última
+    if semana % 4 == 0 and fase != "polimento" and semana != ultima_semana:
+        return carga * CARGA_SEMANA_LEVE, True
+    return carga, False
+
+
+def _treino_qualidade(ctx, fase, semana, minutos):
+    aquecimento = 10 if ctx.nivel == "iniciante" else 15
+    desaquecimento = 5 if ctx.nivel == "iniciante" else 10
+    principal = max(minutos - aquecimento - desaquecimento, 10)
+
+    if fase == "base":
+        if ctx.nivel == "iniciante" and semana <= 2:
+            series = max(principal // 3, 3)
+            nome, descricao = "Corrida e caminhada", f"{series} x (2 min correndo leve + 1 min caminhando)"
+        else:
+            series = max(principal // 3, 3)
+            nome, descricao = "Fartlek", f"{series} x (1 min em {ESFORCO['moderado']} + 2 min leve)"
+    elif fase in ("construção", "completo"):
+        tiro, recuperacao = INTERVALOS[ctx.nivel]
+        series = max(int(principal // (tiro + recuperacao)), 3)
+        nome = "Intervalado"
+        descricao = f"{series} x {tiro} min em {ctx.ritmo_forte(semana)}, com {recuperacao:g} min de trote entre os tiros"
+    elif fase == "pico":
+        bloco = 6 if ctx.nivel == "iniciante" else 10
+        series = max(int(principal // (bloco + 2)), 2)
+        nome = "Ritmo de prova"
+        descricao = f"{series} x {bloco} min em {ctx.ritmo_prova(semana)}, com 2 min leves entre os blocos"
+    else:
+        nome = "Estímulo curto"
+        descricao = f"4 x 2 min em {ctx.ritmo_prova(semana)}, com 2 min leves; o resto em ritmo leve"
+
+    return nome, (
+        f"aquecimento de {aquecimento} min leve + educativos; {descricao}; "
+        f"desaquecimento de {desaquecimento} min"
+    )
+
+
+def _treino(ctx, tipo, fase, semana, minutos):
+    if tipo == "qualidade":
+        return _treino_qualidade(ctx, fase, semana, minutos)
+    if tipo == "ritmo":
+        continuo = _arredondar(minutos * 0.5, minimo=10)
+        return "Contínuo moderado", (
+            f"10 min leve; {continuo} min contínuos em {ESFORCO['moderado']}; o restante leve"
+        )
+    if tipo == "regenerativo":
+        return "Regenerativo", "corrida muito leve (ou caminhada rápida) e alongamento ao final"
+    if tipo == "longao":
+        return "Longão", f"contínuo em {ESFORCO['leve']}, sem forçar o ritmo; hidrate-se durante"
+    return "Rodagem leve", f"contínuo em {ESFORCO['leve']}"
+
+
+def _teste(ctx, semana, ultima_semana):
+    """Treino de teste que substitui o de qualidade em algumas semanas, ou None"""
+    if semana == ultima_semana:
+        if ctx.tipo_plano == "pace":
+            alvo = f" ({formatar_pace(ctx.pace_alvo)})" if ctx.pace_alvo else ""
+            return "Teste do pace alvo", f"aquecimento de 15 min; teste no pace alvo{alvo}; desaquecimento de 10 min"
+        alvo = ctx.objetivo or "objetivo do plano"
+        return "Teste do objetivo", f"aquecimento de 15 min leve; {alvo}; desaquecimento de 10 min"
+    if ctx.tipo_plano == "pace" and semana % 4 == 3:
+        return "Teste de pace", "aquecimento de 15 min; 3 km no melhor ritmo sustentável (anote o pace); desaquecimento de 10 min"
+    return None
+
+
+def _semana(ctx, fase, semana, carga, leve, ultima_semana):
+    tipos = list(SEMANAS_TIPO[ctx.dias])
+    # Iniciante faz um único treino de qualidade por semana
+    if ctx.nivel == "iniciante":
+        tipos = ["leve" if t == "ritmo" else t for t in tipos]
+    # Plano de pace: o foco é o ritmo, então o longão fica menor e o contínuo, presente
+    if ctx.tipo_plano == "pace" and ctx.dias >= 3 and "ritmo" not in tipos and ctx.nivel != "iniciante":
+        tipos[1] = "ritmo"
+
+    teste = _teste(ctx, semana, ultima_semana)
+    titulo = f"Semana {semana} ({fase}, carga de {int(round(carga * 100))}%{', semana de recuperação' if leve else ''})"
+    linhas = [titulo]
+    for dia, tipo in enumerate(tipos, start=1):
+        proporcao = PROPORCAO_TREINO[tipo]
+        if tipo == "longao" and ctx.tipo_plano == "pace":
+            proporcao = 1.2
+        minutos = _arredondar(min(ctx.tempo * proporcao * carga, ctx.tempo * 1.5))
+        if teste and tipo == "qualidade":
+            nome, descricao = teste
+        else:
+            nome, descricao = _treino(ctx, tipo, fase, semana, minutos)
+        linhas.append(f"- Dia {dia} – {nome} ({minutos} min): {descricao}")
+    return "\n".join(linhas)
+
+
+def gerar_plano_local(tipo_plano, dados, semanas):
+    """Plano completo de `semanas` semanas para os dados do formulário"""
+    ctx = _Contexto(tipo_plano, dados, semanas)
+    # Um bloco por fase: aqui só interessa onde cada fase começa e termina
+    blocos = dividir_em_blocos(semanas, max_semanas_bloco=max(semanas, 1))
+
+    descricao_tipo = "melhoria de pace" if tipo_plano == "pace" else "corrida"
+    partes = [
+        f"Plano de {descricao_tipo} de {semanas} semana(s) – {ctx.objetivo or 'objetivo não informado'}\n"
+        f"Nível {dados.get('nivel', '')}, {ctx.dias} dia(s) por semana, até {ctx.tempo} min por treino."
+    ]
+    if ctx.pace_alvo:
+        inicio = f" saindo de {formatar_pace(ctx.pace_atual)}" if ctx.pace_atual else ""
+        partes.append(f"Pace alvo: {formatar_pace(ctx.pace_alvo)}{inicio}; os treinos fortes avançam aos poucos até ele.")
+
+    for bloco in blocos:
+        if len(blocos) > 1:
+            partes.append(f"Fase de {bloco.fase}: {bloco.foco}")
+        tamanho = bloco.fim - bloco.inicio + 1
+        for posicao, semana in enumerate(range(bloco.inicio, bloco.fim + 1)):
+            carga, leve = _carga(bloco.fase, posicao, tamanho, semana, semanas)
+            partes.append(_semana(ctx, bloco.fase, semana, carga, leve, semanas))
+
+    partes.append(
+        "Observações: respeite os dias de descanso entre os treinos fortes, "
+        "reduza a carga se sentir dores e faça uma avaliação médica antes de começar."
+    )
+    return "\n\n".join(partes)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Manutenção das tabelas particionadas por mês (logs_webhook e geracoes).
+
+- Cria com antecedência as partições dos próximos meses, para as inserções
+  nunca caírem na partição padrão.
+- Aplica a retenção: partições mais antigas que o limite são desanexadas
+  (DETACH, uma operação de metadados) e então movidas para o schema
+  `arquivo` ou descartadas, conforme RETENCAO_ACAO. Nada de DELETE longo.
+
+Roda no worker.py ou nos WORKERS_EMBUTIDOS do processo web (a cada
+RETENCAO_INTERVALO) e no init_db, e também avulso:
+    python particoes.py
+"""
+
+import logging
+import os
+import re
+import threading
+from datetime import date
+
+from sqlalchemy import create_engine, text
+
+# Identificador arbitrário do advisory lock da manutenção
+LOCK_PARTICOES = 727002
+
+MESES_A_FRENTE = 3
+
+# tabela -> meses mantidos na tabela principal
+RETENCAO_MESES = {
+    "logs_webhook": int(os.getenv("RETENCAO_LOGS_WEBHOOK_MESES", 6)),
+    "geracoes": int(os.getenv("RETENCAO_GERACOES_MESES", 24)),
+}
+
+# "arquivar" move a partição para o schema arquivo; "descartar" faz DROP
+RETENCAO_ACAO = os.getenv("RETENCAO_ACAO", "arquivar")
+
+
+def _somar_meses(dia, meses):
+    total = dia.year * 12 + dia.month - 1 + meses
+    return date(total // 12, total % 12 + 1, 1)
+
+
+def listar_particoes(conn, tabela):
+    """Retorna [(nome, primeiro_dia_do_mes)] das partições mensais da tabela"""
+    nomes = conn.execute(
+        text("""
+            SELECT c.relname
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = CAST(:tabela AS regclass)
+        """),
+        {"tabela": tabela}
+    ).scalars()
+
+    particoes = []
+    for nome in nomes:
+        match = re.match(rf"^{tabela}_(\d{{4}})_(\d{{2}})$", nome)
+        if match:
+            particoes.append((nome, date(int(match.group(1)), int(match.group(2)), 1)))
+    return sorted(particoes, key=lambda p: p[1])
+
+
+def criar_particoes_futuras(conn, tabela, meses=MESES_A_FRENTE):
+    mes_atual = date.today().replace(day=1)
+    for i in range(meses + 1):
+        conn.execute(
+            text("SELECT criar_particao_mensal(:tabela, :mes)"),
+            {"tabela": tabela, "mes": _somar_meses(mes_atual, i)}
+        )
+
+
+def aplicar_retencao(conn, tabela, meses, acao=RETENCAO_ACAO):
+    """Tira da tabela as partições de meses anteriores ao limite; retorna os nomes"""
+    limite = _somar_meses(date.today().replace(day=1), -meses)
+    removidas = []
+    for nome, mes in listar_particoes(conn, tabela):
+        if mes >= limite:
+            break
+        conn.execute(text(f'ALTER TABLE "{tabela}" DETACH PARTITION "{nome}"'))
+        if acao == "descartar":
+            conn.execute(text(f'DROP TABLE "{nome}"'))
+        else:
+            conn.execute(text(f'ALTER TABLE "{nome}" SET SCHEMA arquivo'))
+        removidas.append(nome)
+    return removidas
+
+
+def manter_particoes(engine):
+    """Cria partições futuras e aplica a retenção; só um processo por vez"""
+    with engine.connect() as conn:
+        if not conn.execute(text("SELECT pg_try_advisory_lock(:id)"), {"id": LOCK_PARTICOES}).scalar():
+            conn.rollback()
+            return
+        conn.commit()
+        try:
+            for tabela, meses in RETENCAO_MESES.items():
+                with conn.begin():
+                    criar_particoes_futuras(conn, tabela)
+                with conn.begin():
+                    removidas = aplicar_retencao(conn, tabela, meses)
+                if removidas:
+                    destino = "descartada(s)" if RETENCAO_ACAO == "descartar" else "arquivada(s)"
+                    logging.info(f"Retenção de {tabela}: {len(removidas)} partição(ões) {destino}: {removidas}")
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": LOCK_PARTICOES})
+            conn.commit()
+
+
+def iniciar_manutencao(engine, parar=None, intervalo=None):
+    """Roda manter_particoes periodicamente em segundo plano"""
+    parar = parar or threading.Event()
+    intervalo = intervalo or int(os.getenv("RETENCAO_INTERVALO", 6 * 3600))
+
+    def loop():
+        while True:
+            try:
+                manter_particoes(engine)
+            except Exception as e:
+                logging.error(f"Erro na manutenção das partições: {e}")
+            if parar.wait(intervalo):
+                return
+
+    threading.Thread(target=loop, name="manutencao-particoes", daemon=True).start()
+    return parar
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    manter_particoes(create_engine(os.getenv("DATABASE_URL")))
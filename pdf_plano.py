@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Gera o PDF de um plano salvo a partir do texto guardado na tabela planos.
+
+Substitui o jsPDF do navegador: o mesmo arquivo serve para o download e para
+o anexo do e-mail, e o cliente não precisa mais subir o PDF de volta.
+"""
+
+import hashlib
+import re
+
+from fpdf import FPDF
+
+# As fontes embutidas do PDF só cobrem latin-1; emojis e afins são descartados
+_FORA_LATIN1 = re.compile(r"[^\x00-\xff]")
+_NEGRITO = re.compile(r"^\s*(#+\s*|\*\*)(.+?)(\*\*)?\s*$")
+
+
+def chave_pdf(plano):
+    """Muda sempre que o conteúdo do plano muda"""
+    resumo = hashlib.sha256(f"{plano.titulo}\n{plano.conteudo}".encode("utf-8")).hexdigest()[:16]
+    return f"{plano.id}:{resumo}"
+
+
+def _limpar(texto):
+    return _FORA_LATIN1.sub("", texto).replace("\t", "    ")
+
+
+def renderizar_pdf(titulo, conteudo):
+    pdf = FPDF(format="A4")
+    pdf.set_auto_page_break(auto=True, margin=15)
+    pdf.set_title(_limpar(titulo))
+    pdf.set_creator("TreinoRun")
+    pdf.add_page()
+
+    pdf.set_font("Helvetica", "B", 16)
+    pdf.multi_cell(0, 9, _limpar(titulo).strip(), new_x="LMARGIN", new_y="NEXT")
+    pdf.ln(4)
+
+    for linha in conteudo.strip().splitlines():
+        linha = _limpar(linha).strip()
+        if not linha:
+            pdf.ln(3)
+            continue
+
+        destaque = _NEGRITO.match(linha)
+        if destaque:
+            pdf.set_font("Helvetica", "B", 11)
+            linha = destaque.group(2)
+        else:
+            pdf.set_font("Helvetica", "", 11)
+        pdf.multi_cell(0, 6, linha.replace("**", ""), new_x="LMARGIN", new_y="NEXT")
+
+    return bytes(pdf.output())
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Engine do banco com pool instrumentado.
+
+- statement_timeout e idle_in_transaction_session_timeout no Postgres, para
+  uma consulta travada ou uma transação esquecida não segurarem a conexão
+  indefinidamente.
+- Tempo de espera por uma conexão livre (histograma) e timeouts do pool.
+- Conexões em uso, overflow e por quanto tempo cada conexão ficou retirada;
+  uma thread vigia as que passam de `limite_retencao` segundos e registra
+  quem as retirou (thread, rota e request id).
+- Duração das consultas por operação (SELECT, INSERT...), exportada em
+  metricas.py junto com a espera, as conexões em uso e os avisos acima.
+- validar_pool compara as threads do processo com o tamanho do pool.
+"""
+
+import logging
+import threading
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import QueuePool
+
+import metricas
+from thread_processo import ThreadPorProcesso
+
+OPERACOES_SQL = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH"}
+
+
+class QueuePoolMedido(QueuePool):
+    """QueuePool que mede quanto tempo cada pedido de conexão esperou"""
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeout:
+            metricas.db_timeouts_pool.inc()
+            raise
+        finally:
+            metricas.db_espera_conexao.observe(time.perf_counter() - inicio)
+
+
+def criar_engine(url, pool_size=10, max_overflow=0, pool_timeout=30,
+                 statement_timeout_ms=None, idle_in_transaction_ms=None, **opcoes):
+    connect_args = {}
+    if make_url(url).get_backend_name() == "postgresql":
+        parametros = []
+        if statement_timeout_ms:
+            parametros.append(f"-c statement_timeout={int(statement_timeout_ms)}")
+        if idle_in_transaction_ms:
+            parametros.append(f"-c idle_in_transaction_session_timeout={int(idle_in_transaction_ms)}")
+        if parametros:
+            connect_args["options"] = " ".join(parametros)
+
+    return create_engine(
+        url,
+        poolclass=QueuePoolMedido,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=pool_timeout,
+        connect_args=connect_args,
+        **opcoes
+    )
+
+
+class MonitorPool:
+    def __init__(self, engine, limite_retencao=30.0, intervalo=10.0):
+        self.engine = engine
+        self.limite_retencao = limite_retencao
+        self.intervalo = intervalo
+        # id do registro da conexão -> [retirada em, thread, rota, request id, já avisada]
+        self._retiradas = {}
+        self._lock = threading.Lock()
+        self._thread = ThreadPorProcesso(self._vigiar, "monitor-pool", ao_iniciar=self._esquecer_retiradas)
+        event.listen(engine, "checkout", self._ao_retirar)
+        event.listen(engine, "checkin", self._ao_devolver)
+        event.listen(engine, "before_cursor_execute", self._antes_consulta)
+        event.listen(engine, "after_cursor_execute", self._depois_consulta)
+        event.listen(engine, "handle_error", self._erro_consulta)
+
+    def _esquecer_retiradas(self):
+        # As conexões retiradas no processo pai não são deste processo
+        with self._lock:
+            self._retiradas = {}
+
+    def _ao_retirar(self, conexao_dbapi, registro, proxy):
+        self._thread.garantir()
+        rota = request_id = None
+        if has_request_context():
+            rota = f"{request.method} {request.path}"
+            request_id = g.get("request_id")
+        with self._lock:
+            self._retiradas[id(registro)] = [time.monotonic(), threading.current_thread().name, rota, request_id, False]
+        metricas.db_conexoes_em_uso.inc()
+
+    def _ao_devolver(self, conexao_dbapi, registro):
+        with self._lock:
+            retirada = self._retiradas.pop(id(registro), None)
+        if retirada is None:
+            return
+        metricas.db_conexoes_em_uso.dec()
+        duracao = time.monotonic() - retirada[0]
+        metricas.db_retencao_conexao.observe(duracao)
+        if duracao >= self.limite_retencao and not retirada[4]:
+            self._avisar(duracao, retirada, devolvida=True)
+
+    def _avisar(self, duracao, retirada, devolvida):
+        metricas.db_retencoes_longas.inc()
+        _, thread, rota, request_id, _ = retirada
+        situacao = "devolvida depois de" if devolvida else "retirada há"
+        logging.warning(
+            f"Conexão do banco {situacao} {duracao:.1f}s (thread {thread}, rota {rota or '-'})",
+            extra={"request_id_conexao": request_id}
+        )
+
+    def _antes_consulta(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("inicio_consultas", []).append(time.perf_counter())
+
+    def _depois_consulta(self, conn, cursor, statement, parameters, context, executemany):
+        inicio = conn.info["inicio_consultas"].pop()
+        operacao = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+        metricas.db_consulta.labels(operacao if operacao in OPERACOES_SQL else "outra").observe(
+            time.perf_counter() - inicio
+        )
+
+    def _erro_consulta(self, contexto):
+        # after_cursor_execute não roda quando a consulta falha; sem isto a
+        # pilha da conexão cresceria e as próximas medições sairiam erradas
+        if contexto.connection is None:
+            return
+        inicios = contexto.connection.info.get("inicio_consultas")
+        if inicios:
+            inicios.pop()
+
+    def _vigiar(self):
+        # Pega as conexões que não voltam (vazamento ou transação travada)
+        while True:
+            time.sleep(self.intervalo)
+            agora = time.monotonic()
+            with self._lock:
+                longas = [r for r in self._retiradas.values() if not r[4] and agora - r[0] >= self.limite_retencao]
+                for retirada in longas:
+                    retirada[4] = True
+            for retirada in longas:
+                self._avisar(agora - retirada[0], retirada, devolvida=False)
+            self.exportar_metricas()
+
+    def exportar_metricas(self):
+        """Copia o estado do pool para os gauges do Prometheus (somados entre processos)"""
+        pool = self.engine.pool
+        metricas.db_pool_tamanho.set(pool.size())
+        metricas.db_pool_disponiveis.set(pool.checkedin())
+        metricas.db_pool_overflow.set(max(pool.overflow(), 0))
+
+
+def validar_pool(engine, threads, processo, max_overflow=0):
+    """Avisa quando o processo tem mais threads usando o banco do que conexões no pool.
+
+    `max_overflow` é o mesmo valor passado a criar_engine.
+    """
+    pool = engine.pool
+    capacidade = pool.size() + max(max_overflow, 0)
+    if threads > capacidade:
+        logging.warning(
+            f"Processo {processo}: {threads} thread(s) para {capacidade} conexão(ões) no pool "
+            f"(DB_POOL_SIZE={pool.size()}, DB_MAX_OVERFLOW={max_overflow}). "
+            f"Sob carga, requisições esperam até {pool.timeout()}s por conexão; "
+            f"aumente o pool ou reduza as threads"
+        )
+        return False
+    logging.info(f"Processo {processo}: {threads} thread(s), pool com até {capacidade} conexão(ões)")
+    return True
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Escolha do modelo e do max_tokens de cada geração de plano.
+
+A partir das semanas, dos dias de treino e do tipo de plano estima quantos
+tokens a resposta deve ter (com folga), soma os do prompt e escolhe o modelo
+mais barato do catálogo em que tudo cabe. O max_tokens sai da estimativa,
+limitado à saída máxima do modelo e ao orçamento por requisição.
+
+Uma geração em blocos é roteada de uma vez (escolher_blocos): mesmo modelo,
+orçamento por requisição dividido entre os blocos pelas semanas.
+
+O orçamento diário é conferido antes de cada geração contra o consumo do dia
+(lido do banco por `consumo_diario`, com cache curto, mais o que este
+processo consumiu desde a leitura). Estourado, levanta OrcamentoEsgotado.
+
+O catálogo padrão tem os dois modelos já usados pela aplicação e pode ser
+trocado por JSON em MODELOS_OPENAI, com os mesmos campos.
+"""
+
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+
+# Preços em US$ por 1K tokens (entrada, saída)
+MODELOS_PADRAO = [
+    {"nome": "gpt-3.5-turbo", "contexto": 4096, "max_saida": 4096, "preco_prompt": 0.0005, "preco_saida": 0.0015},
+    {"nome": "gpt-3.5-turbo-16k", "contexto": 16385, "max_saida": 4096, "preco_prompt": 0.003, "preco_saida": 0.004},
+]
+
+# Tokens de resposta por treino descrito; o plano de pace detalha mais cada sessão
+TOKENS_POR_TREINO = {"corrida": 45, "pace": 55}
+TOKENS_POR_SEMANA = 40
+TOKENS_FIXOS_SAIDA = 200
+FOLGA_SAIDA = 1.3
+
+# Português dá menos caracteres por token que inglês; 3 é conservador
+CARACTERES_POR_TOKEN = 3
+
+Rota = namedtuple("Rota", ["modelo", "max_tokens", "tokens_prompt", "tokens_saida", "custo_estimado"])
+
+
+class OrcamentoEsgotado(Exception):
+    """O orçamento diário de tokens da OpenAI acabou"""
+
+
+def estimar_tokens_prompt(mensagens):
+    return sum(math.ceil(len(m["content"]) / CARACTERES_POR_TOKEN) + 4 for m in mensagens) + 3
+
+
+def dias_por_semana(dias):
+    """'3', '3 dias', '4-5' -> maior número citado, entre 1 e 7 (4 se não houver)"""
+    numeros = [int(n) for n in re.findall(r"\d+", str(dias))]
+    return min(max(max(numeros), 1), 7) if numeros else 4
+
+
+def estimar_tokens_saida(semanas, dias, tipo_plano):
+    por_semana = TOKENS_POR_SEMANA + dias_por_semana(dias) * TOKENS_POR_TREINO.get(tipo_plano, TOKENS_POR_TREINO["corrida"])
+    return math.ceil((TOKENS_FIXOS_SAIDA + semanas * por_semana) * FOLGA_SAIDA)
+
+
+class RoteadorModelos:
+    def __init__(self, modelos=None, orcamento_requisicao=12000, orcamento_diario=0,
+                 consumo_diario=None, ttl_consumo=30):
+        # Do mais barato para o mais caro, pelo custo de uma resposta típica
+        self.modelos = sorted(modelos or MODELOS_PADRAO, key=lambda m: (m["preco_saida"], m["preco_prompt"]))
+        self.orcamento_requisicao = orcamento_requisicao
+        self.orcamento_diario = orcamento_diario
+        self.consumo_diario = consumo_diario
+        self.ttl_consumo = ttl_consumo
+        self._lock = threading.Lock()
+        self._consumo = (None, 0, 0.0)  # (dia, tokens, lido em)
+
+    @classmethod
+    def do_ambiente(cls, consumo_diario=None):
+        modelos = json.loads(os.environ["MODELOS_OPENAI"]) if os.getenv("MODELOS_OPENAI") else None
+        return cls(
+            modelos,
+            orcamento_requisicao=int(os.getenv("ORCAMENTO_TOKENS_REQUISICAO", 12000)),
+            # 0 desliga o limite diário
+            orcamento_diario=int(os.getenv("ORCAMENTO_TOKENS_DIA", 0)),
+            consumo_diario=consumo_diario
+        )
+
+    def escolher(self, mensagens, semanas, dias, tipo_plano):
+        return self.escolher_blocos([mensagens], [semanas], dias, tipo_plano)[0]
+
+    def escolher_blocos(self, mensagens_blocos, semanas_blocos, dias, tipo_plano):
+        """Rotas dos blocos de uma mesma geração, decididas juntas.
+
+        Um só modelo para todos os blocos. O orçamento por requisição vale
+        para a geração inteira: a saída que cabe nele é dividida entre os
+        blocos na proporção das semanas de cada um. O orçamento diário é
+        conferido uma vez, contra a soma, antes de qualquer bloco começar.
+        """
+        prompts = [estimar_tokens_prompt(m) for m in mensagens_blocos]
+        saidas = [estimar_tokens_saida(semanas, dias, tipo_plano) for semanas in semanas_blocos]
+
+        # O orçamento por requisição corta a saída, nunca o prompt
+        disponivel = self.orcamento_requisicao - sum(prompts)
+        total_semanas = sum(semanas_blocos)
+        permitidas = [
+            min(saida, disponivel * semanas // total_semanas)
+            for saida, semanas in zip(saidas, semanas_blocos)
+        ]
+        if min(permitidas) <= 0:
+            raise ValueError(f"Prompt de {sum(prompts)} tokens não cabe no orçamento por requisição")
+        if sum(permitidas) < sum(saidas):
+            logging.warning(
+                f"Saída estimada de {sum(saidas)} tokens limitada a {sum(permitidas)} "
+                f"pelo orçamento por requisição ({self.orcamento_requisicao})"
+            )
+
+        self.conferir_orcamento_diario(sum(prompts) + sum(permitidas))
+
+        escolhido = None
+        for modelo in self.modelos:
+            max_tokens = [
+                min(permitida, modelo["max_saida"], modelo["contexto"] - prompt)
+                for permitida, prompt in zip(permitidas, prompts)
+            ]
+            if min(max_tokens) <= 0:
+                continue
+            if max_tokens == permitidas:
+                escolhido = (modelo, max_tokens)
+                break
+            # Nenhum comporta tudo: fica o que comporta a maior saída
+            if escolhido is None or sum(max_tokens) > sum(escolhido[1]):
+                escolhido = (modelo, max_tokens)
+
+        if escolhido is None:
+            raise ValueError(f"Nenhum modelo comporta um prompt de {max(prompts)} tokens")
+
+        modelo, max_tokens = escolhido
+        if max_tokens != permitidas:
+            logging.warning(
+                f"Saída estimada de {sum(permitidas)} tokens acima do máximo de {modelo['nome']} ({sum(max_tokens)})"
+            )
+        return [
+            Rota(
+                modelo["nome"], maximo, prompt, saida,
+                round((prompt * modelo["preco_prompt"] + maximo * modelo["preco_saida"]) / 1000, 6)
+            )
+            for maximo, prompt, saida in zip(max_tokens, prompts, saidas)
+        ]
+
+    # ================================================
+    # ORÇAMENTO DIÁRIO
+    # ================================================
+
+    def _consumo_hoje(self):
+        hoje = time.strftime("%Y-%m-%d")
+        with self._lock:
+            dia, tokens, lido_em = self._consumo
+            if dia == hoje and time.monotonic() - lido_em < self.ttl_consumo:
+                return tokens
+        tokens = int(self.consumo_diario() or 0) if self.consumo_diario else 0
+        with self._lock:
+            self._consumo = (hoje, tokens, time.monotonic())
+        return tokens
+
+    def conferir_orcamento_diario(self, tokens):
+        if not self.orcamento_diario:
+            return
+        consumidos = self._consumo_hoje()
+        if consumidos + tokens > self.orcamento_diario:
+            raise OrcamentoEsgotado(
+                f"Orçamento diário de tokens esgotado ({consumidos} de {self.orcamento_diario})"
+            )
+
+    def registrar_consumo(self, tokens):
+        """Soma ao consumo em cache o que acabou de ser usado, até a próxima leitura do banco"""
+        with self._lock:
+            dia, consumidos, lido_em = self._consumo
+            self._consumo = (dia, consumidos + tokens, lido_em)
@@ -8,36 +8,53 @@ import re
 import hmac
 import hashlib
 import uuid
-from datetime import datetime, timedelta
-from functools import wraps
+import threading
+import time
+import queue
+from datetime import datetime, timedelta, timezone
+from functools import partial
 from io import BytesIO
-import base64
 import json
 
-from flask import Flask, request, render_template,render_template_string, redirect, url_for, session, jsonify, abort
+from flask import Flask, Response, g, request, render_template,render_template_string, redirect, url_for, session, jsonify, abort
 from flask_limiter import Limiter
+from flask_limiter.errors import RateLimitExceeded
 from flask_limiter.util import get_remote_address
 from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.exceptions import HTTPException
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from sqlalchemy.orm import scoped_session, sessionmaker
-from openai import OpenAI
+from openai import AsyncOpenAI
 import requests
-from flask_mail import Mail, Message
+import redis
+from flask_mail import Mail
+
+from cache import CacheEmCamadas
+from cache_respostas import CacheRespostas
+from caixa_saida import CaixaSaidaEmail
+from canal_geracao import CanalGeracao
+from cotas import CotasGeracao
+from cliente_mercadopago import ClienteMercadoPago
+from fila import FilaJobs
+from geracao_blocos import DeltasOrdenados, dividir_em_blocos, juntar_blocos, prompt_bloco, validar_bloco
+from gravador_lotes import GravadorEmLotes
+from limite_local import LimitadorLocal
+import metricas
+from logs import configurar_logs
+from motor_plano import gerar_plano_local
+from particoes import iniciar_manutencao
+from pdf_plano import chave_pdf, renderizar_pdf
+from pool_db import MonitorPool, criar_engine, validar_pool
+from roteamento_modelos import OrcamentoEsgotado, RoteadorModelos
+from singleflight import SingleFlight
 
 # ================================================
 # CONFIGURAÇÃO INICIAL
 # ================================================
 
-# Configuração de logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('treinorun.log')
-    ]
-)
+# Configuração de logging: a requisição só enfileira o registro; formatação
+# JSON e escrita (console + arquivo com rotação) ficam numa thread à parte
+configurar_logs(os.getenv("LOG_ARQUIVO", "treinorun.log"))
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 template_dir = os.path.join(basedir, 'Templates')
@@ -51,7 +68,8 @@ app.config.update(
     SESSION_COOKIE_HTTPONLY=True,
     SESSION_COOKIE_SAMESITE='Lax',
     PERMANENT_SESSION_LIFETIME=timedelta(minutes=30),
-    MAX_CONTENT_LENGTH=16 * 1024 * 1024,
+    # Nenhuma rota recebe arquivos: o PDF é gerado no servidor
+    MAX_CONTENT_LENGTH=1024 * 1024,
     JSONIFY_PRETTYPRINT_REGULAR=False,
     TRAP_HTTP_EXCEPTIONS=True
 )
@@ -59,57 +77,282 @@ app.config.update(
 # ProxyFix para Railway
 app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_port=1)
 
-# Rate Limiter
+# Request id e latência de cada requisição; registrado antes do limiter para
+# que até as requisições barradas por ele tenham id nos logs
+@app.before_request
+def marcar_inicio_requisicao():
+    g.request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+    g.inicio_requisicao = time.perf_counter()
+
+@app.after_request
+def registrar_requisicao(response):
+    if "inicio_requisicao" in g:
+        latencia = time.perf_counter() - g.inicio_requisicao
+        latencia_ms = round(latencia * 1000, 2)
+        # Rota pelo padrão (/artigos/<slug>) para não criar uma série por URL
+        metricas.http_latencia.labels(
+            request.url_rule.rule if request.url_rule else "desconhecida",
+            request.method,
+            response.status_code
+        ).observe(latencia)
+        logging.info(
+            f"{request.method} {request.path} {response.status_code}",
+            extra={"status": response.status_code, "latencia_ms": latencia_ms}
+        )
+    response.headers["X-Request-ID"] = g.get("request_id", "")
+    return response
+
+# Rate Limiter em duas camadas: rotas caras (geração, pagamento, e-mail) usam
+# o moving-window exato no Redis; as demais usam limitador_local (criado mais
+# abaixo, com o Redis), decidido na memória e sincronizado em lote. Rotas sem
+# nenhum dos dois ficam com os limites padrão
+def usa_limite_local():
+    return hasattr(app.view_functions.get(request.endpoint), "limite_local")
+
 limiter = Limiter(
     app=app,
     key_func=get_remote_address,
     storage_uri=os.getenv("REDIS_URL", "memory://"),
     strategy="moving-window",
-    default_limits=["200 per day", "50 per hour"]
+    default_limits=["200 per day", "50 per hour"],
+    default_limits_exempt_when=usa_limite_local
 )
 
+# Com TRAP_HTTP_EXCEPTIONS o 429 viraria 500 sem um handler registrado
+@app.errorhandler(429)
+def limite_excedido(e):
+    logging.warning(f"Limite excedido em {request.path}: {e.description}")
+    metricas.limite_rejeicoes.labels(
+        "redis" if isinstance(e, RateLimitExceeded) else "local",
+        request.url_rule.rule if request.url_rule else "desconhecida"
+    ).inc()
+    if request.is_json or request.accept_mimetypes.best == "application/json":
+        resposta = jsonify({"message": "Muitas requisições. Tente novamente mais tarde."})
+    else:
+        resposta = render_template("erro.html", mensagem="Muitas requisições. Tente novamente mais tarde.")
+    retry_after = getattr(e, "retry_after", None)
+    return resposta, 429, {"Retry-After": str(retry_after)} if retry_after else {}
+
 # ================================================
 # BANCO DE DADOS E SERVIÇOS
 # ================================================
 
-engine = create_engine(
+# O overflow só abre conexões extras sob pico (fechadas ao voltar ao pool), para
+# as WEB_THREADS não ficarem esperando; validar_pool confere isso no início
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 25))
+engine = criar_engine(
     os.getenv("DATABASE_URL"),
-    pool_size=10,
-    max_overflow=0,
+    pool_size=int(os.getenv("DB_POOL_SIZE", 10)),
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", 10)),
+    statement_timeout_ms=int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 15000)),
+    idle_in_transaction_ms=int(os.getenv("DB_IDLE_TRANSACAO_MS", 60000)),
     pool_recycle=3600,
     pool_pre_ping=True
 )
+monitor_pool = MonitorPool(engine, limite_retencao=float(os.getenv("DB_RETENCAO_LONGA", 30)))
+
+# Uma sessão por thread, devolvida ao pool no fim de cada requisição ou job
 db = scoped_session(sessionmaker(bind=engine))
 
-client = OpenAI(
+@app.teardown_appcontext
+def remover_sessao(exc=None):
+    # Sem isso uma requisição que só leu (ou falhou) deixaria a conexão
+    # "idle in transaction" presa à thread até ela ser usada de novo
+    db.remove()
+
+# Fila persistente (tabela jobs) consumida pelo worker.py
+fila = FilaJobs(engine)
+
+# Logs de webhook gravados em lotes por uma thread em segundo plano
+gravador_logs_webhook = GravadorEmLotes(
+    engine,
+    "logs_webhook",
+    ["data_recebimento", "payload", "status_processamento", "mensagem_erro"],
+    intervalo=float(os.getenv("LOGS_WEBHOOK_INTERVALO", 1.0))
+)
+
+# Redis compartilhado entre os workers (opcional: sem ele os caches ficam só em memória)
+redis_client = redis.Redis.from_url(
+    os.getenv("REDIS_URL"),
+    socket_timeout=0.5,
+    socket_connect_timeout=0.5
+) if os.getenv("REDIS_URL") else None
+
+# Camada local do rate limit (ver usa_limite_local)
+limitador_local = LimitadorLocal(
+    redis_client,
+    chave=get_remote_address,
+    intervalo=float(os.getenv("LIMITE_LOCAL_INTERVALO", 1.0))
+)
+limite_local = limitador_local.limitar
+
+# Cache de planos gerados, reaproveitados entre atletas com os mesmos dados.
+# Cada entrada é servida no máximo CACHE_PLANOS_MAX_REUSOS vezes antes de ser
+# gerada de novo, para os planos não ficarem todos iguais (0 desliga o cache)
+cache_planos = CacheEmCamadas(
+    "plano",
+    redis_client,
+    max_itens=int(os.getenv("CACHE_PLANOS_MAX_ITENS", 500)),
+    ttl=int(os.getenv("CACHE_PLANOS_TTL", 7 * 24 * 3600)),
+    max_reusos=int(os.getenv("CACHE_PLANOS_MAX_REUSOS", 20))
+)
+
+# Cache de direitos por email (plano, status da assinatura, última geração).
+# O TTL local curto limita por quanto tempo outro processo pode ver um valor
+# já invalidado por pagamento/geração
+cache_direitos = CacheEmCamadas(
+    "direitos",
+    redis_client,
+    max_itens=int(os.getenv("CACHE_DIREITOS_MAX_ITENS", 5000)),
+    ttl=int(os.getenv("CACHE_DIREITOS_TTL", 300)),
+    ttl_local=int(os.getenv("CACHE_DIREITOS_TTL_LOCAL", 10))
+)
+
+# PDFs dos planos salvos, por id + hash do conteúdo (download e anexo de e-mail)
+cache_pdfs = CacheEmCamadas(
+    "pdf",
+    redis_client,
+    max_itens=int(os.getenv("CACHE_PDFS_MAX_ITENS", 200)),
+    ttl=int(os.getenv("CACHE_PDFS_TTL", 24 * 3600)),
+    serializar=bytes,
+    desserializar=bytes
+)
+
+# Páginas estáticas (blog, artigos, pendente, erro e a landing anônima)
+# renderizadas uma vez, já em gzip/brotli e com ETag. As públicas podem ficar
+# na CDN; o conteúdo só muda com deploy, que reinicia os processos
+cache_respostas = CacheRespostas(ativo=os.getenv("CACHE_RESPOSTAS", "1") == "1")
+CACHE_CONTROL_PUBLICO = os.getenv(
+    "CACHE_CONTROL_PUBLICO", "public, max-age=300, s-maxage=86400, stale-while-revalidate=3600"
+)
+
+# Gerações idênticas simultâneas (mesma chave do cache) fazem uma única
+# chamada à OpenAI; as demais aguardam e recebem o mesmo resultado
+TIMEOUT_SINGLEFLIGHT = float(os.getenv("TIMEOUT_SINGLEFLIGHT", 90))
+singleflight_planos = SingleFlight("voo-plano", redis_client, ttl_lock=TIMEOUT_SINGLEFLIGHT)
+
+# Preferências de checkout do Mercado Pago reaproveitadas por (email, upgrade,
+# preço) enquanto valem; a preferência é criada com validade um pouco maior
+# que o TTL do cache para nunca devolvermos um link já expirado
+PRECO_PLANO_ANUAL = 59.90
+PREFERENCIA_TTL = int(os.getenv("PREFERENCIA_TTL", 1800))
+PREFERENCIA_VALIDADE_EXTRA = 300
+cache_preferencias = CacheEmCamadas(
+    "preferencia",
+    redis_client,
+    max_itens=int(os.getenv("CACHE_PREFERENCIAS_MAX_ITENS", 2000)),
+    ttl=PREFERENCIA_TTL
+)
+singleflight_preferencias = SingleFlight("voo-preferencia", redis_client, ttl_lock=30)
+
+# Cliente assíncrono: todas as chamadas rodam no loop compartilhado abaixo,
+# dividindo um único pool de conexões HTTP com a OpenAI
+client = AsyncOpenAI(
     api_key=os.getenv("OPENAI_API_KEY"),
     timeout=30.0
 )
 
+def tokens_consumidos_hoje():
+    with engine.connect() as conn:
+        return conn.execute(
+            text("""
+                SELECT COALESCE(SUM(tokens_prompt + tokens_completion), 0)
+                FROM geracoes
+                WHERE data_geracao >= CURRENT_DATE
+            """)
+        ).scalar()
+
+# Modelo e max_tokens de cada geração pelo tamanho estimado do plano, com
+# orçamento de tokens por requisição e por dia (ORCAMENTO_TOKENS_*)
+roteador_modelos = RoteadorModelos.do_ambiente(consumo_diario=tokens_consumidos_hoje)
+
+# Gerações por plano e janela (COTA_GRATUITO/COTA_ANUAL, *_DIAS), reservadas
+# num único UPDATE condicional antes de enfileirar
+cotas_geracao = CotasGeracao.do_ambiente(engine)
+
+# Planos a partir de GERACAO_BLOCOS_MIN_SEMANAS semanas são gerados em blocos
+# de periodização em paralelo (0 desliga); cada bloco tem até
+# GERACAO_BLOCOS_MAX_SEMANAS semanas
+GERACAO_BLOCOS_MIN_SEMANAS = int(os.getenv("GERACAO_BLOCOS_MIN_SEMANAS", 12))
+GERACAO_BLOCOS_MAX_SEMANAS = int(os.getenv("GERACAO_BLOCOS_MAX_SEMANAS", 8))
+
+# Motor local de planos (motor_plano.py): modo escolhido no formulário ou por
+# MODO_GERACAO, e reserva quando a OpenAI falha ou não responde no prazo
+MODOS_GERACAO = ("openai", "local")
+MODO_GERACAO = os.getenv("MODO_GERACAO", "openai")
+RESERVA_LOCAL = os.getenv("RESERVA_LOCAL", "1") == "1"
+PRAZO_OPENAI = float(os.getenv("PRAZO_OPENAI", 45))
+PRAZO_PRIMEIRO_TRECHO = float(os.getenv("PRAZO_PRIMEIRO_TRECHO", 10))
+
+# Cliente do Mercado Pago com pool de conexões, novas tentativas e disjuntor
+mercadopago = ClienteMercadoPago(
+    os.getenv("MERCADO_PAGO_ACCESS_TOKEN"),
+    base_url=os.getenv("MERCADO_PAGO_URL", "https://api.mercadopago.com"),
+    max_tentativas=int(os.getenv("MERCADO_PAGO_TENTATIVAS", 3))
+)
+
 # Configuração de e-mail
-app.config['MAIL_SERVER'] = 'smtp.zoho.com'
-app.config['MAIL_PORT'] = 587
-app.config['MAIL_USE_TLS'] = True
+app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER', 'smtp.zoho.com')
+app.config['MAIL_PORT'] = int(os.getenv('MAIL_PORT', 587))
+app.config['MAIL_USE_TLS'] = os.getenv('MAIL_USE_TLS', '1') == '1'
 app.config['MAIL_USERNAME'] = os.getenv('ZOHO_EMAIL')
 app.config['MAIL_PASSWORD'] = os.getenv('ZOHO_PASSWORD')
 app.config['MAIL_DEFAULT_SENDER'] = ('TreinoRun', os.getenv('ZOHO_EMAIL'))
 mail = Mail(app)
 
+# E-mails saem pela fila: as rotas só enfileiram e o remetente (worker.py ou
+# WORKERS_EMBUTIDOS) envia em lotes por uma conexão SMTP persistente,
+# dentro do limite de envio do provedor (somado entre os processos via Redis)
+caixa_saida = CaixaSaidaEmail(
+    fila,
+    mail,
+    app,
+    lote=int(os.getenv("EMAIL_LOTE", 20)),
+    por_minuto=int(os.getenv("EMAIL_POR_MINUTO", 60)),
+    redis_client=redis_client
+)
+
 # ================================================
-# DECORATOR PARA ROTAS ASSÍNCRONAS
+# LOOP ASSÍNCRONO COMPARTILHADO
 # ================================================
 
-def async_route(f):
-    """Permite usar async/await em rotas Flask"""
-    @wraps(f)
-    def wrapper(*args, **kwargs):
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            return loop.run_until_complete(f(*args, **kwargs))
-        finally:
-            loop.close()
-    return wrapper
+_loop_compartilhado = None
+_loop_pid = None
+_loop_lock = threading.Lock()
+
+def obter_loop():
+    """Retorna o event loop de longa duração do processo, criando-o na primeira chamada.
+
+    O loop roda numa thread daemon própria. O PID é verificado para que cada
+    worker do gunicorn (criado via fork) tenha o seu próprio loop.
+    """
+    global _loop_compartilhado, _loop_pid
+    if _loop_compartilhado is not None and _loop_pid == os.getpid():
+        return _loop_compartilhado
+
+    with _loop_lock:
+        if _loop_compartilhado is None or _loop_pid != os.getpid():
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="loop-compartilhado", daemon=True).start()
+            _loop_compartilhado = loop
+            _loop_pid = os.getpid()
+    return _loop_compartilhado
+
+def executar_no_loop(coro, timeout=None):
+    """Agenda a corrotina no loop compartilhado e aguarda o resultado.
+
+    Quem chama (uma thread do worker) fica bloqueado até o resultado; o ganho
+    do loop compartilhado é não criar um loop nem uma conexão nova por
+    chamada. Nenhuma rota web chama isto para gerar planos: /generate só
+    enfileira e a geração roda no worker.
+    """
+    futuro = asyncio.run_coroutine_threadsafe(coro, obter_loop())
+    try:
+        return futuro.result(timeout)
+    except Exception:
+        futuro.cancel()
+        raise
 
 # ================================================
 # FUNÇÕES AUXILIARES
@@ -120,48 +363,100 @@ def validar_assinatura(body, signature):
     assinatura_esperada = hmac.new(chave_secreta, body, hashlib.sha256).hexdigest()
     return hmac.compare_digest(assinatura_esperada, signature)
 
-def pode_gerar_plano(email, plano):
-    try:
+def obter_direitos(email):
+    """Retorna o registro compacto de direitos do usuário (ou None se não existir).
+
+    Lido do cache de direitos; no cache miss faz uma única consulta que já
+    traz o status da última assinatura. Quem altera usuarios/assinaturas deve
+    chamar invalidar_direitos.
+    """
+    if not email:
+        return None
+
+    direitos = cache_direitos.obter(email)
+    if direitos is None:
         usuario = db.execute(
-            text("SELECT * FROM usuarios WHERE email = :email"),
+            text("""
+                SELECT u.id, u.email, u.nome, u.plano, u.ultima_geracao,
+                u.cota_inicio, u.cota_usada,
+                (SELECT status FROM assinaturas
+                 WHERE usuario_id = u.id
+                 ORDER BY id DESC LIMIT 1) as status_assinatura
+                FROM usuarios u
+                WHERE u.email = :email
+            """),
             {"email": email}
         ).fetchone()
 
-        # Usuário não existe - só pode gerar se for plano gratuito (primeira vez)
-        if not usuario:
-            return plano == "gratuito"
+        # Usuários inexistentes também vão para o cache, com id None
+        direitos = {
+            "id": usuario.id if usuario else None,
+            "email": usuario.email if usuario else email,
+            "nome": (usuario.nome or "") if usuario else "",
+            "plano": usuario.plano if usuario else "gratuito",
+            "status_assinatura": usuario.status_assinatura if usuario else None,
+            "ultima_geracao": usuario.ultima_geracao.isoformat() if usuario and usuario.ultima_geracao else None,
+            "cota_inicio": usuario.cota_inicio.isoformat() if usuario and usuario.cota_inicio else None,
+            "cota_usada": usuario.cota_usada if usuario else 0
+        }
+        cache_direitos.guardar(email, direitos)
+
+    return direitos if direitos["id"] is not None else None
 
-        # Verificação para plano anual
-        if plano == "anual":
-            # Verifica na tabela assinaturas
-            assinatura = db.execute(
-                text("""
-                    SELECT status FROM assinaturas 
-                    WHERE usuario_id = :usuario_id 
-                    ORDER BY id DESC LIMIT 1
-                """),
-                {"usuario_id": usuario.id}
-            ).fetchone()
+def invalidar_direitos(email):
+    if email:
+        cache_direitos.invalidar(email)
 
-            # Se tem assinatura ativa ou está marcado como anual no cadastro
-            if (assinatura and assinatura.status == "active") or usuario.plano == "anual":
-                return True
-            return False
+def tem_assinatura_ativa(direitos):
+    # Se tem assinatura ativa ou está marcado como anual no cadastro
+    return bool(direitos) and (direitos["status_assinatura"] == "active" or direitos["plano"] == "anual")
 
-        # Verificação para plano gratuito
-        elif plano == "gratuito":
-            # Se nunca gerou ou a última geração foi há mais de 30 dias
-            if not usuario.ultima_geracao:
-                return True
-                
-            ultima = datetime.strptime(str(usuario.ultima_geracao), "%Y-%m-%d %H:%M:%S")
-            return (datetime.now() - ultima).days >= 30
+def dias_para_gerar_gratuito(direitos):
+    """Dias até a próxima geração gratuita (0 = já pode gerar)"""
+    if not direitos:
+        return 0
+    return cotas_geracao.dias_para_liberar("gratuito", direitos.get("cota_inicio"), direitos.get("cota_usada", 0))
 
-        return False
+def contexto_cota_gratuita(direitos):
+    """Janela da cota gratuita (COTA_GRATUITO_DIAS) e dias já corridos nela, para os templates.
+
+    A janela inteira corrida significa geração gratuita liberada.
+    """
+    janela = cotas_geracao.janela_dias("gratuito")
+    dias_restantes = dias_para_gerar_gratuito(direitos)
+    return {"janela": janela, "dias_desde_ultima": janela - min(dias_restantes, janela)}
+
+def reservar_geracao(email, plano):
+    """Reserva uma geração na cota do plano; retorna a Reserva ou None se não pode gerar.
+
+    A conferência e o consumo da cota são o mesmo UPDATE, então envios
+    simultâneos não passam os dois. Quem reservou e não gerou devolve com
+    liberar_geracao.
+    """
+    try:
+        # Plano anual exige assinatura ativa (usuário inexistente não tem)
+        if plano == "anual" and not tem_assinatura_ativa(obter_direitos(email)):
+            return None
+
+        reserva = cotas_geracao.reservar(email, plano)
+        metricas.cotas_geracao.labels(plano, "reservada" if reserva else "esgotada").inc()
+        invalidar_direitos(email)
+        return reserva
 
     except Exception as e:
-        logging.error(f"Erro na verificação de plano: {e}")
-        return False
+        logging.error(f"Erro na reserva de cota de geração: {e}")
+        return None
+
+def liberar_geracao(payload):
+    """Devolve a cota reservada para um job de geração que falhou de vez"""
+    if not payload.get("cota_inicio"):
+        return
+    try:
+        if cotas_geracao.liberar(payload["email"], payload["cota_inicio"]):
+            metricas.cotas_geracao.labels(payload["plano"], "liberada").inc()
+        invalidar_direitos(payload["email"])
+    except Exception as e:
+        logging.error(f"Erro ao liberar cota de geração de {payload['email']}: {e}")
 
 
 def calcular_semanas(tempo_melhoria):
@@ -185,7 +480,9 @@ def calcular_semanas(tempo_melhoria):
         logging.error(f"Erro ao calcular semanas: {e}")
         return 4
 
-def registrar_geracao(email, plano):
+def registrar_geracao(email, plano, tipo_treino=None, uso=None):
+    """Registra a geração; `uso` (modelo, tokens, latência) fica vazio para planos do cache"""
+    uso = uso or {}
     try:
         hoje = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
@@ -221,10 +518,21 @@ def registrar_geracao(email, plano):
             conn.execute(
                 text("""
                     INSERT INTO geracoes 
-                    (usuario_id, data_geracao, tipo_plano)
-                    VALUES (:usuario_id, :data, :plano)
+                    (usuario_id, data_geracao, tipo_plano, tipo_treino, modelo,
+                     tokens_prompt, tokens_completion, latencia_ms)
+                    VALUES (:usuario_id, :data, :plano, :tipo_treino, :modelo,
+                            :tokens_prompt, :tokens_completion, :latencia_ms)
                 """),
-                {"usuario_id": usuario_id, "data": hoje, "plano": plano}
+                {
+                    "usuario_id": usuario_id,
+                    "data": hoje,
+                    "plano": plano,
+                    "tipo_treino": tipo_treino,
+                    "modelo": uso.get("modelo"),
+                    "tokens_prompt": uso.get("tokens_prompt"),
+                    "tokens_completion": uso.get("tokens_completion"),
+                    "latencia_ms": uso.get("latencia_ms")
+                }
             )
 
             # Atualiza última geração
@@ -236,7 +544,8 @@ def registrar_geracao(email, plano):
                 """),
                 {"usuario_id": usuario_id, "data": hoje}
             )
-            
+
+        invalidar_direitos(email)
         return True
         
     except Exception as e:
@@ -244,61 +553,270 @@ def registrar_geracao(email, plano):
         db.rollback()
         return False
 
-async def gerar_plano_openai(prompt, semanas):
-    try:
-        model = "gpt-3.5-turbo-16k" if semanas > 12 else "gpt-3.5-turbo"
-        
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": "Você é um treinador de corrida experiente. Siga exatamente as instruções fornecidas."},
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.7,
+def salvar_plano(email, tipo_plano, titulo, conteudo):
+    """Guarda o plano gerado no servidor; a sessão leva apenas o id"""
+    plano_id = str(uuid.uuid4())
+    with engine.begin() as conn:
+        conn.execute(
+            text("""
+                INSERT INTO planos (id, email, tipo_plano, titulo, conteudo, criado_em)
+                VALUES (:id, :email, :tipo_plano, :titulo, :conteudo, NOW())
+            """),
+            {
+                "id": plano_id,
+                "email": email,
+                "tipo_plano": tipo_plano,
+                "titulo": titulo,
+                "conteudo": conteudo
+            }
         )
-        return response.choices[0].message.content.strip()
+    return plano_id
+
+def carregar_plano(plano_id, email):
+    """Retorna o plano salvo, desde que pertença ao email informado"""
+    try:
+        uuid.UUID(str(plano_id))
+    except ValueError:
+        return None
+
+    try:
+        return db.execute(
+            text("""
+                SELECT id, email, tipo_plano, titulo, conteudo, criado_em
+                FROM planos
+                WHERE id = :id AND email = :email
+            """),
+            {"id": str(plano_id), "email": email}
+        ).fetchone()
     except Exception as e:
-        logging.error(f"Erro ao gerar plano: {e}")
-        return "Erro ao gerar o plano. Tente novamente mais tarde."
+        logging.error(f"Erro ao carregar plano {plano_id}: {e}")
+        db.rollback()
+        return None
+
+def pdf_do_plano(plano):
+    """Bytes do PDF do plano salvo, renderizado uma vez por versão do conteúdo"""
+    chave = chave_pdf(plano)
+    pdf = cache_pdfs.obter(chave)
+    if pdf is None:
+        pdf = renderizar_pdf(plano.titulo, plano.conteudo)
+        cache_pdfs.guardar(chave, pdf)
+    return pdf
+
+def nome_arquivo_pdf(plano):
+    return f"Plano_Treino_{plano.criado_em.strftime('%Y%m%d')}.pdf"
+
+def anexo_pdf_plano(ref):
+    """Resolve na hora do envio o PDF anexado por referência a um e-mail da fila"""
+    plano = carregar_plano(ref["plano_id"], ref["email"])
+    if not plano:
+        raise ValueError(f"Plano {ref['plano_id']} não encontrado para anexar")
+    return nome_arquivo_pdf(plano), "application/pdf", pdf_do_plano(plano)
+
+caixa_saida.registrar_anexo("pdf_plano", anexo_pdf_plano)
+
+def mensagens_openai(prompt):
+    return [
+        {"role": "system", "content": "Você é um treinador de corrida experiente. Siga exatamente as instruções fornecidas."},
+        {"role": "user", "content": prompt},
+    ]
 
-def enviar_email_confirmacao_pagamento(email, nome="Cliente"):
+def rotear_geracao(prompts, semanas_blocos, dados, tipo_plano):
+    """Rotas (modelo e max_tokens) de cada bloco; levanta OrcamentoEsgotado sem orçamento no dia"""
+    rotas = roteador_modelos.escolher_blocos(
+        [mensagens_openai(p) for p in prompts], semanas_blocos, dados["dias"], tipo_plano
+    )
+    logging.info(
+        f"Geração {tipo_plano} de {sum(semanas_blocos)} semana(s) em {len(rotas)} chamada(s): "
+        f"{rotas[0].modelo}, max_tokens={[r.max_tokens for r in rotas]}, "
+        f"~{sum(r.tokens_prompt for r in rotas)} tokens de prompt, "
+        f"custo estimado US$ {round(sum(r.custo_estimado for r in rotas), 6)}"
+    )
+    return rotas
+
+def parametros_openai(prompt, rota):
+    return {
+        "model": rota.modelo,
+        "max_tokens": rota.max_tokens,
+        "messages": mensagens_openai(prompt),
+        "temperature": 0.7,
+    }
+
+def medir_openai(modelo, inicio, usage=None, erro=None, truncado=False):
+    """Registra a chamada nas métricas e no orçamento; retorna o uso para a tabela geracoes"""
+    latencia = time.perf_counter() - inicio
+    resultado = "erro" if erro else "truncado" if truncado else "ok"
+    metricas.openai_latencia.labels(modelo, resultado).observe(latencia)
+    if truncado:
+        logging.warning(f"Resposta de {modelo} cortada pelo max_tokens")
+
+    uso = {"modelo": modelo, "tokens_prompt": None, "tokens_completion": None, "latencia_ms": int(latencia * 1000)}
+    if usage is not None:
+        metricas.openai_tokens.labels(modelo, "prompt").inc(usage.prompt_tokens)
+        metricas.openai_tokens.labels(modelo, "completion").inc(usage.completion_tokens)
+        roteador_modelos.registrar_consumo(usage.prompt_tokens + usage.completion_tokens)
+        uso.update(tokens_prompt=usage.prompt_tokens, tokens_completion=usage.completion_tokens)
+    return uso
+
+async def chamar_openai(prompt, rota):
+    """Retorna (texto, uso)"""
+    inicio = time.perf_counter()
     try:
-        msg = Message(
-            subject="✅ Pagamento Confirmado - TreinoRun",
-            recipients=[email],
-            html=f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <style>
-                    body {{ font-family: Arial, sans-serif; line-height: 1.6; }}
-                    .header {{ background-color: #27ae60; color: white; padding: 20px; text-align: center; }}
-                    .content {{ padding: 20px; }}
-                    .footer {{ text-align: center; padding: 10px; font-size: 12px; color: #777; }}
-                </style>
-            </head>
-            <body>
-                <div class="header">
-                    <h2>Pagamento Confirmado!</h2>
-                </div>
-                <div class="content">
-                    <p>Olá {nome},</p>
-                    <p>Seu pagamento foi processado com sucesso e seu plano anual foi ativado!</p>
-                    <p>Agora você pode gerar quantos planos de treino quiser durante 1 ano.</p>
-                    <p><a href="https://treinorun.com.br/" style="background-color: #27ae60; color: white; padding: 10px 20px; text-decoration: none; border-radius: 5px;">Criar Novo Treino</a></p>
-                </div>
-                <div class="footer">
-                    <p>© {datetime.now().year} TreinoRun • <a href="https://treinorun.com.br">www.treinorun.com.br</a></p>
-                </div>
-            </body>
-            </html>
-            """
+        response = await client.chat.completions.create(**parametros_openai(prompt, rota))
+    except Exception as e:
+        medir_openai(rota.modelo, inicio, erro=e)
+        raise
+    escolha = response.choices[0]
+    uso = medir_openai(rota.modelo, inicio, response.usage, truncado=escolha.finish_reason == "length")
+    return escolha.message.content.strip(), uso
+
+async def chamar_openai_stream(prompt, rota, deltas):
+    """Igual a chamar_openai, mas coloca cada trecho recebido em `deltas` (queue.Queue)"""
+    inicio = time.perf_counter()
+    partes, usage, finish_reason = [], None, None
+    try:
+        # include_usage: o último trecho traz a contagem de tokens
+        stream = await client.chat.completions.create(
+            **parametros_openai(prompt, rota), stream=True, stream_options={"include_usage": True}
         )
-        mail.send(msg)
-        logging.info(f"E-mail de confirmação enviado para {email}")
+        async for chunk in stream:
+            if chunk.usage:
+                usage = chunk.usage
+            if chunk.choices:
+                finish_reason = chunk.choices[0].finish_reason or finish_reason
+                if chunk.choices[0].delta.content:
+                    partes.append(chunk.choices[0].delta.content)
+                    deltas.put(chunk.choices[0].delta.content)
+    except Exception as e:
+        medir_openai(rota.modelo, inicio, erro=e)
+        raise
+    uso = medir_openai(rota.modelo, inicio, usage, truncado=finish_reason == "length")
+    return "".join(partes).strip(), uso
+
+def preparar_geracao(prompt, semanas, dados, tipo_plano):
+    """Blocos (None para chamada única), prompts e rotas de uma geração.
+
+    O roteamento consulta o orçamento diário no banco, por isso roda na thread
+    de quem chama e não no event loop.
+    """
+    if not GERACAO_BLOCOS_MIN_SEMANAS or semanas < GERACAO_BLOCOS_MIN_SEMANAS:
+        return None, [prompt], rotear_geracao([prompt], [semanas], dados, tipo_plano)
+
+    blocos = dividir_em_blocos(semanas, GERACAO_BLOCOS_MAX_SEMANAS)
+    prompts = [prompt_bloco(prompt, bloco, blocos, semanas) for bloco in blocos]
+    rotas = rotear_geracao(prompts, [bloco.fim - bloco.inicio + 1 for bloco in blocos], dados, tipo_plano)
+    logging.info(f"Plano de {semanas} semanas dividido em {len(blocos)} bloco(s)")
+    return blocos, prompts, rotas
+
+async def executar_todos(corrotinas):
+    """Como asyncio.gather, mas cancela as demais quando uma falha"""
+    tarefas = [asyncio.ensure_future(c) for c in corrotinas]
+    try:
+        return await asyncio.gather(*tarefas)
+    except Exception:
+        for tarefa in tarefas:
+            tarefa.cancel()
+        raise
+
+def somar_usos(usos, inicio):
+    """Uso de uma geração em blocos: tokens somados, latência de ponta a ponta"""
+    def somar(campo):
+        valores = [u[campo] for u in usos if u[campo] is not None]
+        return sum(valores) if valores else None
+
+    return {
+        # Modelo do bloco que mais gerou tokens
+        "modelo": max(usos, key=lambda u: u["tokens_completion"] or 0)["modelo"],
+        "tokens_prompt": somar("tokens_prompt"),
+        "tokens_completion": somar("tokens_completion"),
+        "latencia_ms": int((time.perf_counter() - inicio) * 1000),
+    }
+
+async def gerar_plano(preparo, deltas=None):
+    """Gera o plano preparado por preparar_geracao; retorna (texto, uso).
+
+    Com `deltas`, os trechos são repassados conforme chegam (na ordem das
+    semanas, quando em blocos).
+    """
+    blocos, prompts, rotas = preparo
+    if blocos is None:
+        if deltas is None:
+            return await chamar_openai(prompts[0], rotas[0])
+        return await chamar_openai_stream(prompts[0], rotas[0], deltas)
+
+    inicio = time.perf_counter()
+    ordenados = DeltasOrdenados(deltas, len(blocos)) if deltas is not None else None
+
+    async def gerar_bloco(i):
+        if ordenados is None:
+            return await chamar_openai(prompts[i], rotas[i])
+        try:
+            return await chamar_openai_stream(prompts[i], rotas[i], ordenados.bloco(i))
+        finally:
+            ordenados.concluir(i)
+
+    resultados = await executar_todos(gerar_bloco(i) for i in range(len(blocos)))
+    textos = [texto for texto, _ in resultados]
+    usos = [uso for _, uso in resultados]
+    plano, faltando = juntar_blocos(blocos, textos)
+
+    if faltando and ordenados is None:
+        # Sem streaming ainda dá para pedir de novo, uma vez, os blocos incompletos
+        refazer = [i for i, bloco in enumerate(blocos) if validar_bloco(bloco, textos[i])[1]]
+        logging.warning(f"Semanas {faltando} ausentes; gerando de novo {len(refazer)} bloco(s)")
+        for i, (texto, uso) in zip(refazer, await executar_todos(gerar_bloco(i) for i in refazer)):
+            textos[i] = texto
+            usos.append(uso)
+        plano, faltando = juntar_blocos(blocos, textos)
+
+    if faltando:
+        logging.warning(f"Plano de {len(blocos)} bloco(s) costurado sem as semanas {faltando}")
+    return plano, somar_usos(usos, inicio)
+
+def gerar_local(payload, semanas, motivo):
+    """Plano do motor local, com o mesmo retorno (texto, uso) da OpenAI"""
+    inicio = time.perf_counter()
+    texto = gerar_plano_local(payload["tipo_plano"], payload["dados"], semanas)
+    metricas.geracoes_locais.labels(motivo).inc()
+    uso = {
+        "modelo": "local",
+        "tokens_prompt": None,
+        "tokens_completion": None,
+        "latencia_ms": int((time.perf_counter() - inicio) * 1000)
+    }
+    return texto, uso
+
+def gerar_reserva(payload, semanas, erro):
+    """Plano local quando a OpenAI falhou; com RESERVA_LOCAL=0 o erro segue adiante"""
+    if not RESERVA_LOCAL:
+        raise erro
+    if isinstance(erro, OrcamentoEsgotado):
+        motivo = "orcamento"
+    elif isinstance(erro, TimeoutError):
+        motivo = "prazo"
+    else:
+        motivo = "erro"
+    logging.warning(f"Geração pela OpenAI falhou ({motivo}: {erro!r}); usando o motor local")
+    return gerar_local(payload, semanas, motivo)
+
+def enviar_email_confirmacao_pagamento(email, nome="Cliente", chave=None):
+    """`chave` identifica a compra: o webhook reprocessado não manda o e-mail de novo"""
+    try:
+        # O Jinja compila o template uma vez e o reaproveita nas próximas chamadas
+        html = render_template(
+            "email/email_confirmacao.html",
+            nome=nome,
+            ano=datetime.now().year
+        )
+        caixa_saida.enfileirar(
+            assunto="✅ Pagamento Confirmado - TreinoRun",
+            destinatarios=[email],
+            html=html,
+            chave=chave
+        )
+        logging.info(f"E-mail de confirmação enfileirado para {email}")
         return True
     except Exception as e:
-        logging.error(f"Erro ao enviar e-mail de confirmação: {e}")
+        logging.error(f"Erro ao enfileirar e-mail de confirmação: {e}")
         return False
 
 # ================================================
@@ -306,7 +824,7 @@ def enviar_email_confirmacao_pagamento(email, nome="Cliente"):
 # ================================================
 
 @app.route("/")
-@limiter.limit("100 per hour")
+@limite_local("100 per hour")
 def landing():
     try:
         # Verifica se tem email na sessão ou na URL (?email=)
@@ -314,19 +832,17 @@ def landing():
 
         assinatura_ativa = False
         plano = "gratuito"
+        usuario = None
 
         if email:
-            usuario = db.execute(
-                text("SELECT * FROM usuarios WHERE email = :email"),
-                {"email": email}
-            ).fetchone()
+            usuario = obter_direitos(email)
 
             if usuario:
-                assinatura_ativa = usuario.plano == "anual"
-                plano = usuario.plano
+                assinatura_ativa = usuario["plano"] == "anual"
+                plano = usuario["plano"]
 
                 # Atualiza a sessão
-                session["email"] = usuario.email
+                session["email"] = usuario["email"]
                 session["plano"] = plano
                 session["assinatura_ativa"] = assinatura_ativa
             else:
@@ -335,16 +851,29 @@ def landing():
                 session["plano"] = "gratuito"
                 session["assinatura_ativa"] = False
         else:
-            # Se não tem email, limpa dados de sessão relacionados
-            session["assinatura_ativa"] = False
-            session["plano"] = "gratuito"
-            session.pop("email", None)
+            # Visitante anônimo: só mexe na sessão se houver algo a limpar,
+            # para não devolver Set-Cookie em toda visita
+            if "email" in session or session.get("assinatura_ativa") or session.get("plano", "gratuito") != "gratuito":
+                session["assinatura_ativa"] = False
+                session["plano"] = "gratuito"
+                session.pop("email", None)
+
+            # Mesma página para todo anônimo: servida do cache e revalidada pelo ETag
+            return cache_respostas.responder(
+                "landing:anonimo",
+                lambda: render_template(
+                    "landing.html", email=None, plano="gratuito", assinatura_ativa=False,
+                    janela=cotas_geracao.janela_dias("gratuito")
+                ),
+                "no-cache"
+            )
 
         return render_template(
             "landing.html",
             email=session.get("email"),
             plano=session.get("plano", "gratuito"),
-            assinatura_ativa=session.get("assinatura_ativa", False)
+            assinatura_ativa=session.get("assinatura_ativa", False),
+            **contexto_cota_gratuita(usuario)
         )
 
     except Exception as e:
@@ -364,10 +893,10 @@ def landing():
 
 
 @app.route("/blog")
-@limiter.limit("100 per hour")
+@limite_local("100 per hour")
 def blog():
     try:
-        return render_template("blog.html")
+        return cache_respostas.responder("blog", lambda: render_template("blog.html"), CACHE_CONTROL_PUBLICO)
     except Exception as e:
         logging.error(f"Erro ao renderizar blog.html: {e}")
         return """
@@ -385,7 +914,7 @@ def blog():
         """, 200
 
 @app.route("/seutreino")
-@limiter.limit("100 per hour")
+@limite_local("100 per hour")
 def seutreino():
     try:
         # Verifica se o usuário está logado
@@ -395,37 +924,23 @@ def seutreino():
         email = session["email"]
         assinatura_ativa = session.get("assinatura_ativa", False)
         
-        # Busca informações do usuário no banco
-        usuario = db.execute(
-            text("""
-                SELECT u.*, 
-                (SELECT status FROM assinaturas 
-                 WHERE usuario_id = u.id 
-                 ORDER BY id DESC LIMIT 1) as status_assinatura
-                FROM usuarios u 
-                WHERE email = :email
-            """),
-            {"email": email}
-        ).fetchone()
+        # Busca informações do usuário (cache de direitos)
+        usuario = obter_direitos(email)
 
         # Atualiza status da assinatura na sessão
-        if usuario and usuario.status_assinatura == "active":
+        if usuario and usuario["status_assinatura"] == "active":
             session["assinatura_ativa"] = True
             assinatura_ativa = True
 
-        # Calcula dias desde última geração (para plano gratuito)
-        dias_desde_ultima = 0
-        if usuario and usuario.ultima_geracao:
-            ultima = datetime.strptime(str(usuario.ultima_geracao), "%Y-%m-%d %H:%M:%S")
-            dias_desde_ultima = (datetime.now() - ultima).days
+        cota = contexto_cota_gratuita(usuario)
 
         return render_template(
             "seutreino.html",
             email=email,
             assinatura_ativa=assinatura_ativa,
-            dias_desde_ultima=dias_desde_ultima,
-            pode_gerar_gratuito=(dias_desde_ultima >= 30) if not assinatura_ativa else True,
-            nome=usuario.nome if usuario and hasattr(usuario, 'nome') else ""
+            **cota,
+            pode_gerar_gratuito=(cota["dias_desde_ultima"] >= cota["janela"]) if not assinatura_ativa else True,
+            nome=usuario["nome"] if usuario else ""
         )
         
     except Exception as e:
@@ -434,7 +949,7 @@ def seutreino():
         return redirect(url_for("landing"))
 
 @app.route("/sucesso")
-@limiter.limit("100 per hour")
+@limite_local("100 per hour")
 def sucesso():
     try:
         email = session.get("email")
@@ -444,15 +959,12 @@ def sucesso():
             email = request.args.get("email")
 
         if email:
-            usuario = db.execute(
-                text("SELECT * FROM usuarios WHERE email = :email"),
-                {"email": email}
-            ).fetchone()
+            usuario = obter_direitos(email)
 
             if usuario:
                 # Garante que o plano e email estejam corretos na sessão
-                session["plano"] = usuario.plano
-                session["email"] = usuario.email  # Atualiza email também para garantir
+                session["plano"] = usuario["plano"]
+                session["email"] = usuario["email"]  # Atualiza email também para garantir
             else:
                 logging.warning(f"Usuário não encontrado para email: {email}")
         else:
@@ -475,10 +987,10 @@ def sucesso():
         """), 200
 
 @app.route("/pendente")
-@limiter.limit("100 per hour")
+@limite_local("100 per hour")
 def pendente():
     try:
-        return render_template("pendente.html")
+        return cache_respostas.responder("pendente", lambda: render_template("pendente.html"), CACHE_CONTROL_PUBLICO)
     except Exception as e:
         logging.error(f"Erro ao renderizar pendente.html: {e}")
         return render_template_string("""
@@ -493,10 +1005,10 @@ def pendente():
         """), 200
 
 @app.route("/erro")
-@limiter.limit("100 per hour")
+@limite_local("100 per hour")
 def erro():
     try:
-        return render_template("erro.html")
+        return cache_respostas.responder("erro", lambda: render_template("erro.html"), CACHE_CONTROL_PUBLICO)
     except Exception as e:
         logging.error(f"Erro ao renderizar erro.html: {e}")
         return render_template_string("""
@@ -511,13 +1023,41 @@ def erro():
         """), 200
 
 @app.route("/resultado")
-@limiter.limit("100 per hour")
+@limite_local("100 per hour")
 def resultado():
     try:
         titulo = session.get("titulo", "Plano de Treino")
-        plano = session.get("plano_gerado", "Nenhum plano gerado.")  # 🔥 Corrigido aqui!
+        plano = "Nenhum plano gerado."
+        plano_id = request.args.get("plano") or session.get("plano_id")
+        job_pendente = None
+
+        job = obter_job_geracao(request.args.get("job") or session.get("job_id"))
+        if job and not request.args.get("plano"):
+            if job.status == "concluido":
+                plano_id = job.resultado["plano_id"]
+            elif job.status == "falhou":
+                plano = "Erro ao gerar o plano. Tente novamente mais tarde."
+                plano_id = None
+            else:
+                # Ainda na fila: a página consulta /status até o plano ficar pronto
+                plano = ""
+                plano_id = None
+                job_pendente = job.id
 
-        return render_template("resultado.html", titulo=titulo, plano=plano)
+        plano_salvo = carregar_plano(plano_id, session.get("email")) if plano_id else None
+        if plano_salvo:
+            titulo = plano_salvo.titulo
+            plano = plano_salvo.conteudo
+            session["plano_id"] = str(plano_salvo.id)
+
+        return render_template(
+            "resultado.html",
+            titulo=titulo,
+            plano=plano,
+            plano_id=str(plano_salvo.id) if plano_salvo else None,
+            job_id=job_pendente,
+            streaming=STREAMING_PLANOS
+        )
     except Exception as e:
         logging.error(f"Erro ao renderizar resultado.html: {e}")
         return f"""
@@ -525,19 +1065,39 @@ def resultado():
         <html>
         <body>
             <h1>{session.get('titulo', 'Plano de Treino')}</h1>
-            <pre>{session.get('plano_gerado', 'Nenhum plano gerado.')}</pre>
+            <p>Não foi possível carregar o plano. Atualize a página em alguns instantes.</p>
         </body>
         </html>
         """, 200
 
+@app.route("/plano/<plano_id>/pdf")
+@limite_local("30 per hour")
+def baixar_pdf(plano_id):
+    plano_salvo = carregar_plano(plano_id, session.get("email"))
+    if not plano_salvo:
+        return render_template("erro.html", mensagem="Plano não encontrado"), 404
+
+    try:
+        pdf = pdf_do_plano(plano_salvo)
+    except Exception as e:
+        logging.error(f"Erro ao gerar PDF do plano {plano_id}: {e}", exc_info=True)
+        return render_template("erro.html", mensagem="Erro ao gerar o PDF do plano"), 500
+
+    return Response(
+        pdf,
+        mimetype="application/pdf",
+        headers={
+            "Content-Disposition": f'attachment; filename="{nome_arquivo_pdf(plano_salvo)}"',
+            "Cache-Control": "private, max-age=3600"
+        }
+    )
+
 @app.route("/artigos/<slug>")
-@limiter.limit("100 per hour")
+@limite_local("100 per hour")
 def artigos(slug):
     try:
-        email = session.get("email")
-        plano = session.get("plano", "gratuito")
-        assinatura_ativa = session.get("assinatura_ativa", False)
-
+        # Os artigos não dependem da sessão (nem a leem, para o Flask não
+        # acrescentar Vary: Cookie), então a mesma resposta serve a todos e à CDN
         # Mapeia os slugs válidos para seus respectivos arquivos de template
         artigos_disponiveis = {
             "alimentacao": "artigos/artigo-alimentacao.html",
@@ -549,11 +1109,10 @@ def artigos(slug):
         if slug not in artigos_disponiveis:
             return render_template_string("<h1>Artigo não encontrado</h1>"), 404
 
-        return render_template(
-            artigos_disponiveis[slug],
-            email=email,
-            plano=plano,
-            assinatura_ativa=assinatura_ativa
+        return cache_respostas.responder(
+            f"artigo:{slug}",
+            lambda: render_template(artigos_disponiveis[slug]),
+            CACHE_CONTROL_PUBLICO
         )
     except Exception as e:
         logging.error(f"Erro ao renderizar artigo {slug}: {e}")
@@ -564,35 +1123,39 @@ def artigos(slug):
 # ROTAS DE GERAÇÃO DE PLANOS
 # ================================================
 
-@app.route("/generate", methods=["POST"])
-@limiter.limit("10 per hour")
-@async_route
-async def generate():
-    try:
-        # Verificação de autenticação
-        if "email" not in session:
-            return redirect(url_for("landing"))
-            
-        email = session["email"]
-        assinatura_ativa = session.get("assinatura_ativa", False)
-        plano = "anual" if assinatura_ativa else "gratuito"
-
-        # Verificação de permissão
-        if not pode_gerar_plano(email, plano):
-            if not assinatura_ativa:
-                return redirect(url_for("iniciar_pagamento", email=email, upgrade=True))
-            return render_template("erro.html", mensagem="Você não tem permissão para gerar este plano"), 403
-
-        # Validação dos dados do formulário
-        dados = request.form
-        required_fields = ["objetivo", "tempo_melhoria", "nivel", "dias", "tempo"]
-        if not all(field in dados for field in required_fields):
-            return render_template("erro.html", mensagem="Dados do formulário incompletos"), 400
-
-        # Cálculo de semanas e geração do prompt
-        semanas = calcular_semanas(dados['tempo_melhoria'])
+# Com streaming, o worker publica os trechos do plano no canal da geração
+# (Redis) enquanto chegam da OpenAI e a página de resultado os acompanha por
+# /stream. Sem Redis a página só consulta /status
+STREAMING_PLANOS = os.getenv("STREAMING_PLANOS", "1") == "1" and redis_client is not None
+canal_geracao = CanalGeracao(redis_client)
+
+# Cada /stream aberto ocupa uma thread web só lendo o canal; acima deste
+# número por processo o navegador consulta /status, para não faltar thread
+# para as demais rotas
+ESPERA_STREAM = float(os.getenv("ESPERA_STREAM", 15))
+streams_abertos = threading.BoundedSemaphore(int(os.getenv("STREAMS_SIMULTANEOS", 8)))
+
+def montar_prompt(tipo_plano, dados, semanas):
+    if tipo_plano == "pace":
+        return f"""
+        Você é um treinador de corrida especializado em melhoria de pace. Crie um plano detalhado com foco em ritmo com base nestes dados:
+        
+        Objetivo: {dados['objetivo']}
+        Tempo para melhoria: {dados['tempo_melhoria']}
+        Nível atual: {dados['nivel']}
+        Dias disponíveis por semana: {dados['dias']}
+        Tempo disponível por treino: {dados['tempo']} minutos
+        Duração do plano: {semanas} semanas
         
-        prompt = f"""
+        Estruture o plano com:
+        - Treinos intervalados específicos
+        - Progressão de ritmo semana a semana
+        - Testes de pace regulares
+        - Aquecimentos e desaquecimentos adequados
+        - Semana final com teste do pace alvo
+        """
+
+    return f"""
         Você é um treinador de corrida profissional. Crie um plano detalhado com base nestes dados:
         
         Objetivo: {dados['objetivo']}
@@ -609,101 +1172,296 @@ async def generate():
         - Progressão gradual
         - Semana final com teste do objetivo
         """
-        
-        # Chamada à API da OpenAI
-        plano_gerado = await gerar_plano_openai(prompt, semanas)
-        
-        # Registro no banco de dados
-        if not registrar_geracao(email, plano):
-            logging.error(f"Falha ao registrar geração para {email}")
-            return render_template("erro.html", mensagem="Erro ao salvar seu plano"), 500
-
-        # Prepara dados para a sessão e resultado
-        session["titulo"] = f"Plano de Treino - {dados['objetivo']}"
-        session["plano_gerado"] = f"""
-        Plano gerado em {datetime.now().strftime('%d/%m/%Y %H:%M')}
+
+def chave_cache_plano(tipo_plano, dados, semanas):
+    """Chave do cache de planos a partir das entradas normalizadas"""
+    def normalizar(valor):
+        return re.sub(r"\s+", " ", str(valor)).strip().lower()
+
+    entradas = {
+        "tipo_plano": tipo_plano,
+        "objetivo": normalizar(dados["objetivo"]),
+        "nivel": normalizar(dados["nivel"]),
+        "dias": normalizar(dados["dias"]),
+        "tempo": normalizar(dados["tempo"]),
+        "semanas": semanas
+    }
+    return hashlib.sha256(json.dumps(entradas, sort_keys=True).encode("utf-8")).hexdigest()
+
+def buscar_plano_em_cache(chave):
+    if not cache_planos.max_reusos:
+        return None
+    return cache_planos.obter(chave)
+
+def guardar_plano_em_cache(chave, plano_gerado):
+    if cache_planos.max_reusos:
+        cache_planos.guardar(chave, plano_gerado)
+
+def formatar_plano(tipo_plano, plano_gerado):
+    rotulo = "Plano de pace gerado em" if tipo_plano == "pace" else "Plano gerado em"
+    return f"""
+        {rotulo} {datetime.now().strftime('%d/%m/%Y %H:%M')}
         =====================================
         {plano_gerado}
         """
-        
-        return redirect(url_for("resultado"))
-        
+
+def concluir_geracao(payload, plano_gerado, uso=None):
+    """Registra a geração e salva o plano formatado na tabela planos"""
+    if not registrar_geracao(payload["email"], payload["plano"], payload["tipo_plano"], uso):
+        raise RuntimeError(f"Falha ao registrar geração para {payload['email']}")
+
+    conteudo = formatar_plano(payload["tipo_plano"], plano_gerado)
+    plano_id = salvar_plano(payload["email"], payload["tipo_plano"], payload["titulo"], conteudo)
+    return {"plano_id": plano_id, "titulo": payload["titulo"], "plano": conteudo}
+
+def referencia_job(resultado):
+    """O job guarda só a referência ao plano salvo, não o texto"""
+    return {"plano_id": resultado["plano_id"], "titulo": resultado["titulo"]}
+
+def plano_do_job(job):
+    """Carrega o plano salvo por um job concluído"""
+    plano_salvo = carregar_plano(job.resultado["plano_id"], job.payload["email"])
+    if not plano_salvo:
+        return None
+    return {
+        "plano_id": str(plano_salvo.id),
+        "titulo": plano_salvo.titulo,
+        "plano": plano_salvo.conteudo
+    }
+
+def gerar_transmitindo(preparo, publicar):
+    """Gera com streaming da OpenAI, chamando publicar(texto) na thread de quem chamou.
+
+    Levanta TimeoutError se o primeiro trecho não chegar em
+    PRAZO_PRIMEIRO_TRECHO ou o plano todo em PRAZO_OPENAI.
+    """
+    deltas = queue.Queue()
+    futuro = asyncio.run_coroutine_threadsafe(gerar_plano(preparo, deltas), obter_loop())
+    futuro.add_done_callback(lambda _: deltas.put(None))
+    limite = time.monotonic() + PRAZO_OPENAI
+    espera = PRAZO_PRIMEIRO_TRECHO
+    try:
+        fim = False
+        while not fim:
+            try:
+                trechos = [deltas.get(timeout=max(min(espera, limite - time.monotonic()), 0))]
+            except queue.Empty:
+                raise TimeoutError("OpenAI sem resposta dentro do prazo")
+            # Junta o que já chegou numa única publicação
+            while trechos[-1] is not None and not deltas.empty():
+                trechos.append(deltas.get_nowait())
+            fim = trechos[-1] is None
+            espera = PRAZO_OPENAI
+            publicar("".join(t for t in trechos if t is not None))
+        return futuro.result(max(limite - time.monotonic(), 0))
+    except BaseException:
+        futuro.cancel()
+        raise
+
+def executar_job_geracao(payload):
+    """Executado pelo worker: chama a OpenAI, registra a geração e devolve o plano.
+
+    Com streaming, cada trecho vai para o canal da geração assim que chega, e
+    o plano salvo (ou a falha da tentativa) fecha o canal.
+    """
+    dados = payload["dados"]
+    semanas = calcular_semanas(dados["tempo_melhoria"])
+    chave = chave_cache_plano(payload["tipo_plano"], dados, semanas)
+    canal = payload.get("canal") if STREAMING_PLANOS else None
+    uso = None
+
+    def gerar():
+        nonlocal uso
+        prompt = montar_prompt(payload["tipo_plano"], dados, semanas)
+        try:
+            preparo = preparar_geracao(prompt, semanas, dados, payload["tipo_plano"])
+            if canal:
+                texto, uso = gerar_transmitindo(preparo, partial(canal_geracao.publicar, canal))
+            else:
+                texto, uso = executar_no_loop(gerar_plano(preparo), timeout=PRAZO_OPENAI)
+        except Exception as e:
+            # Sem a reserva local, a exceção faz o job ser reagendado.
+            # O plano local não vai para o cache: a próxima tentativa volta à OpenAI
+            texto, uso = gerar_reserva(payload, semanas, e)
+            return texto
+        guardar_plano_em_cache(chave, texto)
+        return texto
+
+    # Uma nova tentativa apaga o que a anterior chegou a mostrar
+    canal_geracao.reiniciar(canal)
+    try:
+        if payload.get("modo") == "local":
+            plano_gerado, uso = gerar_local(payload, semanas, "modo")
+        else:
+            plano_gerado = buscar_plano_em_cache(chave)
+            if plano_gerado is None:
+                plano_gerado = singleflight_planos.executar(chave, gerar, timeout=TIMEOUT_SINGLEFLIGHT)
+
+        resultado = concluir_geracao(payload, plano_gerado, uso)
+    except Exception:
+        canal_geracao.falhar(canal, "Erro ao gerar o plano, tentando novamente...")
+        raise
+
+    # O evento "fim" leva o plano inteiro e substitui o que já foi mostrado
+    canal_geracao.concluir(canal, resultado)
+    return referencia_job(resultado)
+
+def enfileirar_geracao(tipo_plano):
+    """Valida a requisição, enfileira o job e redireciona para a página de resultado"""
+    # Verificação de autenticação
+    if "email" not in session:
+        return redirect(url_for("landing"))
+
+    email = session["email"]
+    assinatura_ativa = session.get("assinatura_ativa", False)
+    plano = "anual" if assinatura_ativa else "gratuito"
+
+    # Validação dos dados do formulário
+    dados = request.form
+    required_fields = ["objetivo", "tempo_melhoria", "nivel", "dias", "tempo"]
+    if not all(field in dados for field in required_fields):
+        return render_template("erro.html", mensagem="Dados do formulário incompletos"), 400
+
+    # Reserva da cota: devolvida se o job falhar de vez
+    reserva = reservar_geracao(email, plano)
+    if not reserva:
+        if not assinatura_ativa:
+            return redirect(url_for("iniciar_pagamento", email=email, upgrade=True))
+        return render_template("erro.html", mensagem="Você não tem permissão para gerar este plano"), 403
+
+    # Modo "local" gera na hora pelo motor de regras, sem a OpenAI
+    modo = dados.get("modo", MODO_GERACAO)
+    if modo not in MODOS_GERACAO:
+        modo = MODO_GERACAO
+
+    prefixo = "Plano de Pace" if tipo_plano == "pace" else "Plano de Treino"
+    titulo = f"{prefixo} - {dados['objetivo']}"
+
+    payload = {
+        "email": email,
+        "plano": plano,
+        "tipo_plano": tipo_plano,
+        "titulo": titulo,
+        "modo": modo,
+        "cota_inicio": reserva.inicio.isoformat(),
+        "canal": uuid.uuid4().hex if STREAMING_PLANOS else None,
+        "dados": {campo: dados[campo] for campo in required_fields}
+    }
+    try:
+        job_id = fila.enfileirar("geracao_plano", payload, max_tentativas=3)
+    except Exception:
+        liberar_geracao(payload)
+        raise
+
+    # A sessão guarda só a referência ao job; o plano é buscado em /status
+    session["titulo"] = titulo
+    session["job_id"] = job_id
+
+    return redirect(url_for("resultado", job=job_id))
+
+@app.route("/generate", methods=["POST"])
+@limiter.limit("10 per hour")
+def generate():
+    try:
+        return enfileirar_geracao("corrida")
     except Exception as e:
         logging.error(f"Erro fatal em /generate: {str(e)}", exc_info=True)
         return render_template("erro.html", mensagem="Ocorreu um erro interno"), 500
 
 
-
-
 @app.route("/generatePace", methods=["POST"])
 @limiter.limit("10 per hour")
-@async_route
-async def generatePace():
+def generatePace():
     try:
-        # Verificação de autenticação
-        if "email" not in session:
-            return redirect(url_for("landing"))
-            
-        email = session["email"]
-        assinatura_ativa = session.get("assinatura_ativa", False)
-        plano = "anual" if assinatura_ativa else "gratuito"
-
-        # Verificação de permissão
-        if not pode_gerar_plano(email, plano):
-            if not assinatura_ativa:
-                return redirect(url_for("iniciar_pagamento", email=email, upgrade=True))
-            return render_template("erro.html", mensagem="Você não tem permissão para gerar este plano"), 403
-
-        # Validação dos dados do formulário
-        dados = request.form
-        required_fields = ["objetivo", "tempo_melhoria", "nivel", "dias", "tempo"]
-        if not all(field in dados for field in required_fields):
-            return render_template("erro.html", mensagem="Dados do formulário incompletos"), 400
-
-        # Cálculo de semanas e geração do prompt
-        semanas = calcular_semanas(dados['tempo_melhoria'])
-        
-        prompt = f"""
-        Você é um treinador de corrida especializado em melhoria de pace. Crie um plano detalhado com foco em ritmo com base nestes dados:
-        
-        Objetivo: {dados['objetivo']}
-        Tempo para melhoria: {dados['tempo_melhoria']}
-        Nível atual: {dados['nivel']}
-        Dias disponíveis por semana: {dados['dias']}
-        Tempo disponível por treino: {dados['tempo']} minutos
-        Duração do plano: {semanas} semanas
-        
-        Estruture o plano com:
-        - Treinos intervalados específicos
-        - Progressão de ritmo semana a semana
-        - Testes de pace regulares
-        - Aquecimentos e desaquecimentos adequados
-        - Semana final com teste do pace alvo
-        """
-        
-        # Chamada à API da OpenAI
-        plano_gerado = await gerar_plano_openai(prompt, semanas)
-        
-        # Registro no banco de dados
-        if not registrar_geracao(email, plano):
-            logging.error(f"Falha ao registrar geração de pace para {email}")
-            return render_template("erro.html", mensagem="Erro ao salvar seu plano de pace"), 500
-
-        # Prepara dados para a sessão e resultado
-        session["titulo"] = f"Plano de Pace - {dados['objetivo']}"
-        session["plano_gerado"] = f"""
-        Plano de pace gerado em {datetime.now().strftime('%d/%m/%Y %H:%M')}
-        =====================================
-        {plano_gerado}
-        """
-        
-        return redirect(url_for("resultado"))
-        
+        return enfileirar_geracao("pace")
     except Exception as e:
         logging.error(f"Erro fatal em /generatePace: {str(e)}", exc_info=True)
         return render_template("erro.html", mensagem="Ocorreu um erro ao gerar seu plano de pace"), 500
 
 
+def obter_job_geracao(job_id):
+    """Retorna o job de geração se ele pertencer ao usuário da sessão"""
+    job = fila.obter(job_id) if job_id else None
+    if not job or job.tipo != "geracao_plano" or job.payload.get("email") != session.get("email"):
+        return None
+    return job
+
+def evento_sse(evento, dados):
+    return f"event: {evento}\ndata: {json.dumps(dados)}\n\n"
+
+def acompanhar_geracao(job):
+    """Repassa como eventos SSE os trechos que o worker publica no canal do job.
+
+    A geração nunca roda aqui: a thread da requisição só lê o canal (Redis) e,
+    sem novidade em ESPERA_STREAM segundos, manda o navegador consultar /status.
+    """
+    yield ": conectado\n\n"
+    try:
+        for evento, dados in canal_geracao.acompanhar(job.payload["canal"], ESPERA_STREAM):
+            if evento == "delta":
+                yield evento_sse("delta", {"texto": dados})
+            elif evento == "erro":
+                yield evento_sse("erro", {"mensagem": dados})
+            elif evento == "aguardar":
+                yield evento_sse("aguardar", {"status": "executando"})
+            else:
+                yield evento_sse(evento, dados or {})
+    except Exception as e:
+        logging.error(f"Erro ao acompanhar o job {job.id}: {str(e)}")
+        yield evento_sse("aguardar", {"status": "executando"})
+
+@app.route("/stream/<job_id>")
+@limite_local("60 per hour")
+def stream_geracao(job_id):
+    try:
+        job = obter_job_geracao(job_id)
+        if not job:
+            return jsonify({"status": "nao_encontrado"}), 404
+
+        acompanhando = False
+        if job.status == "concluido":
+            gerador = iter([evento_sse("fim", plano_do_job(job))])
+        elif (job.status != "falhou" and STREAMING_PLANOS and job.payload.get("canal")
+              and streams_abertos.acquire(blocking=False)):
+            acompanhando = True
+            gerador = acompanhar_geracao(job)
+        else:
+            # Sem canal ou com streams demais abertos: o navegador consulta /status
+            gerador = iter([evento_sse("aguardar", {"status": job.status})])
+
+        resposta = Response(
+            gerador,
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+        if acompanhando:
+            # Chamado mesmo se o gerador nunca chegar a ser iterado
+            resposta.call_on_close(streams_abertos.release)
+        return resposta
+
+    except Exception as e:
+        logging.error(f"Erro no streaming do job {job_id}: {str(e)}", exc_info=True)
+        return jsonify({"status": "erro"}), 500
+
+@app.route("/status/<job_id>")
+@limite_local("600 per hour")
+def status_geracao(job_id):
+    try:
+        job = obter_job_geracao(job_id)
+        if not job:
+            return jsonify({"status": "nao_encontrado"}), 404
+
+        resposta = {"status": job.status}
+        if job.status == "concluido":
+            resposta.update(plano_do_job(job) or {})
+            session["plano_id"] = job.resultado["plano_id"]
+        elif job.status == "falhou":
+            resposta["mensagem"] = "Erro ao gerar o plano. Tente novamente mais tarde."
+        return jsonify(resposta), 200
+
+    except Exception as e:
+        logging.error(f"Erro ao consultar job {job_id}: {str(e)}", exc_info=True)
+        return jsonify({"status": "erro"}), 500
 
 
 @app.route("/send_plan_email", methods=["POST"])
@@ -713,13 +1471,14 @@ def send_plan_email():
         data = request.get_json()
 
         email_destino = data.get("email")
-        pdf_data_uri = data.get("pdfData")
-
-        if not email_destino or not pdf_data_uri:
+        if not email_destino:
             return jsonify({"message": "Dados incompletos"}), 400
 
-        # Extrair título do treino salvo na sessão
-        titulo_treino = session.get("titulo", "Seu Plano de Treino")
+        # O PDF é gerado no servidor a partir do plano salvo
+        plano_salvo = carregar_plano(data.get("plano_id") or session.get("plano_id"), session.get("email"))
+        if not plano_salvo:
+            return jsonify({"message": "Plano não encontrado"}), 404
+        titulo_treino = plano_salvo.titulo
 
         # Determinar se é treino de Pace ou Corrida
         if "pace" in titulo_treino.lower():
@@ -729,10 +1488,6 @@ def send_plan_email():
         else:
             descricao = "Seu treino personalizado está pronto!"
 
-        # Converter base64 para bytes
-        header, encoded = pdf_data_uri.split(",", 1)
-        pdf_bytes = base64.b64decode(encoded)
-
         # Criar mensagem HTML com cores da landing (verde e azul)
         corpo_html = f"""
         <!DOCTYPE html>
@@ -751,24 +1506,17 @@ def send_plan_email():
         </html>
         """
 
-        # Criar e-mail
-        msg = Message(
-            subject=f"🏃 {titulo_treino} - TreinoRun",
-            recipients=[email_destino],
+        # Enfileirar e-mail com o PDF anexado; o remetente envia em segundo plano
+        caixa_saida.enfileirar(
+            assunto=f"🏃 {titulo_treino} - TreinoRun",
+            destinatarios=[email_destino],
             html=corpo_html,
+            # O PDF vai por referência: o remetente o pega do cache na hora do
+            # envio, sem copiar o arquivo em base64 para dentro da fila
+            referencias=[("pdf_plano", {"plano_id": str(plano_salvo.id), "email": plano_salvo.email})]
         )
 
-        # Anexar o PDF
-        msg.attach(
-            filename=f"Plano_Treino_{datetime.now().strftime('%Y%m%d')}.pdf",
-            content_type="application/pdf",
-            data=pdf_bytes
-        )
-
-        # Enviar
-        mail.send(msg)
-
-        logging.info(f"E-mail de treino enviado para {email_destino}")
+        logging.info(f"E-mail de treino enfileirado para {email_destino}")
         return jsonify({"message": "E-mail enviado com sucesso"}), 200
 
     except Exception as e:
@@ -782,25 +1530,8 @@ def login():
     if not email:
         return redirect(url_for('landing'))
 
-    usuario = db.execute(
-        text("SELECT * FROM usuarios WHERE email = :email"),
-        {"email": email}
-    ).fetchone()
-
-    assinatura_ativa = False
-    if usuario:
-        # Verifica na tabela assinaturas se tem ativa
-        assinatura = db.execute(
-            text("""
-                SELECT status FROM assinaturas 
-                WHERE usuario_id = :usuario_id 
-                ORDER BY id DESC LIMIT 1
-            """),
-            {"usuario_id": usuario.id}
-        ).fetchone()
-
-        if (assinatura and assinatura.status == "active") or usuario.plano == "anual":
-            assinatura_ativa = True
+    # Verifica cadastro e última assinatura (cache de direitos)
+    assinatura_ativa = tem_assinatura_ativa(obter_direitos(email))
 
     session["email"] = email
     session["plano"] = "anual" if assinatura_ativa else "gratuito"
@@ -821,8 +1552,61 @@ def logout():
 # ROTAS DE PAGAMENTO (CORRIGIDAS)
 # ================================================
 
+def chave_preferencia(email, upgrade, preco):
+    return hashlib.sha256(f"{email.strip().lower()}|{int(upgrade)}|{preco:.2f}".encode("utf-8")).hexdigest()
+
+def invalidar_preferencias(email):
+    """Depois do pagamento o link de checkout antigo não deve ser reaproveitado"""
+    if email:
+        for upgrade in (False, True):
+            cache_preferencias.invalidar(chave_preferencia(email, upgrade, PRECO_PLANO_ANUAL))
+
+def criar_preferencia_checkout(email, nome, upgrade, chave):
+    """Cria a preferência no Mercado Pago, guarda no cache e retorna o init_point"""
+    g.preferencia_criada = True
+    agora = datetime.now(timezone.utc)
+    validade = agora + timedelta(seconds=PREFERENCIA_TTL + PREFERENCIA_VALIDADE_EXTRA)
+
+    # Configura a preferência de pagamento
+    payload = {
+        "items": [{
+            "title": "Plano Anual TreinoRun",
+            "description": "Planos ilimitados por 1 ano" + (" (Upgrade)" if upgrade else ""),
+            "quantity": 1,
+            "unit_price": PRECO_PLANO_ANUAL,
+            "currency_id": "BRL"
+        }],
+        "payer": {
+            "email": email,
+            "name": nome
+        },
+        "back_urls": {
+            "success": url_for("sucesso", _external=True),
+            "failure": url_for("erro", _external=True),
+            "pending": url_for("pendente", _external=True)
+        },
+        "auto_return": "approved",
+        "notification_url": url_for("mercadopago_webhook", _external=True),
+        "external_reference": email,
+        "statement_descriptor": "TREINORUN",
+        "expires": True,
+        "expiration_date_from": agora.isoformat(timespec="milliseconds"),
+        "expiration_date_to": validade.isoformat(timespec="milliseconds")
+    }
+
+    # Adiciona mensagem para upgrades
+    if upgrade:
+        payload["items"][0]["description"] += " - Upgrade de Plano Gratuito"
+
+    # Envia para o Mercado Pago
+    init_point = mercadopago.criar_preferencia(payload)["init_point"]
+    cache_preferencias.guardar(chave, init_point)
+    return init_point
+
 @app.route("/iniciar_pagamento", methods=["GET", "POST"])
-@limiter.limit("5 per hour")
+# Só consome o limite quem de fato chamou o Mercado Pago: quem recebe uma
+# preferência do cache ou de um clique simultâneo não conta
+@limiter.limit("5 per hour", deduct_when=lambda resposta: g.get("preferencia_criada", False))
 def iniciar_pagamento():
     try:
         # Obtém email da sessão ou dos parâmetros
@@ -833,12 +1617,9 @@ def iniciar_pagamento():
             return redirect(url_for("landing"))
 
         # Verifica se o usuário existe
-        usuario = db.execute(
-            text("SELECT id, nome FROM usuarios WHERE email = :email"),
-            {"email": email}
-        ).fetchone()
-        
-        nome = usuario.nome if usuario else "Cliente"
+        usuario = obter_direitos(email)
+
+        nome = usuario["nome"] if usuario and usuario["nome"] else "Cliente"
 
         # Registra a tentativa de pagamento
         try:
@@ -855,61 +1636,46 @@ def iniciar_pagamento():
             logging.error(f"Erro ao registrar tentativa: {str(e)}")
             db.rollback()
 
-        # Configura a preferência de pagamento
-        payload = {
-            "items": [{
-                "title": "Plano Anual TreinoRun",
-                "description": "Planos ilimitados por 1 ano" + (" (Upgrade)" if upgrade else ""),
-                "quantity": 1,
-                "unit_price": 59.90,
-                "currency_id": "BRL"
-            }],
-            "payer": {
-                "email": email,
-                "name": nome
-            },
-            "back_urls": {
-                "success": url_for("sucesso", _external=True),
-                "failure": url_for("erro", _external=True),
-                "pending": url_for("pendente", _external=True)
-            },
-            "auto_return": "approved",
-            "notification_url": url_for("mercadopago_webhook", _external=True),
-            "external_reference": email,
-            "statement_descriptor": "TREINORUN"
-        }
-
-        # Adiciona mensagem para upgrades
-        if upgrade:
-            payload["items"][0]["description"] += " - Upgrade de Plano Gratuito"
-
-        # Envia para o Mercado Pago
-        headers = {
-            "Authorization": f"Bearer {os.getenv('MERCADO_PAGO_ACCESS_TOKEN')}",
-            "Content-Type": "application/json"
-        }
-        
-        response = requests.post(
-            "https://api.mercadopago.com/checkout/preferences",
-            headers=headers,
-            json=payload,
-            timeout=10
+        # Reaproveita a preferência criada há pouco para o mesmo checkout
+        chave = chave_preferencia(email, upgrade, PRECO_PLANO_ANUAL)
+        init_point = cache_preferencias.obter(chave)
+        if init_point:
+            return redirect(init_point)
+
+        # Cliques simultâneos para o mesmo checkout criam uma única preferência
+        init_point = singleflight_preferencias.executar(
+            chave,
+            lambda: criar_preferencia_checkout(email, nome, upgrade, chave),
+            timeout=30
         )
-        response.raise_for_status()
-        
-        return redirect(response.json()["init_point"])
+        return redirect(init_point)
         
     except requests.exceptions.RequestException as e:
+        # Falhas passageiras já foram repetidas pelo cliente; aqui o gateway
+        # está realmente fora e o usuário pode tentar de novo em instantes
         logging.error(f"Erro MercadoPago: {str(e)}")
-        return render_template("erro.html", mensagem="Erro ao conectar com o gateway de pagamento"), 500
+        return render_template(
+            "erro.html",
+            mensagem="O gateway de pagamento está instável no momento. Tente novamente em alguns instantes."
+        ), 503
         
     except Exception as e:
         logging.error(f"Erro em iniciar_pagamento: {str(e)}", exc_info=True)
         return render_template("erro.html", mensagem="Erro ao processar pagamento"), 500
 
+# Notificações são repetidas com backoff exponencial (até alguns minutos entre
+# tentativas) antes de serem dadas como falhas na tabela jobs
+MAX_TENTATIVAS_WEBHOOK = int(os.getenv("MAX_TENTATIVAS_WEBHOOK", 8))
+
 @app.route("/webhook/mercadopago", methods=["POST"])
-@limiter.limit("100 per day")
+@limite_local("600 per minute")
 def mercadopago_webhook():
+    """Só grava a notificação na fila e responde; o processamento é feito pelos workers.
+
+    Assim o Mercado Pago recebe o 200 em milissegundos, sem esperar a consulta
+    à API, o banco e o envio de email, e falhas temporárias são repetidas com
+    backoff pela fila em vez de dependerem do reenvio do Mercado Pago.
+    """
     try:
         # 1. Registro inicial no log
         logging.info(f"Webhook recebido - IP: {request.remote_addr}")
@@ -940,6 +1706,16 @@ def mercadopago_webhook():
             )
             return jsonify({"erro": "JSON inválido"}), 400
 
+        if payload.get("type") == "payment" and not payload.get("data", {}).get("id"):
+            erro_msg = "ID do pagamento não encontrado no payload."
+            logging.error(erro_msg)
+            registrar_log(
+                payload=json.dumps(payload),
+                status_processamento='erro',
+                mensagem_erro=erro_msg
+            )
+            return jsonify({"erro": "ID do pagamento não encontrado"}), 400
+
         # 4. Registrar o payload recebido
         registrar_log(
             payload=json.dumps(payload),
@@ -947,36 +1723,9 @@ def mercadopago_webhook():
             mensagem_erro=None
         )
 
-        # 5. Identificar e processar conforme o tipo
-        tipo = payload.get("type")
-        action = payload.get("action", "")
-
-        if tipo == "subscription_preapproval":
-            return processar_assinatura(payload)
-
-        elif tipo == "payment":
-            payment_id = payload.get("data", {}).get("id")
-            if not payment_id:
-                erro_msg = "ID do pagamento não encontrado no payload."
-                logging.error(erro_msg)
-                registrar_log(
-                    payload=json.dumps(payload),
-                    status_processamento='erro',
-                    mensagem_erro=erro_msg
-                )
-                return jsonify({"erro": "ID do pagamento não encontrado"}), 400
-
-            return processar_pagamento(payload)  # AQUI corrigido: envia payload inteiro
-
-        else:
-            msg = f"Tipo de notificação não tratado: {tipo}"
-            logging.info(msg)
-            registrar_log(
-                payload=json.dumps(payload),
-                status_processamento='ignorado',
-                mensagem_erro=msg
-            )
-            return jsonify({"status": "ignorado"}), 200
+        # 5. A linha do job é a caixa de entrada durável; os workers processam
+        job_id = fila.enfileirar("webhook_mercadopago", payload, max_tentativas=MAX_TENTATIVAS_WEBHOOK)
+        return jsonify({"status": "recebido", "job_id": job_id}), 200
 
     except Exception as e:
         erro_msg = f"Erro fatal no webhook: {str(e)}"
@@ -989,33 +1738,36 @@ def mercadopago_webhook():
         return jsonify({"erro": "Erro interno no servidor"}), 500
 
 
+def executar_job_webhook(payload):
+    """Processa uma notificação do Mercado Pago tirada da fila.
+
+    Exceções sobem para a fila, que tenta de novo com backoff.
+    """
+    tipo = payload.get("type")
+    if tipo == "subscription_preapproval":
+        return {"status": processar_assinatura(payload)}
+
+    if tipo == "payment":
+        return {"status": processar_pagamento(payload)}
+
+    msg = f"Tipo de notificação não tratado: {tipo}"
+    logging.info(msg)
+    registrar_log(
+        payload=json.dumps(payload),
+        status_processamento='ignorado',
+        mensagem_erro=msg
+    )
+    return {"status": "ignorado"}
+
+
 def registrar_log(payload, status_processamento, mensagem_erro=None):
-    """Registra a tentativa no banco de dados"""
-    try:
-        db.execute(
-            text("""
-                INSERT INTO logs_webhook (
-                    data_recebimento,
-                    payload,
-                    status_processamento,
-                    mensagem_erro
-                ) VALUES (
-                    NOW(),
-                    :payload,
-                    :status_processamento,
-                    :mensagem_erro
-                )
-            """),
-            {
-                "payload": payload,
-                "status_processamento": status_processamento,
-                "mensagem_erro": mensagem_erro
-            }
-        )
-        db.commit()
-    except Exception as e:
-        logging.error(f"Falha ao registrar log no BD: {str(e)}")
-        db.rollback()
+    """Registra a tentativa no banco de dados (em lote, fora da thread da requisição)"""
+    gravador_logs_webhook.registrar(
+        data_recebimento=datetime.now(),
+        payload=payload,
+        status_processamento=status_processamento,
+        mensagem_erro=mensagem_erro
+    )
 
 
 def processar_assinatura(payload):
@@ -1067,14 +1819,16 @@ def processar_assinatura(payload):
                         """),
                         {"email": email}
                     )
-            enviar_email_confirmacao_pagamento(email)
+            invalidar_direitos(email)
+            invalidar_preferencias(email)
+            enviar_email_confirmacao_pagamento(email, chave=f"confirmacao:assinatura:{id_assinatura}")
 
         registrar_log(
             payload=json.dumps(payload),
             status_processamento='assinatura_processada',
             mensagem_erro=None
         )
-        return jsonify({"status": "assinatura_processada"}), 200
+        return 'assinatura_processada'
 
     except Exception as e:
         erro_msg = f"Erro ao processar assinatura: {str(e)}"
@@ -1084,20 +1838,12 @@ def processar_assinatura(payload):
             status_processamento='erro_processamento',
             mensagem_erro=erro_msg
         )
-        return jsonify({"erro": str(e)}), 400
+        # Relança para a fila tentar de novo com backoff
+        raise
 
 def obter_detalhes_assinatura(subscription_id):
     try:
-        resposta = requests.get(
-            f"https://api.mercadopago.com/preapproval/{subscription_id}",
-            headers={
-                "Authorization": f"Bearer {os.getenv('MERCADO_PAGO_ACCESS_TOKEN')}",
-                "Content-Type": "application/json"
-            },
-            timeout=15
-        )
-        resposta.raise_for_status()
-        return resposta.json()
+        return mercadopago.obter_assinatura(subscription_id)
     except Exception as e:
         logging.error(f"Erro ao consultar assinatura {subscription_id}: {str(e)}")
         return None
@@ -1117,7 +1863,7 @@ def processar_pagamento(payload):
                 status_processamento='pagamento_teste_sem_id',
                 mensagem_erro="ID de pagamento ausente"
             )
-            return jsonify({"status": "pagamento_teste_sem_id_recebido"}), 200
+            return 'pagamento_teste_sem_id'
 
         if is_test:
             # ⚡ TESTE: Simula pagamento sem consultar Mercado Pago
@@ -1181,7 +1927,9 @@ def processar_pagamento(payload):
                         """),
                         {"email": email}
                     )
-            enviar_email_confirmacao_pagamento(email)
+            invalidar_direitos(email)
+            invalidar_preferencias(email)
+            enviar_email_confirmacao_pagamento(email, chave=f"confirmacao:pagamento:{id_pagamento}")
 
         registrar_log(
             payload=json.dumps(payload),
@@ -1189,7 +1937,7 @@ def processar_pagamento(payload):
             mensagem_erro=None
         )
 
-        return jsonify({"status": "pagamento_processado"}), 200
+        return 'pagamento_processado'
 
     except Exception as e:
         erro_msg = f"Erro ao processar pagamento: {str(e)}"
@@ -1199,26 +1947,88 @@ def processar_pagamento(payload):
             status_processamento='erro_processamento',
             mensagem_erro=erro_msg
         )
-        return jsonify({"erro": str(e)}), 400
-
+        # Relança para a fila tentar de novo com backoff
+        raise
 
 
 def obter_detalhes_pagamento(id_pagamento):
     try:
-        resposta = requests.get(
-            f"https://api.mercadopago.com/v1/payments/{id_pagamento}",
-            headers={
-                "Authorization": f"Bearer {os.getenv('MERCADO_PAGO_ACCESS_TOKEN')}",
-                "Content-Type": "application/json"
-            },
-            timeout=15
-        )
-        resposta.raise_for_status()
-        return resposta.json()
+        return mercadopago.obter_pagamento(id_pagamento)
     except Exception as e:
         logging.error(f"Erro ao consultar pagamento {id_pagamento}: {str(e)}")
         return None
 # ================================================
+# MÉTRICAS
+# ================================================
+
+@app.route("/metrics")
+@limiter.exempt
+def metrics():
+    """Coleta do Prometheus; com METRICAS_TOKEN exige Authorization: Bearer <token>"""
+    token = os.getenv("METRICAS_TOKEN")
+    if token and not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return jsonify({"message": "Não autorizado"}), 401
+    monitor_pool.exportar_metricas()
+    corpo, content_type = metricas.gerar()
+    return Response(corpo, content_type=content_type)
+
+# ================================================
+# WORKERS DA FILA
+# ================================================
+
+HANDLERS_JOBS = {
+    "geracao_plano": executar_job_geracao,
+    "webhook_mercadopago": executar_job_webhook,
+}
+
+def executar_job(job):
+    with app.app_context():
+        return HANDLERS_JOBS[job.tipo](job.payload)
+
+def desistir_job(job):
+    """Chamado pela fila quando um job esgota as tentativas (por erro ou travado)"""
+    if job.tipo == "geracao_plano":
+        # A geração não vai sair: a cota volta para o usuário
+        liberar_geracao(job.payload)
+
+_workers_embutidos_pid = None
+_workers_embutidos_lock = threading.Lock()
+
+@app.before_request
+def iniciar_workers_embutidos():
+    """Com WORKERS_EMBUTIDOS > 0 o próprio processo web também consome a fila.
+
+    Útil em desenvolvimento ou em deploys sem o processo worker dedicado.
+    Iniciado na primeira requisição para rodar depois do fork do gunicorn,
+    junto com a conferência das threads do processo contra o pool do banco.
+    """
+    global _workers_embutidos_pid
+    if _workers_embutidos_pid == os.getpid():
+        return
+
+    with _workers_embutidos_lock:
+        if _workers_embutidos_pid == os.getpid():
+            return
+        _workers_embutidos_pid = os.getpid()
+
+        threads = int(os.getenv("WORKERS_EMBUTIDOS", 0))
+        # Threads das requisições + gravador de logs
+        threads_banco = int(os.getenv("WEB_THREADS", 32)) + 1
+        if threads > 0:
+            parar = fila.iniciar_workers(
+                executar_job, threads=threads, tipos=list(HANDLERS_JOBS), ao_desistir=desistir_job
+            )
+            caixa_saida.iniciar(parar)
+            # Sem worker.py é daqui que saem as partições futuras e a retenção
+            # (o advisory lock evita que dois processos rodem juntos)
+            iniciar_manutencao(engine, parar)
+            logging.info(f"{threads} worker(s) da fila iniciados no processo web")
+            # Workers + manutenção da fila + remetente de e-mails + manutenção das partições
+            threads_banco += threads + 3
+
+        validar_pool(engine, threads_banco, "web", DB_MAX_OVERFLOW)
+
+# ================================================
 # INICIALIZAÇÃO
 # ================================================
 
@@ -1229,5 +2039,7 @@ if __name__ == "__main__":
         app,
         host="0.0.0.0",
         port=int(os.getenv("PORT", 8000)),
-        threads=4
+        # As threads só aguardam o loop compartilhado durante a geração,
+        # então dá para manter bem mais do que as 4 padrão
+        threads=int(os.getenv("WEB_THREADS", 32))
     )
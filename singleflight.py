@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Single-flight: requisições idênticas simultâneas compartilham uma única execução.
+
+Dentro do processo, as threads seguidoras aguardam um Future do líder. Entre
+processos (workers do gunicorn, worker.py), o líder é quem obtém o lock no
+Redis (SET NX PX); ao terminar ele publica o resultado numa chave com TTL
+curto, que os seguidores dos outros processos consultam até aparecer. Se o
+líder morrer ou falhar sem publicar, o lock expira/é liberado e um seguidor
+assume a liderança.
+"""
+
+import json
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+
+import redis
+
+_SCRIPT_LIBERAR = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class Voo:
+    """Uma execução em andamento para uma chave; `lider` indica quem deve executar"""
+
+    def __init__(self, sf, chave, lider, futuro, dono_futuro, token=None):
+        self.sf = sf
+        self.chave = chave
+        self.lider = lider
+        self.futuro = futuro
+        self.dono_futuro = dono_futuro
+        self.token = token
+        self.finalizado = False
+
+    def aguardar(self, timeout=None):
+        """Retorna o resultado do líder.
+
+        Se o líder de outro processo sumir sem publicar, este voo vira líder e
+        o retorno é None: o chamador deve executar e chamar concluir/falhar.
+        """
+        if not self.dono_futuro:
+            return self.futuro.result(timeout)
+
+        limite = time.monotonic() + (timeout or self.sf.ttl_lock)
+        try:
+            while time.monotonic() < limite:
+                bruto = self.sf.redis.get(self.sf._chave_resultado(self.chave))
+                if bruto is not None:
+                    resultado = json.loads(bruto)
+                    self._resolver(resultado=resultado)
+                    return resultado
+
+                token = self.sf._adquirir_lock(self.chave)
+                if token:
+                    self.lider = True
+                    self.token = token
+                    return None
+
+                time.sleep(self.sf.intervalo)
+        except Exception as e:
+            if self.sf._erro_redis(e):
+                self.lider = True
+                return None
+            self._resolver(erro=e)
+            raise
+
+        erro = TimeoutError(f"Tempo esgotado aguardando {self.chave}")
+        self._resolver(erro=erro)
+        raise erro
+
+    def concluir(self, resultado):
+        if self.finalizado:
+            return
+        if self.sf.redis is not None:
+            try:
+                self.sf.redis.set(
+                    self.sf._chave_resultado(self.chave),
+                    json.dumps(resultado),
+                    ex=self.sf.ttl_resultado
+                )
+            except Exception as e:
+                logging.warning(f"Falha ao publicar resultado do single-flight {self.chave}: {e}")
+        self._liberar_lock()
+        self._resolver(resultado=resultado)
+
+    def falhar(self, erro):
+        if self.finalizado:
+            return
+        self._liberar_lock()
+        self._resolver(erro=erro)
+
+    def _liberar_lock(self):
+        if self.token and self.sf.redis is not None:
+            try:
+                self.sf._liberar(keys=[self.sf._chave_lock(self.chave)], args=[self.token])
+            except Exception as e:
+                logging.warning(f"Falha ao liberar lock do single-flight {self.chave}: {e}")
+            self.token = None
+
+    def _resolver(self, resultado=None, erro=None):
+        self.finalizado = True
+        if not self.dono_futuro:
+            return
+        with self.sf._lock:
+            if self.sf._locais.get(self.chave) is self.futuro:
+                del self.sf._locais[self.chave]
+        if erro is not None:
+            self.futuro.set_exception(erro)
+        else:
+            self.futuro.set_result(resultado)
+
+
+class SingleFlight:
+    def __init__(self, prefixo, redis_client=None, ttl_lock=90, ttl_resultado=60, intervalo=0.1):
+        self.prefixo = prefixo
+        self.redis = redis_client
+        self.ttl_lock = ttl_lock
+        self.ttl_resultado = ttl_resultado
+        self.intervalo = intervalo
+        self._locais = {}
+        self._lock = threading.Lock()
+        self._liberar = redis_client.register_script(_SCRIPT_LIBERAR) if redis_client is not None else None
+        self.lideres = 0
+        self.seguidores = 0
+
+    def _chave_lock(self, chave):
+        return f"{self.prefixo}:lock:{chave}"
+
+    def _chave_resultado(self, chave):
+        return f"{self.prefixo}:resultado:{chave}"
+
+    def _erro_redis(self, erro):
+        if isinstance(erro, redis.RedisError):
+            logging.warning(f"Redis indisponível no single-flight {self.prefixo}: {erro}")
+            return True
+        return False
+
+    def _adquirir_lock(self, chave):
+        token = uuid.uuid4().hex
+        if self.redis.set(self._chave_lock(chave), token, nx=True, px=int(self.ttl_lock * 1000)):
+            return token
+        return None
+
+    def iniciar(self, chave):
+        """Entra no voo da chave, como líder ou como seguidor"""
+        with self._lock:
+            futuro = self._locais.get(chave)
+            if futuro is not None:
+                self.seguidores += 1
+                return Voo(self, chave, lider=False, futuro=futuro, dono_futuro=False)
+            futuro = Future()
+            self._locais[chave] = futuro
+
+        if self.redis is None:
+            self.lideres += 1
+            return Voo(self, chave, lider=True, futuro=futuro, dono_futuro=True)
+
+        try:
+            token = self._adquirir_lock(chave)
+        except Exception as e:
+            if not self._erro_redis(e):
+                raise
+            token = "sem-redis"
+
+        if token:
+            self.lideres += 1
+        else:
+            self.seguidores += 1
+        return Voo(self, chave, lider=bool(token), futuro=futuro, dono_futuro=True,
+                   token=token if token != "sem-redis" else None)
+
+    def executar(self, chave, funcao, timeout=None):
+        """Executa `funcao` uma única vez por chave entre todas as requisições simultâneas"""
+        voo = self.iniciar(chave)
+        if not voo.lider:
+            resultado = voo.aguardar(timeout)
+            if not voo.lider:
+                return resultado
+
+        try:
+            resultado = funcao()
+        except BaseException as e:
+            voo.falhar(e)
+            raise
+        voo.concluir(resultado)
+        return resultado
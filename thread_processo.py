@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Thread de segundo plano iniciada sob demanda, uma por processo.
+
+Threads não sobrevivem ao fork do gunicorn: um objeto criado no import (no
+master, com --preload, ou antes de um fork qualquer) ficaria sem a sua
+thread nos workers. Aqui a thread é iniciada no primeiro uso e de novo na
+primeira chamada em cada PID novo.
+"""
+
+import os
+import threading
+
+
+class ThreadPorProcesso:
+    def __init__(self, alvo, nome, ao_iniciar=None):
+        """`ao_iniciar` roda antes de cada início, para limpar estado herdado do pai"""
+        self.alvo = alvo
+        self.nome = nome
+        self.ao_iniciar = ao_iniciar
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def garantir(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            if self.ao_iniciar is not None:
+                self.ao_iniciar()
+            threading.Thread(target=self.alvo, name=self.nome, daemon=True).start()
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Processo worker: consome a fila de jobs (tabela jobs) fora do processo web.
+
+Escala separadamente do web, por exemplo:
+    WORKER_THREADS=32 python worker.py
+
+Com METRICAS_PORTA as métricas do processo ficam em http://<host>:<porta>/.
+"""
+
+import os
+import logging
+
+from run import DB_MAX_OVERFLOW, engine, fila, executar_job, desistir_job, HANDLERS_JOBS, caixa_saida
+from particoes import iniciar_manutencao
+from pool_db import validar_pool
+import metricas
+
+if __name__ == "__main__":
+    threads = int(os.getenv("WORKER_THREADS", 16))
+    logging.info(f"Iniciando worker TreinoRun com {threads} thread(s)...")
+    # Workers + manutenção da fila + remetente de e-mails + manutenção das
+    # partições + gravador de logs
+    validar_pool(engine, threads + 4, "worker", DB_MAX_OVERFLOW)
+    if os.getenv("METRICAS_PORTA"):
+        metricas.iniciar_servidor(int(os.getenv("METRICAS_PORTA")))
+    # Os e-mails (tipo "email") não passam pelos workers genéricos: têm um
+    # remetente próprio que mantém a conexão SMTP aberta
+    parar = caixa_saida.iniciar()
+    # Partições futuras e retenção de logs_webhook/geracoes
+    iniciar_manutencao(engine, parar)
+    fila.executar_workers(
+        executar_job, threads=threads, tipos=list(HANDLERS_JOBS), parar=parar, ao_desistir=desistir_job
+    )